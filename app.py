@@ -2,50 +2,119 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), 'execution'))
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 import json
-from sanitize_phi import sanitize_text as clean_text_with_presidio
-from execution.medical_audit import audit_medical_record, consult_auditor
+import re
+from html import escape
+import time
+from sanitize_phi import (SANITIZE_WORKERS, WARM_UP_TEXT, get_sanitization_service, sanitize_session, sanitize_text,
+                          session_cache as sanitize_cache)
+from execution.medical_audit import (audit_medical_record, audit_cache, audit_output_stats, consult_auditor,
+                                     get_rules_db, llm_clients, stream_audit_medical_record)
+from execution.coding_rules import CodingRulesDB, normalize_date_of_service
+from execution.audit_jobs import QueueFull, get_job_manager, job_manager_stats, validate_callback_url
 
 app = Flask(__name__)
 
 # --- Helper to reconstruct HTML with highlights ---
+PLACEHOLDER_PATTERN = re.compile(r'<[^>]+>')
+
+def render_spans(text, spans):
+    """
+    HTML for `text` with each (start, end, css_class, title) span wrapped in
+    a <mark>; all text is escaped. Overlapping spans merge into one mark
+    (titles joined), adjacent spans stay separate. One pass over the text,
+    one join, so long notes with many hits stay linear.
+    """
+    parts = []
+    cursor = 0
+    current = None  # [start, end, css_class, titles] of the mark being built
+
+    def emit(start, end, css_class, titles):
+        parts.append(escape(text[cursor:start]))
+        title = f' title="{escape(", ".join(titles))}"' if titles else ''
+        parts.append(f'<mark class="{css_class}"{title}>{escape(text[start:end])}</mark>')
+        return end
+
+    for start, end, css_class, title in sorted(spans, key=lambda span: (span[0], -span[1])):
+        start, end = max(start, 0), min(end, len(text))
+        if end <= start:
+            continue
+        if current and start < current[1]:
+            current[1] = max(current[1], end)
+            if title and title not in current[3]:
+                current[3].append(title)
+            continue
+        if current:
+            cursor = emit(*current)
+        current = [start, end, css_class, [title] if title else []]
+    if current:
+        cursor = emit(*current)
+    parts.append(escape(text[cursor:]))
+    return "".join(parts)
+
 def highlight_phi(text, entities):
     """
     Reconstructs text with <mark> tags around identified entities.
     """
-    if not entities:
-        return text
-        
-    sorted_entities = sorted(entities, key=lambda x: x.start, reverse=True)
-    
-    working_text = text
-    for entity in sorted_entities:
-        start = entity.start
-        end = entity.end
-        label = entity.entity_type
-        
-        # Insert mark tag
-        original_span = working_text[start:end]
-        replacement = f'<mark class="phi-match" title="{label}">{original_span}</mark>'
-        working_text = working_text[:start] + replacement + working_text[end:]
-        
-    return working_text
+    return render_spans(text, [(e.start, e.end, "phi-match", e.entity_type) for e in entities or ()])
 
 def highlight_sanitized_replacements(text):
     """
     Wraps <TAGS> in mark elements for Better UI visibility in the sanitized view.
     """
-    import re
-    # Regex to find <PERSON>, <DATE>, etc.
-    # We want to wrap them in <mark class="phi-replacement">
-    return re.sub(r'(<[^>]+>)', r'<mark class="phi-replacement">\1</mark>', text)
+    return render_spans(text, [(m.start(), m.end(), "phi-replacement", None)
+                               for m in PLACEHOLDER_PATTERN.finditer(text)])
 
 from execution.demo_data import SCENARIOS
 
 # Demo Mode Configuration
 DEMO_MODE = os.getenv("DEMO_MODE", "False").lower() == "true"
 
+# Load the analyzer, rules and LLM client at startup (Lambda init phase)
+# instead of on the first request
+PREWARM = os.getenv("PREWARM", "False").lower() == "true"
+
+def prewarm(before_fork=False):
+    """
+    Run each startup step once and return its time in seconds (None if it
+    failed). `before_fork` (gunicorn preload) skips the sanitization worker
+    pool, which each forked web worker starts for itself.
+    """
+    def warm_sanitizer():
+        service = get_sanitization_service()
+        if service:
+            service.warm_up()
+        else:
+            sanitize_text(WARM_UP_TEXT)
+
+    steps = [("sanitizer", warm_sanitizer), ("rules", get_rules_db), ("llm_client", llm_clients.warm)]
+    if before_fork and SANITIZE_WORKERS > 0:
+        steps = steps[1:]
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+            timings[name] = round(time.perf_counter() - started, 3)
+        except Exception as e:
+            app.logger.warning(f"Prewarm step '{name}' failed: {e}")
+            timings[name] = None
+    app.logger.info(f"Prewarm finished: {timings}")
+    return timings
+
+def reset_after_fork():
+    """Drop sockets and SQLite connections inherited from a preloading parent (gunicorn post_fork)."""
+    llm_clients.reset()
+    rules_db = get_rules_db()
+    if isinstance(rules_db, CodingRulesDB):  # pooled connections must not cross a fork; a read-only mmap may
+        rules_db.close()
+    audit_cache.reopen()
+    sanitize_cache.reopen()
+
+if PREWARM:
+    prewarm()
+
 @app.route('/')
 def home():
     return render_template('index.html', demo_mode=DEMO_MODE)
@@ -73,7 +142,8 @@ def sanitize_endpoint():
                 "found_count": 0
             })
 
-    sanitized_text, entities = clean_text_with_presidio(text)
+    # Stored in the session cache so /audit can skip a second Presidio pass
+    token, sanitized_text, entities = sanitize_session(text)
     
     # Highlight the replacements in the "Sanitized View"
     sanitized_html = highlight_sanitized_replacements(sanitized_text)
@@ -82,16 +152,21 @@ def sanitize_endpoint():
         "original_html": highlight_phi(text, entities),
         "sanitized_text": sanitized_text, # Keep raw for editing/pipeline
         "sanitized_html": sanitized_html, # New field for UI display
+        "sanitization_token": token, # Pass back to /audit to reuse this result
         "is_clean": len(entities) == 0,
         "found_count": len(entities)
     })
 
-@app.route('/audit', methods=['POST'])
-def audit_endpoint():
-    data = request.json
+def parse_audit_request(data):
+    """
+    Validate an /audit or /audit/stream body.
+    Returns (kwargs for audit_medical_record, None) or (None, error message).
+    """
     raw_text = data.get('text', '')
     cpt_codes = data.get('cpt_codes', [])
     dx_codes = data.get('dx_codes', [])
+    sanitization_token = data.get('sanitization_token')
+    date_of_service = data.get('date_of_service')  # "YYYY-MM-DD"; defaults to today
     
     # Extract codes if they came as objects
     cpt_list = []
@@ -108,15 +183,105 @@ def audit_endpoint():
             units_map[item] = 1
 
     if not raw_text or not cpt_list:
-        return jsonify({"error": "Missing text or CPT codes"}), 400
+        return None, "Missing text or CPT codes"
+
+    try:
+        date_of_service = normalize_date_of_service(date_of_service)
+    except ValueError as e:
+        return None, str(e)
+
+    return {
+        "raw_text": raw_text,
+        "cpt_list": cpt_list,
+        "diagnosis_codes": dx_codes,
+        "units_map": units_map,
+        "sanitization_token": sanitization_token,
+        "date_of_service": date_of_service,
+    }, None
+
+@app.route('/audit', methods=['POST'])
+def audit_endpoint():
+    audit_args, error = parse_audit_request(request.json)
+    if error:
+        return jsonify({"error": error}), 400
         
     try:
-        result = audit_medical_record(raw_text, cpt_list, dx_codes, units_map=units_map)
+        result = audit_medical_record(**audit_args)
         return jsonify(result)
     except Exception as e:
         app.logger.error(f"Audit failed: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/audit/jobs', methods=['POST'])
+def audit_job_submit_endpoint():
+    """
+    Queue an audit (same body as /audit, plus an optional `callback_url`).
+    Returns 202 with the job ID; poll GET /audit/jobs/<id> or wait for the
+    callback. 429 when the job queue is full.
+    """
+    data = request.json
+    audit_args, error = parse_audit_request(data)
+    if error:
+        return jsonify({"error": error}), 400
+    callback_url = data.get('callback_url')
+    if callback_url:
+        error = validate_callback_url(callback_url)
+        if error:
+            return jsonify({"error": error}), 400
+
+    try:
+        job = get_job_manager(audit_medical_record).submit(audit_args, callback_url)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "5"}
+    status_url = f"/audit/jobs/{job['job_id']}"
+    body = {"job_id": job["job_id"], "status": job["status"], "status_url": status_url}
+    return jsonify(body), 202, {"Location": status_url}
+
+@app.route('/audit/jobs/<job_id>', methods=['GET'])
+def audit_job_status_endpoint(job_id):
+    job = get_job_manager(audit_medical_record).get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(job)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/audit/stream', methods=['POST'])
+def audit_stream_endpoint():
+    """
+    Server-Sent Events version of /audit: `result` events carry each merged
+    audit_results entry as soon as the model finishes it, then `complete`
+    carries the full /audit response (or `error`).
+    """
+    audit_args, error = parse_audit_request(request.json)
+    if error:
+        return jsonify({"error": error}), 400
+
+    def generate():
+        try:
+            for event, data in stream_audit_medical_record(**audit_args):
+                yield sse_event(event, data)
+        except Exception as e:
+            app.logger.error(f"Streaming audit failed: {e}")
+            yield sse_event("error", {"error": str(e)})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    service = get_sanitization_service()
+    return jsonify({
+        "sanitization_cache": sanitize_cache.stats(),
+        "sanitization_service": service.stats() if service else None,
+        "audit_cache": audit_cache.stats(),
+        "rules_db_pool": get_rules_db().stats(),
+        "llm_clients": llm_clients.stats(),
+        "audit_output": audit_output_stats.stats(),
+        "audit_jobs": job_manager_stats()
+    })
+
 @app.route('/chat', methods=['POST'])
 def chat_endpoint():
     data = request.json
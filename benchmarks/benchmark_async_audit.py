@@ -0,0 +1,128 @@
+"""
+Benchmark: N concurrent audits on a thread pool (audit_medical_record) vs
+one event loop (audit_medical_record_async), against the local fake LLM
+server. Reports wall time, audits/s, and how many threads each approach
+needed. The server runs in a child process so its per-connection threads
+do not compete with the client for the GIL.
+
+Usage:
+    python benchmarks/benchmark_async_audit.py --audits 300 --threads 32 --latency-ms 500
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, 'execution'))
+
+from benchmarks.fake_llm_server import FakeLLMServer
+
+NOTE = "Simple repair of a 2.5 cm laceration of the scalp."
+RESPONSE = json.dumps({"audit_results": [{
+    "code": "12001", "documentation_status": "PASS", "clinical_evidence": "2.5 cm laceration",
+    "calculated_units": "1", "billing_risk_alert": "NONE", "risk_rationale": ""}]})
+
+
+def client_threads():
+    """Live threads, minus the fake server's per-connection handlers."""
+    return sum(1 for t in threading.enumerate() if "process_request_thread" not in t.name)
+
+
+class PeakThreads:
+    """Samples client_threads() in the background."""
+
+    def __init__(self):
+        self.peak = client_threads()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(0.01):
+            self.peak = max(self.peak, client_threads())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def serve(port_queue, latency_ms):
+    server = FakeLLMServer(latency_ms=latency_ms, response=RESPONSE)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def report(label, audits, elapsed, cpu, threads):
+    print(f"  {label:<34} {elapsed:7.2f} s  {audits / elapsed:8.1f} audits/s  "
+          f"{cpu / audits * 1000:6.2f} ms client CPU/audit  peak threads {threads}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark threaded vs asyncio audits.")
+    parser.add_argument('--audits', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=32, help="Thread pool size for the blocking path")
+    parser.add_argument('--in-flight', type=int, default=256, help="LLM_MAX_IN_FLIGHT for the async path")
+    parser.add_argument('--latency-ms', type=float, default=500, help="Simulated model time per call")
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(port_queue, args.latency_ms), daemon=True)
+    server.start()
+    url = f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+    try:
+        os.environ.update({"ANTHROPIC_API_KEY": "fake", "ANTHROPIC_BASE_URL": url,
+                           "LLM_PROVIDER": "anthropic", "LLM_POOL_SIZE": str(max(args.threads, args.in_flight))})
+        from execution import async_audit, medical_audit
+        from execution.rules_engine import CompactRulesIndex
+        logging.getLogger().setLevel(logging.WARNING)
+        rules = CompactRulesIndex.from_rows([("12001", "11042", "0")])
+        medical_audit.get_rules_db = lambda: rules
+        medical_audit.LLM_PROVIDER = "anthropic"
+        medical_audit.ANTHROPIC_API_KEY = "fake"
+        kwargs = dict(pre_sanitized=True, use_cache=False, date_of_service="2024-06-01")
+        notes = [f"{NOTE} Visit {i}." for i in range(args.audits)]
+
+        print(f"{args.audits} audits, {args.latency_ms:g} ms simulated model time")
+
+        with PeakThreads() as peak:
+            started, cpu_started = time.perf_counter(), time.process_time()
+            with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                results = list(pool.map(
+                    lambda note: medical_audit.audit_medical_record(note, ["12001"], ["S01.01XA"], **kwargs), notes))
+            elapsed, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+        assert all("audit_results" in r for r in results)
+        report(f"thread pool ({args.threads} threads)", args.audits, elapsed, cpu, peak.peak)
+
+        async def run_async():
+            runtime = async_audit._runtimes[asyncio.get_running_loop()] = async_audit.AsyncAuditRuntime(
+                max_in_flight=args.in_flight)
+            try:
+                return await asyncio.gather(*(
+                    async_audit.audit_medical_record_async(note, ["12001"], ["S01.01XA"], **kwargs)
+                    for note in notes))
+            finally:
+                await runtime.aclose()
+
+        with PeakThreads() as peak:
+            started, cpu_started = time.perf_counter(), time.process_time()
+            results = asyncio.run(run_async())
+            elapsed, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+        assert all("audit_results" in r for r in results)
+        report(f"asyncio ({args.in_flight} in flight)", args.audits, elapsed, cpu, peak.peak)
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark: time to first result for the blocking audit vs the streaming
+audit (/audit/stream path), against the local fake LLM server generating a
+realistic multi-code response chunk by chunk.
+
+Usage:
+    python benchmarks/benchmark_audit_stream.py --codes 8 --latency-ms 800 --chunk-ms 40
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, 'execution'))
+
+from benchmarks.fake_llm_server import FakeLLMServer
+
+NOTE = "Simple repair of a 2.5 cm laceration of the scalp; layered closure of a 4.0 cm forearm wound."
+
+
+def fake_response(codes):
+    return json.dumps({
+        "audit_results": [{
+            "code": code,
+            "documentation_status": "PASS",
+            "clinical_evidence": "Repair of 2.5 cm laceration documented with layered closure and wound measurements.",
+            "calculated_units": "1",
+            "billing_risk_alert": "NONE",
+            "risk_rationale": "Documentation supports the code as billed; measurements and technique are recorded.",
+        } for code in codes],
+        "diagnosis_analysis": "- Diagnosis codes are specific and support the procedures.",
+        "documentation_improvement": "- Record the repair length for every wound separately.",
+    }, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark blocking vs streaming audit latency.")
+    parser.add_argument('--codes', type=int, default=8, help="CPT codes per claim")
+    parser.add_argument('--latency-ms', type=float, default=800, help="Simulated time to first token")
+    parser.add_argument('--chunk-ms', type=float, default=40, help="Simulated generation time per ~4 tokens")
+    args = parser.parse_args()
+
+    codes = [f"{12001 + i}" for i in range(args.codes)]
+    with FakeLLMServer(latency_ms=args.latency_ms, chunk_ms=args.chunk_ms,
+                       response=lambda request: fake_response(codes)) as server:
+        os.environ.update({"ANTHROPIC_API_KEY": "fake", "ANTHROPIC_BASE_URL": server.url,
+                           "LLM_PROVIDER": "anthropic"})
+        from execution import medical_audit
+        logging.getLogger().setLevel(logging.WARNING)
+        medical_audit.LLM_PROVIDER = "anthropic"
+        kwargs = dict(pre_sanitized=True, use_cache=False, date_of_service="2024-06-01")
+
+        started = time.perf_counter()
+        blocking = medical_audit.audit_medical_record(NOTE, codes, ["S01.01XA"], **kwargs)
+        blocking_total = time.perf_counter() - started
+
+        started = time.perf_counter()
+        first_result = None
+        streamed = None
+        for event, data in medical_audit.stream_audit_medical_record(NOTE, codes, ["S01.01XA"], **kwargs):
+            if event == "result" and first_result is None:
+                first_result = time.perf_counter() - started
+            elif event == "complete":
+                streamed = data
+        streaming_total = time.perf_counter() - started
+
+    assert streamed == blocking, "streaming result must match the blocking result"
+    print(f"{args.codes} codes, {args.latency_ms:g} ms to first token, {args.chunk_ms:g} ms per chunk")
+    print(f"  blocking   first result {blocking_total * 1000:8.0f} ms   complete {blocking_total * 1000:8.0f} ms")
+    print(f"  streaming  first result {first_result * 1000:8.0f} ms   complete {streaming_total * 1000:8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark: PHI highlighting on notes from 1 KB to 1 MB.
+
+Compares app.highlight_phi (single-pass span renderer) with the previous
+implementation, which re-sliced the whole note once per entity. The old
+version is quadratic, so it is only run up to --legacy-max-kb.
+
+Usage:
+    python benchmarks/benchmark_highlight.py
+    python benchmarks/benchmark_highlight.py --sizes-kb 1 64 1024 --entity-every 40
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from app import highlight_phi, highlight_sanitized_replacements
+
+WORDS = ("wound", "irrigated", "closed", "with", "4-0", "nylon", "<", "&", "patient", "tolerated", "well")
+LABELS = ("PERSON", "DATE_TIME", "LOCATION", "PHONE_NUMBER")
+
+
+def legacy_highlight_phi(text, entities):
+    """highlight_phi before the span renderer (no escaping, one full copy per entity)."""
+    if not entities:
+        return text
+    working_text = text
+    for entity in sorted(entities, key=lambda x: x.start, reverse=True):
+        original_span = working_text[entity.start:entity.end]
+        replacement = f'<mark class="phi-match" title="{entity.entity_type}">{original_span}</mark>'
+        working_text = working_text[:entity.start] + replacement + working_text[entity.end:]
+    return working_text
+
+
+def make_note(size, entity_every, rng):
+    """(text, entities, sanitized text) of about `size` characters with one entity per `entity_every`."""
+    words, entities, length = [], [], 0
+    next_entity = rng.randint(1, entity_every)
+    while length < size:
+        if length >= next_entity:
+            word = rng.choice(("John Smith", "01/02/2023", "Boston", "555-123-4567"))
+            entities.append(SimpleNamespace(start=length, end=length + len(word), entity_type=rng.choice(LABELS)))
+            next_entity = length + rng.randint(1, 2 * entity_every)
+        else:
+            word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    text = " ".join(words)
+    sanitized = " ".join("<PERSON>" if i % 8 == 0 else word for i, word in enumerate(words))  # a placeholder every 8 words
+    return text, entities, sanitized
+
+
+def timed(fn, *args, min_seconds=0.2):
+    """Best seconds per call over repeated runs lasting at least min_seconds."""
+    best, total, calls = float("inf"), 0.0, 0
+    while total < min_seconds or calls < 3:
+        started = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - started
+        best, total, calls = min(best, elapsed), total + elapsed, calls + 1
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PHI highlighting.")
+    parser.add_argument('--sizes-kb', type=int, nargs='+', default=[1, 16, 128, 1024])
+    parser.add_argument('--entity-every', type=int, default=60, help="Average characters per PHI entity")
+    parser.add_argument('--legacy-max-kb', type=int, default=256, help="Largest note for the quadratic version")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    print(f"{'note':>8} {'entities':>9} {'highlight_phi':>14} {'legacy':>12} {'speedup':>8} {'sanitized view':>15}")
+    for size_kb in args.sizes_kb:
+        text, entities, sanitized = make_note(size_kb * 1024, args.entity_every, rng)
+        new = timed(highlight_phi, text, entities)
+        replacements = timed(highlight_sanitized_replacements, sanitized)
+        if size_kb <= args.legacy_max_kb:
+            old = timed(legacy_highlight_phi, text, entities)
+            legacy, speedup = f"{old * 1000:9.2f} ms", f"{old / new:7.1f}x"
+        else:
+            legacy, speedup = f"{'skipped':>12}", f"{'':>8}"
+        print(f"{size_kb:>6} KB {len(entities):>9} {new * 1000:11.2f} ms {legacy} {speedup} "
+              f"{replacements * 1000:12.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
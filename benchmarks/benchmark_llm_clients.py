@@ -0,0 +1,91 @@
+"""
+Benchmark: per-call LLM clients (the old behaviour) vs the shared
+LLMClientManager pools, against the local fake LLM server.
+
+For each provider it reports mean per-call latency and how many TCP
+connections the server accepted, plus the manager's connect / TTFB split.
+
+Usage:
+    python benchmarks/benchmark_llm_clients.py --calls 200 --threads 8 --latency-ms 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, 'execution'))
+
+from benchmarks.fake_llm_server import FakeLLMServer
+
+PROMPT = "Audit CPT 12001 against: Simple repair of 2.0 cm laceration of the scalp."
+SYSTEM = "You are a medical coding auditor."
+
+
+def per_call_anthropic():
+    import anthropic
+    client = anthropic.Anthropic(api_key=os.environ["ANTHROPIC_API_KEY"])
+    response = client.messages.create(model="fake", max_tokens=64, temperature=0, system=SYSTEM,
+                                      messages=[{"role": "user", "content": PROMPT}])
+    return response.content[0].text
+
+
+def per_call_bedrock():
+    import boto3
+    client = boto3.client(service_name="bedrock-runtime", region_name="us-east-1",
+                          endpoint_url=os.environ["BEDROCK_ENDPOINT_URL"])
+    body = json.dumps({"anthropic_version": "bedrock-2023-05-31", "max_tokens": 64, "system": SYSTEM,
+                       "messages": [{"role": "user", "content": PROMPT}]})
+    response = client.invoke_model(body=body, modelId="fake", accept="application/json",
+                                   contentType="application/json")
+    return json.loads(response["body"].read())["content"][0]["text"]
+
+
+def run(server, label, fn, calls, threads):
+    before = server.stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for result in pool.map(lambda _: fn(), range(calls)):
+            assert result
+    elapsed = time.perf_counter() - started
+    after = server.stats()
+    connections = after["connections"] - before["connections"]
+    print(f"  {label:<28} {elapsed / calls * 1000 * threads:8.2f} ms/call  "
+          f"{calls / elapsed:8.1f} calls/s  {connections:5d} TCP connections")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-call vs pooled LLM clients.")
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=20, help="Simulated time to first token")
+    args = parser.parse_args()
+
+    with FakeLLMServer(latency_ms=args.latency_ms) as server:
+        os.environ.update({
+            "ANTHROPIC_API_KEY": "fake", "ANTHROPIC_BASE_URL": server.url,
+            "BEDROCK_ENDPOINT_URL": server.url,
+            "AWS_ACCESS_KEY_ID": "fake", "AWS_SECRET_ACCESS_KEY": "fake", "AWS_REGION": "us-east-1",
+        })
+        from execution import medical_audit
+        manager = medical_audit.llm_clients
+
+        print(f"{args.calls} calls, {args.threads} threads, {args.latency_ms:g} ms simulated model time")
+        for provider, per_call in (("anthropic", per_call_anthropic), ("bedrock", per_call_bedrock)):
+            medical_audit.LLM_PROVIDER = provider
+            print(f"\n{provider}:")
+            run(server, "new client per call", per_call, args.calls, args.threads)
+            manager.reset()
+            run(server, "shared LLMClientManager", lambda: medical_audit.query_anthropic(PROMPT, SYSTEM),
+                args.calls, args.threads)
+
+        print("\nLLMClientManager latency split (both providers):")
+        for name, summary in manager.stats()["latency"].items():
+            print(f"  {name:<8} {summary}")
+
+
+if __name__ == "__main__":
+    main()
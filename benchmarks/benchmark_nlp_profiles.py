@@ -0,0 +1,79 @@
+"""
+Benchmark: spaCy pipeline profiles for the PHI analyzer (SANITIZE_NLP_PROFILE).
+
+Each profile runs in a fresh process so load time and peak RSS are its own.
+Reports analyzer load time, peak RSS, docs/s and redaction recall over the
+labeled corpus in tests/data/phi_corpus.jsonl. Profiles whose spaCy model is
+not installed are skipped.
+
+Usage:
+    python benchmarks/benchmark_nlp_profiles.py --repeat 10
+    python benchmarks/benchmark_nlp_profiles.py --profiles full lg-ner --mode tiered
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, 'execution'))
+
+
+def measure(repeat, corpus_path):
+    """Runs in the child: load the analyzer for the profile in the environment, then sanitize."""
+    started = time.perf_counter()
+    import sanitize_phi
+    from benchmarks.benchmark_sanitizer_tiers import load_corpus, run
+    sanitize_phi.get_analyzer().analyze(text=sanitize_phi.WARM_UP_TEXT, language='en')
+    load_seconds = time.perf_counter() - started
+
+    corpus = load_corpus(corpus_path)
+    elapsed, recall, leaked = run(sanitize_phi.SANITIZE_MODE, corpus, repeat, sanitize_phi.SANITIZE_BATCH_SIZE)
+    return {"load_seconds": load_seconds,
+            "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "docs_per_second": len(corpus) * repeat / elapsed,
+            "recall": recall, "leaked": leaked}
+
+
+def main():
+    import sanitize_phi
+    from benchmarks.benchmark_sanitizer_tiers import CORPUS_PATH
+    import spacy
+
+    parser = argparse.ArgumentParser(description="Benchmark spaCy pipeline profiles for PHI sanitization.")
+    parser.add_argument('--profiles', nargs='+', default=list(sanitize_phi.NLP_PROFILES))
+    parser.add_argument('--mode', choices=("full", "tiered"), default="full", help="SANITIZE_MODE for every profile")
+    parser.add_argument('--repeat', type=int, default=10, help="Passes over the corpus per profile")
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.repeat, args.corpus)))
+        return
+
+    print(f"SANITIZE_MODE={args.mode}, {args.repeat} passes over {args.corpus}")
+    for profile in args.profiles:
+        model, exclude = sanitize_phi.NLP_PROFILES[profile]
+        if not spacy.util.is_package(model):
+            print(f"  {profile:<7} skipped: {model} is not installed")
+            continue
+        env = dict(os.environ, SANITIZE_NLP_PROFILE=profile, SANITIZE_MODE=args.mode)
+        env.pop("SPACY_MODEL", None)
+        env.pop("SPACY_EXCLUDE", None)
+        child = subprocess.run([sys.executable, __file__, '--child', '--repeat', str(args.repeat),
+                                '--corpus', args.corpus], env=env, capture_output=True, text=True, check=True)
+        r = json.loads(child.stdout.strip().splitlines()[-1])
+        print(f"  {profile:<7} load {r['load_seconds']:6.2f} s  RSS {r['rss_mb']:7.1f} MB  "
+              f"{r['docs_per_second']:7.1f} docs/s  recall {r['recall']:.3f}  "
+              f"({model}, excluding {', '.join(exclude) or 'nothing'})")
+        for doc_id, phi in r["leaked"]:
+            print(f"          leaked in {doc_id}: {phi!r}")
+
+
+if __name__ == "__main__":
+    main()
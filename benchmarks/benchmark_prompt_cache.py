@@ -0,0 +1,168 @@
+"""
+Benchmark: audit prompt size and LLM latency for three prompt layouts,
+against the local fake LLM server with prompt caching emulated.
+
+    legacy    the previous single indented template (instructions + claim in
+              the user message), as a plain system string
+    compact   static instructions as the system prompt, compact claim
+              message with its codes' definitions, PROMPT_CACHE=false
+    cached    compact, with the static prefix marked for prompt caching
+
+Each layout sends --audits audits of distinct notes, one after another.
+Reports the tokens the fake server counted per audit (uncached input, cache
+reads, output), input billed at the API's cache prices (writes 1.25x, reads
+0.1x), and mean time per call. The server's time to first token grows with
+uncached input (--prefill-ms-per-1k), the part prompt caching removes.
+
+Usage:
+    python benchmarks/benchmark_prompt_cache.py --audits 50 --latency-ms 300 --prefill-ms-per-1k 100
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, 'execution'))
+
+from benchmarks.benchmark_async_audit import RESPONSE
+from benchmarks.fake_llm_server import FakeLLMServer
+
+CODES = ["12001", "13121", "13122"]
+NOTE = ("Patient presents with a {size} cm laceration of the scalp and a 7.5 cm laceration of the forearm after "
+        "a fall. Wounds irrigated with saline and explored; no foreign body. Scalp closed in a single layer with "
+        "4-0 nylon. Forearm wound required layered closure with 4-0 Vicryl deep and 5-0 nylon skin. Patient "
+        "tolerated the procedure well. Wound care instructions given; suture removal in 7-10 days.")
+
+# The prompt before the static/dynamic split (medical_audit.py before prompt caching)
+LEGACY_TEMPLATE = """
+    ROLE: You are an expert Medical Coding Auditor.
+    Your task is to perform a two-step audit on the provided CPT codes based on the clinical text.
+
+    INPUT DATA:
+    - CPT Codes: {cpt_codes}
+    - Billed Units: {units_json}
+    - Diagnosis Codes: {diagnosis_codes}
+    - CPT Definitions: {cpt_context}
+    - SYSTEM ALERTS (These are FACTUAL database checks. Do not dispute them. explain them):
+      {system_alerts}
+    - Clinical Documentation:
+    \"\"\"
+    {sanitized_text}
+    \"\"\"
+
+    INSTRUCTIONS:
+
+    STEP 1: DOCUMENTATION VERIFICATION
+    - Verify if the text supports the code description.
+    - INDEPENDENTLY calculate the 'correct' supported units based on measurements.
+    - MATH: If definition says "each additional X cm or part thereof", round up (2.1 = 3).
+
+    STEP 2: REIMBURSEMENT RISK ANALYSIS
+    - Apply the SYSTEM ALERTS provided above. Use the exact rationale provided in SYSTEM ALERTS.
+    - Check for "Cloned Node" or "Copy-Billed" text.
+    - Validate medical necessity.
+
+    STEP 2: DIAGNOSIS VALIDATION
+    - Check if the diagnosis codes listed support the CPT codes.
+    - Flag any VAGUE or UNSPECIFIED codes (e.g., Unspecified side, Unspecified injury, Z-codes for encounters) as HIGH RISK.
+
+    CRITICAL OUTPUT RULES:
+    1. You MUST return a result object for EVERY SINGLE CPT CODE listed in "INPUT DATA".
+    2. Do NOT skip codes. If 5 codes are input, 5 results must be returned.
+    3. Even if a code is clearly supported or clearly wrong, it MUST be in the "audit_results" array.
+    4. If the CPT code is invalid or unknown, mark it as FAIL and explain why.
+
+    OUTPUT FORMAT (JSON ONLY):
+    Respond strictly in this JSON structure:
+
+    {{
+        "audit_results": [
+            {{
+                "code": "CPT Code",
+                "documentation_status": "PASS" or "FAIL" or "PARTIAL",
+                "clinical_evidence": "One sentence quote from text or 'No evidence found'",
+                "calculated_units": "Integer (Your independent count derived from text)",
+                "billing_risk_alert": "NONE" or "HIGH - MUE EXCEEDED" or "HIGH - NCCI BUNDLING",
+                "risk_rationale": "Clear explanation. If Risk exists, use the human-readable explanation from SYSTEM ALERTS."
+            }}
+            ... (Repeat for ALL input codes)
+        ],
+        "diagnosis_analysis": "Summary paragraph validating diagnosis specificity. Use Markdown bullet points for readability.",
+        "documentation_improvement": "Advice for the provider. Use Markdown bullet points for readability."
+    }}
+    """
+
+
+def legacy_prompt(note):
+    from execution.cpt_data import CPT_DEFINITIONS
+    cpt_context = "".join(f"- CPT {code}: {CPT_DEFINITIONS[code]}\n" for code in CODES)
+    return LEGACY_TEMPLATE.format(cpt_codes=CODES, units_json="{}", diagnosis_codes=["S01.01XA", "S51.811A"],
+                                  cpt_context=cpt_context, system_alerts="None.", sanitized_text=note)
+
+
+def prompts(layout, count):
+    """[(prompt, system_prompt)] for `count` distinct notes."""
+    from execution import medical_audit
+    notes = [NOTE.format(size=f"{2 + i / 10:.1f}") for i in range(count)]
+    if layout == "legacy":
+        return [(legacy_prompt(note), medical_audit.AUDIT_SYSTEM_PROMPT) for note in notes]
+    medical_audit.PROMPT_CACHE = layout == "cached"
+    built = []
+    for note in notes:
+        audit = medical_audit.prepare_audit(note, CODES, ["S01.01XA", "S51.811A"], None, None, True,
+                                            "2024-06-01", False)
+        built.append((audit.prompt, audit.system_prompt))
+    return built
+
+
+def run(layout, count):
+    """(usage totals, mean seconds per call) for `count` audits with `layout`."""
+    from execution import medical_audit
+    calls = prompts(layout, count)
+    medical_audit.llm_clients = medical_audit.LLMClientManager()
+    started = time.perf_counter()
+    with medical_audit.llm_clients.track_usage() as usage:
+        for prompt, system_prompt in calls:
+            medical_audit.query_anthropic(prompt, system_prompt)
+    elapsed = time.perf_counter() - started
+    medical_audit.llm_clients.reset()
+    return usage, elapsed / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark audit prompt layouts with prompt caching.")
+    parser.add_argument('--audits', type=int, default=30)
+    parser.add_argument('--latency-ms', type=float, default=300, help="Simulated fixed time to first token")
+    parser.add_argument('--prefill-ms-per-1k', type=float, default=100,
+                        help="Simulated extra time to first token per 1000 uncached input tokens")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    from execution import medical_audit
+    from execution.rules_engine import CompactRulesIndex
+    rules = CompactRulesIndex.from_rows([])
+    medical_audit.get_rules_db = lambda: rules
+    medical_audit.LLM_PROVIDER = "anthropic"
+    medical_audit.ANTHROPIC_API_KEY = "fake"
+
+    with FakeLLMServer(latency_ms=args.latency_ms, response=RESPONSE,
+                       prefill_ms_per_1k=args.prefill_ms_per_1k) as server:
+        os.environ["ANTHROPIC_BASE_URL"] = server.url
+        print(f"{args.audits} audits of {len(CODES)} codes per layout, {args.latency_ms:g} ms + "
+              f"{args.prefill_ms_per_1k:g} ms per 1k uncached input tokens to first token")
+        print(f"{'layout':<8} {'uncached in':>12} {'cache read':>11} {'output':>7} {'billed in':>10} {'per call':>10}")
+        for layout in ("legacy", "compact", "cached"):
+            usage, seconds = run(layout, args.audits)
+            per_audit = {field: value / args.audits for field, value in usage.items()}
+            billed = (per_audit["input_tokens"] + 1.25 * per_audit["cache_creation_input_tokens"]
+                      + 0.1 * per_audit["cache_read_input_tokens"])
+            uncached = per_audit["input_tokens"] + per_audit["cache_creation_input_tokens"]
+            print(f"{layout:<8} {uncached:12.0f} {per_audit['cache_read_input_tokens']:11.0f} "
+                  f"{per_audit['output_tokens']:7.0f} {billed:10.0f} {seconds * 1000:7.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
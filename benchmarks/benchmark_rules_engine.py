@@ -0,0 +1,137 @@
+"""
+Benchmark: SQLite CodingRulesDB vs in-memory CompactRulesIndex vs mmapped
+RulesSnapshot.
+
+Reports index build / snapshot open time, memory (compact arrays vs a dict of
+tuples holding the same NCCI edges) and per-claim / pairwise lookup latency.
+
+Usage:
+    python benchmarks/benchmark_rules_engine.py                  # synthetic data
+    python benchmarks/benchmark_rules_engine.py --db coding_rules.db
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, 'execution'))
+
+from execution.coding_rules import CodingRulesDB
+from execution.rules_engine import CompactRulesIndex
+from execution.rules_snapshot import RulesSnapshot, write_snapshot
+
+
+def build_synthetic_db(path, n_codes, n_edges, seed=7):
+    """Create a coding_rules.db-shaped file with random NCCI/MUE data."""
+    rng = random.Random(seed)
+    codes = [f"{10000 + i:05d}" for i in range(n_codes)]
+
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE ncci_edits (column1_code TEXT, column2_code TEXT, effective_date TEXT,
+                    deletion_date TEXT, modifier_indicator TEXT, rationale TEXT,
+                    PRIMARY KEY (column1_code, column2_code))""")
+    conn.execute("CREATE TABLE mue_limits (hcpcs_code TEXT PRIMARY KEY, max_units INTEGER, mai TEXT, rationale TEXT)")
+    conn.execute("CREATE TABLE cpt_codes (code TEXT PRIMARY KEY, short_desc TEXT)")
+
+    def edges():
+        for _ in range(n_edges):
+            yield (rng.choice(codes), rng.choice(codes), "20200101", "*", rng.choice("019"))
+
+    conn.executemany("INSERT OR IGNORE INTO ncci_edits (column1_code, column2_code, effective_date, deletion_date, modifier_indicator) VALUES (?, ?, ?, ?, ?)", edges())
+    conn.executemany("INSERT INTO mue_limits VALUES (?, ?, ?, ?)",
+                     ((c, rng.randint(1, 4), rng.choice("123"), "Synthetic") for c in codes))
+    conn.executemany("INSERT INTO cpt_codes VALUES (?, ?)", ((c, f"Synthetic procedure {c}") for c in codes))
+    conn.commit()
+    conn.close()
+    return codes
+
+
+def measure(label, fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    per_call = (time.perf_counter() - start) / repeat
+    print(f"  {label:<38} {per_call * 1e6:>10.1f} us/call")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQLite vs in-memory NCCI/MUE lookups.")
+    parser.add_argument('--db', help="Existing coding_rules.db (default: build synthetic data)")
+    parser.add_argument('--codes', type=int, default=12000, help="Synthetic: distinct codes")
+    parser.add_argument('--edges', type=int, default=500000, help="Synthetic: NCCI edges")
+    parser.add_argument('--claim-size', type=int, default=30, help="Codes per claim")
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    db_path = args.db
+    if not db_path:
+        db_path = os.path.join(tmp_dir.name, "synthetic_rules.db")
+        print(f"Building synthetic DB ({args.codes} codes, {args.edges} edges)...")
+        build_synthetic_db(db_path, args.codes, args.edges)
+
+    # --- Build + memory ---
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = CompactRulesIndex.from_sqlite(db_path)
+    build_s = time.perf_counter() - start
+    _, compact_peak = tracemalloc.get_traced_memory()
+    compact_current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    conn = sqlite3.connect(db_path)
+    tracemalloc.start()
+    dict_index = {(c1, c2): mod for c1, c2, mod in
+                  conn.execute("SELECT column1_code, column2_code, modifier_indicator FROM ncci_edits")}
+    dict_current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    conn.close()
+
+    edges = len(index.ncci_targets)
+    print(f"\nIndex: {len(index.codes)} codes, {edges} NCCI edges")
+    print(f"  CompactRulesIndex build time            {build_s:>10.2f} s")
+    print(f"  CompactRulesIndex resident              {compact_current / 1e6:>10.1f} MB (peak during build {compact_peak / 1e6:.1f} MB)")
+    print(f"  CompactRulesIndex array payload         {index.index_bytes() / 1e6:>10.1f} MB")
+    print(f"  dict[(c1, c2)] -> mod baseline          {dict_current / 1e6:>10.1f} MB")
+    del dict_index
+
+    snapshot_path = os.path.join(tmp_dir.name, "rules.snapshot")
+    size = write_snapshot(index, snapshot_path)
+    start = time.perf_counter()
+    snapshot = RulesSnapshot(snapshot_path)
+    open_s = time.perf_counter() - start
+    print(f"  RulesSnapshot open (cold start)         {open_s * 1e3:>10.2f} ms ({size / 1e6:.1f} MB file)")
+
+    # --- Lookups ---
+    rng = random.Random(11)
+    claims = [rng.sample(index.codes, min(args.claim_size, len(index.codes))) for _ in range(64)]
+    units = {code: 2 for claim in claims for code in claim}
+    db = CodingRulesDB(db_path)
+    cycle = iter(range(10 ** 9))
+
+    print(f"\nLatency ({args.claim_size}-code claims):")
+    sqlite_ncci = measure("SQLite check_ncci", lambda: db.check_ncci(claims[next(cycle) % 64]), args.repeat)
+    memory_ncci = measure("CompactRulesIndex check_ncci", lambda: index.check_ncci(claims[next(cycle) % 64]), args.repeat)
+    sqlite_claim = measure("SQLite lookup_claim", lambda: db.lookup_claim(claims[next(cycle) % 64], units), args.repeat)
+    memory_claim = measure("CompactRulesIndex lookup_claim", lambda: index.lookup_claim(claims[next(cycle) % 64], units), args.repeat)
+    measure("RulesSnapshot check_ncci", lambda: snapshot.check_ncci(claims[next(cycle) % 64]), args.repeat)
+    measure("RulesSnapshot lookup_claim", lambda: snapshot.lookup_claim(claims[next(cycle) % 64], units), args.repeat)
+
+    a, b = index.code_id(claims[0][0]), index.code_id(claims[0][1])
+    measure("CompactRulesIndex pairwise edge check", lambda: index.edge_index(a, b), args.repeat * 50)
+
+    print(f"\nSpeedup: check_ncci {sqlite_ncci / memory_ncci:.1f}x, lookup_claim {sqlite_claim / memory_claim:.1f}x")
+    db.close()
+    del snapshot
+    tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
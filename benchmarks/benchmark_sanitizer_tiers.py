@@ -0,0 +1,74 @@
+"""
+Benchmark: SANITIZE_MODE=full (spaCy NER over every document) vs
+SANITIZE_MODE=tiered (pattern recognizers, NER only on cue sentences) over the
+labeled corpus in tests/data/phi_corpus.jsonl.
+
+Reports docs/s, ms per document, the share of characters that went through
+NER, and recall: labeled PHI strings that no longer appear in the output.
+Needs the en_core_web_lg spaCy model.
+
+Usage:
+    python benchmarks/benchmark_sanitizer_tiers.py --repeat 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, 'execution'))
+
+import sanitize_phi
+
+CORPUS_PATH = os.path.join(ROOT, 'tests', 'data', 'phi_corpus.jsonl')
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run(mode, corpus, repeat, batch_size):
+    """(seconds, recall, leaked [(doc id, phi)]) for one mode."""
+    sanitize_phi.SANITIZE_MODE = mode
+    texts = [doc["text"] for doc in corpus] * repeat
+    started = time.perf_counter()
+    outputs = sanitize_phi.sanitize_batch(texts, batch_size)
+    elapsed = time.perf_counter() - started
+
+    leaked = [(doc["id"], phi) for doc, (sanitized, _) in zip(corpus, outputs)
+              for phi in doc["phi"] if phi in sanitized]
+    labeled = sum(len(doc["phi"]) for doc in corpus)
+    return elapsed, 1 - len(leaked) / labeled, leaked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full vs tiered PHI sanitization.")
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--repeat', type=int, default=10, help="Passes over the corpus per mode")
+    parser.add_argument('--batch-size', type=int, default=sanitize_phi.SANITIZE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    documents = len(corpus) * args.repeat
+    print(f"{len(corpus)} labeled documents x {args.repeat} passes")
+
+    started = time.perf_counter()
+    sanitize_phi.get_analyzer().analyze(text=sanitize_phi.WARM_UP_TEXT, language='en')
+    print(f"  analyzer load: {time.perf_counter() - started:.2f} s")
+
+    for mode in ("full", "tiered"):
+        elapsed, recall, leaked = run(mode, corpus, args.repeat, args.batch_size)
+        print(f"  {mode:<7} {documents / elapsed:8.1f} docs/s  {elapsed / documents * 1000:7.2f} ms/doc  "
+              f"recall {recall:.3f}")
+        for doc_id, phi in leaked:
+            print(f"          leaked in {doc_id}: {phi!r}")
+
+    metrics = sanitize_phi.tier_metrics
+    print(f"  tiered: {metrics['ner_chars'] / metrics['chars']:.1%} of characters went through NER")
+
+
+if __name__ == "__main__":
+    main()
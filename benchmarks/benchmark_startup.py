@@ -0,0 +1,106 @@
+"""
+Benchmark: process start to first response for app.py.
+
+Each run starts a fresh interpreter that imports the app and serves one
+request through Flask's test client. Reports interpreter + import time, time
+spent in prewarm, first-request latency and the total, as medians over
+--runs. --importtime N also lists the N slowest imports (cumulative, from
+`python -X importtime`). --record appends the result with the current git
+commit to a JSONL file, so start-up can be tracked across commits.
+
+Usage:
+    python benchmarks/benchmark_startup.py --runs 5 --importtime 15
+    python benchmarks/benchmark_startup.py --prewarm --path /sanitize --json '{"text": "Patient: John Doe"}'
+    python benchmarks/benchmark_startup.py --record benchmarks/startup_history.jsonl
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+path, body = sys.argv[1], sys.argv[2]
+response = client.post(path, json=json.loads(body)) if body else client.get(path)
+done = time.perf_counter()
+print(json.dumps({"import": imported - started, "first_request": done - imported,
+                  "status": response.status_code}))
+"""
+
+
+def run_once(path, body, env):
+    started = time.perf_counter()
+    child = subprocess.run([sys.executable, "-c", CHILD, path, body or ""], cwd=ROOT, env=env,
+                           capture_output=True, text=True, check=True)
+    total = time.perf_counter() - started
+    result = json.loads(child.stdout.strip().splitlines()[-1])
+    result["total"] = total
+    return result
+
+
+def slowest_imports(env, limit):
+    """[(cumulative seconds, module)] for the slowest imports of `import app`."""
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=env,
+                           capture_output=True, text=True, check=True)
+    rows = []
+    for line in child.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app start-up and first request.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default="/", help="Route for the first request")
+    parser.add_argument('--json', help="POST this JSON body instead of a GET")
+    parser.add_argument('--prewarm', action='store_true', help="Start with PREWARM=true")
+    parser.add_argument('--importtime', type=int, default=0, metavar="N", help="List the N slowest imports")
+    parser.add_argument('--record', metavar="FILE", help="Append the medians to this JSONL file")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PREWARM="true" if args.prewarm else "false")
+    runs = [run_once(args.path, args.json, env) for _ in range(args.runs)]
+    median = {key: statistics.median(run[key] for run in runs) for key in ("import", "first_request", "total")}
+    statuses = sorted({run["status"] for run in runs})
+
+    print(f"{args.runs} cold starts, first request {'POST' if args.json else 'GET'} {args.path} "
+          f"(status {statuses}), PREWARM={env['PREWARM']}")
+    print(f"  import app (incl. prewarm) {median['import'] * 1000:8.1f} ms")
+    print(f"  first request              {median['first_request'] * 1000:8.1f} ms")
+    print(f"  process start to response  {median['total'] * 1000:8.1f} ms")
+
+    if args.importtime:
+        print(f"Slowest imports (cumulative):")
+        for seconds, name in slowest_imports(env, args.importtime):
+            print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+    if args.record:
+        with open(args.record, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"commit": git_commit(), "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                "path": args.path, "prewarm": args.prewarm,
+                                **{f"{key}_ms": round(value * 1000, 1) for key, value in median.items()}}) + "\n")
+        print(f"Recorded to {args.record}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark: cost of bad model answers under three output policies, against
+the local fake LLM server (tool-use output, prompt caching on).
+
+    legacy    parse the answer and accept it as is; missing or invalid
+              audit_results entries go unnoticed
+    full      validate entries and re-send the whole claim when any is bad
+    repair    validate entries and request only the bad ones (the default)
+
+The fake model gets a claim of --codes codes right on the first try except
+for --flaw-rate of audits, where it drops one entry and gives another an
+invalid calculated_units; asked again it answers correctly. Reports LLM
+calls, tokens and time per audit, and the share of audits whose result
+has a valid entry for every code.
+
+Usage:
+    python benchmarks/benchmark_structured_output.py --audits 100 --flaw-rate 0.3
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, 'execution'))
+
+from benchmarks.fake_llm_server import FakeLLMServer
+from execution import medical_audit
+from execution.rules_engine import CompactRulesIndex
+
+REPAIR_TEMPLATE = medical_audit.AUDIT_REPAIR_TEMPLATE
+OUTPUT_PROBLEMS = medical_audit.audit_output_problems
+
+ALL_CODES = ["12001", "13121", "13122", "14301", "15733", "19342", "19357", "99291"]
+NOTE = "Claim {i}: layered closure of scalp and forearm lacerations, adjacent tissue transfer, reconstruction."
+
+
+class FakeModel:
+    """Reply function for FakeLLMServer: flawed first answers for some claims, correct ones after."""
+
+    def __init__(self, flaw_rate, seed=7):
+        self.flaw_rate = flaw_rate
+        self.rng = random.Random(seed)
+        self.seen = set()
+
+    @staticmethod
+    def entry(code, units=1):
+        return {"code": code, "documentation_status": "PASS",
+                "clinical_evidence": "Layered closure of a 7.5 cm forearm laceration with 4-0 Vicryl.",
+                "calculated_units": units, "billing_risk_alert": "NONE",
+                "risk_rationale": "Documentation supports the code and the billed units."}
+
+    def __call__(self, request):
+        prompt = request["messages"][0]["content"]
+        claim, _, repair = prompt.partition("\n\nREPAIR:")
+        codes = json.loads(re.search(r"CPT codes: (\[.*\])", claim).group(1))
+        if repair:
+            codes = re.findall(r"^- (\S+):", repair, re.MULTILINE)
+        entries = [self.entry(code) for code in codes]
+        if claim not in self.seen:
+            self.seen.add(claim)
+            if self.rng.random() < self.flaw_rate:
+                entries = entries[:-1]
+                entries[0]["calculated_units"] = "two (rounded up)"
+        return json.dumps({"audit_results": entries,
+                           "diagnosis_analysis": "- S01.01XA is specific to site and encounter.",
+                           "documentation_improvement": "- Record the repair length of each wound."})
+
+
+def complete(result, codes):
+    return "audit_results" in result and not OUTPUT_PROBLEMS(result, codes)
+
+
+def run(policy, args, url):
+    """Per-audit means: (LLM calls, uncached input tokens, output tokens, seconds), and the complete share."""
+    medical_audit.audit_output_stats = medical_audit.AuditOutputStats()
+    medical_audit.llm_clients = medical_audit.LLMClientManager()
+    medical_audit.AUDIT_REPAIR_TEMPLATE = "{prompt}" if policy == "full" else REPAIR_TEMPLATE
+    medical_audit.audit_output_problems = (lambda answer, codes: {}) if policy == "legacy" else OUTPUT_PROBLEMS
+
+    codes = ALL_CODES[:args.codes]
+    os.environ["ANTHROPIC_BASE_URL"] = url
+    complete_count = 0
+    started = time.perf_counter()
+    with medical_audit.llm_clients.track_usage() as usage:
+        for i in range(args.audits):
+            result = medical_audit.audit_medical_record(NOTE.format(i=i), codes, ["S01.01XA"], pre_sanitized=True,
+                                                        date_of_service="2024-06-01", use_cache=False)
+            complete_count += complete(result, codes)
+    elapsed = time.perf_counter() - started
+    medical_audit.llm_clients.reset()
+    calls = medical_audit.audit_output_stats.stats()["llm_calls"]
+    uncached = usage["input_tokens"] + usage["cache_creation_input_tokens"]
+    return (calls / args.audits, uncached / args.audits, usage["output_tokens"] / args.audits,
+            elapsed / args.audits, complete_count / args.audits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark output validation, retries and partial repairs.")
+    parser.add_argument('--audits', type=int, default=50)
+    parser.add_argument('--codes', type=int, default=6, help="CPT codes per claim (max 8)")
+    parser.add_argument('--flaw-rate', type=float, default=0.3, help="Share of first answers with bad entries")
+    parser.add_argument('--latency-ms', type=float, default=200, help="Simulated fixed time to first token")
+    parser.add_argument('--chunk-ms', type=float, default=2, help="Simulated generation time per 4 output tokens")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    rules = CompactRulesIndex.from_rows([])
+    medical_audit.get_rules_db = lambda: rules
+    medical_audit.LLM_PROVIDER = "anthropic"
+    medical_audit.ANTHROPIC_API_KEY = "fake"
+
+    print(f"{args.audits} audits of {args.codes} codes, {args.flaw_rate:.0%} flawed first answers, "
+          f"{args.latency_ms:g} ms to first token + {args.chunk_ms:g} ms per 4 output tokens")
+    print(f"{'policy':<8} {'calls':>6} {'uncached in':>12} {'output':>7} {'per audit':>10} {'complete':>9}")
+    for policy in ("legacy", "full", "repair"):
+        with FakeLLMServer(latency_ms=args.latency_ms, chunk_ms=args.chunk_ms,
+                           response=FakeModel(args.flaw_rate)) as server:
+            calls, uncached, output, seconds, share = run(policy, args, server.url)
+        print(f"{policy:<8} {calls:6.2f} {uncached:12.0f} {output:7.0f} {seconds * 1000:7.0f} ms {share:9.0%}")
+
+
+if __name__ == "__main__":
+    main()
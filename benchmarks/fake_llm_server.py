@@ -0,0 +1,236 @@
+"""
+Local fake LLM endpoint for benchmarks and load tests.
+
+Speaks just enough of both APIs used by medical_audit.py:
+- Anthropic Messages:   POST /v1/messages
+- Bedrock InvokeModel:  POST /model/<model-id>/invoke
+
+Responses are returned after a fixed delay (time to first token) plus a
+per-chunk generation delay, over HTTP/1.1 keep-alive. Anthropic requests with
+"stream": true get the SSE event stream, chunk by chunk. The server counts
+accepted TCP connections so a benchmark can tell pooled clients from
+per-call clients. A non-streaming request that forces a tool call
+(tool_choice {"type": "tool"}) gets the reply text, parsed as JSON, back as
+that tool's input.
+
+Prompt caching is emulated: a system prompt whose last cached block carries
+"cache_control" is remembered for CACHE_TTL seconds, and repeats are reported
+as cache_read_input_tokens instead of input_tokens (prefixes shorter than
+`min_cache_tokens` are never cached, as with the real API). With
+--prefill-ms-per-1k, uncached input tokens add time to first token.
+
+Usage:
+    python benchmarks/fake_llm_server.py --port 8765 --latency-ms 50 --chunk-ms 5 --prefill-ms-per-1k 40
+
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=fake LLM_PROVIDER=anthropic ...
+    BEDROCK_ENDPOINT_URL=http://127.0.0.1:8765 AWS_ACCESS_KEY_ID=fake AWS_SECRET_ACCESS_KEY=fake ...
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHUNK_CHARS = 16  # ~4 tokens per streamed delta
+CHARS_PER_TOKEN = 4
+CACHE_TTL = 300  # seconds, like the API's default ephemeral cache
+
+DEFAULT_RESPONSE_TEXT = json.dumps({
+    "audit_results": [],
+    "diagnosis_analysis": "Fake LLM response.",
+    "documentation_improvement": "None.",
+})
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.count("requests")
+        usage = self.server.input_usage(request)
+        delay = self.server.latency + self.server.prefill_delay * (
+            usage["input_tokens"] + usage["cache_creation_input_tokens"]) / 1000
+        if delay:
+            time.sleep(delay)
+
+        text = self.server.response_text(request)
+        chunks = [text[i:i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS)] or [""]
+        usage["output_tokens"] = len(text) // CHARS_PER_TOKEN
+
+        if self.path == "/v1/messages" and request.get("stream"):
+            self._send_stream(request, chunks, usage)
+            return
+
+        # Non-streaming callers wait for the whole generation
+        if self.server.chunk_delay:
+            time.sleep(self.server.chunk_delay * len(chunks))
+        content, stop_reason = [{"type": "text", "text": text}], "end_turn"
+        tool_choice = request.get("tool_choice") or {}
+        if tool_choice.get("type") == "tool":
+            content = [{"type": "tool_use", "id": "toolu_fake", "name": tool_choice["name"], "input": json.loads(text)}]
+            stop_reason = "tool_use"
+        if self.path == "/v1/messages":
+            self._send_json(200, {
+                "id": "msg_fake", "type": "message", "role": "assistant",
+                "model": request.get("model", "fake"), "content": content,
+                "stop_reason": stop_reason, "stop_sequence": None, "usage": usage,
+            })
+        elif self.path.startswith("/model/") and self.path.endswith("/invoke"):
+            self._send_json(200, {"content": content, "stop_reason": stop_reason, "usage": usage})
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def _send_stream(self, request, chunks, usage):
+        def event(name, payload):
+            return f"event: {name}\ndata: {json.dumps(dict(payload, type=name))}\n\n".encode("utf-8")
+
+        frames = [event("message_start", {"message": {
+            "id": "msg_fake", "type": "message", "role": "assistant", "model": request.get("model", "fake"),
+            "content": [], "stop_reason": None, "stop_sequence": None,
+            "usage": dict(usage, output_tokens=1)}}),
+            event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})]
+        frames += [event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": chunk}})
+                   for chunk in chunks]
+        frames += [event("content_block_stop", {"index": 0}),
+                   event("message_delta", {"delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                           "usage": {"output_tokens": usage["output_tokens"]}}),
+                   event("message_stop", {})]
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(sum(len(f) for f in frames)))
+        self.end_headers()
+        for i, frame in enumerate(frames):
+            if 2 <= i < 2 + len(chunks) and self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+            self.wfile.write(frame)
+            self.wfile.flush()
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """
+    Threaded fake server. `response` is a string or a callable taking the
+    request JSON and returning the reply text.
+    """
+    daemon_threads = True
+    request_queue_size = 1024  # listen backlog; the default of 5 drops SYNs under a connection burst
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0, response=DEFAULT_RESPONSE_TEXT, chunk_ms=0,
+                 prefill_ms_per_1k=0, min_cache_tokens=1024):
+        super().__init__((host, port), _Handler)
+        self.latency = latency_ms / 1000
+        self.chunk_delay = chunk_ms / 1000
+        self.prefill_delay = prefill_ms_per_1k / 1000
+        self.min_cache_tokens = min_cache_tokens
+        self._response = response
+        self._counts = {"connections": 0, "requests": 0, "cache_reads": 0, "cache_writes": 0}
+        self._cache = {}  # prefix hash -> expiry
+        self._counts_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def response_text(self, request):
+        return self._response(request) if callable(self._response) else self._response
+
+    def input_usage(self, request):
+        """Input token counts for `request`, reading or writing the emulated prompt cache."""
+        total = len(json.dumps(request)) // CHARS_PER_TOKEN
+        usage = {"input_tokens": total, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+        system = request.get("system")
+        if not isinstance(system, list):
+            return usage
+        marked = [i for i, block in enumerate(system) if isinstance(block, dict) and "cache_control" in block]
+        if not marked:
+            return usage
+        prefix = json.dumps(system[:marked[-1] + 1])
+        prefix_tokens = len(prefix) // CHARS_PER_TOKEN
+        if prefix_tokens < self.min_cache_tokens:
+            return usage
+
+        key = hashlib.sha256(f"{request.get('model')}\0{prefix}".encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        with self._counts_lock:
+            hit = self._cache.get(key, 0) > now
+            self._cache[key] = now + CACHE_TTL
+            self._counts["cache_reads" if hit else "cache_writes"] += 1
+        usage["input_tokens"] = total - prefix_tokens
+        usage["cache_read_input_tokens" if hit else "cache_creation_input_tokens"] = prefix_tokens
+        return usage
+
+    def count(self, name):
+        with self._counts_lock:
+            self._counts[name] += 1
+
+    def stats(self):
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Anthropic/Bedrock endpoint for benchmarks.")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=50, help="Simulated time to first token")
+    parser.add_argument('--chunk-ms', type=float, default=0, help="Simulated generation time per streamed chunk")
+    parser.add_argument('--prefill-ms-per-1k', type=float, default=0,
+                        help="Extra time to first token per 1000 uncached input tokens")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(args.host, args.port, args.latency_ms, chunk_ms=args.chunk_ms,
+                           prefill_ms_per_1k=args.prefill_ms_per_1k)
+    print(f"Fake LLM server on {server.url} ({args.latency_ms:g} ms to first token, "
+          f"{args.chunk_ms:g} ms per chunk, {args.prefill_ms_per_1k:g} ms per 1k uncached input tokens). "
+          f"Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Load test: the web app under each serving configuration, against the local
+fake LLM server (benchmarks/fake_llm_server.py, run in its own process).
+
+For every configuration the app is started fresh, then --concurrency client
+threads send --requests requests back to back. Reports requests/s, p50/p99
+latency and errors.
+
+Configurations:
+    dev             Flask's threaded development server (`python app.py`)
+    gunicorn:WxT    gunicorn with gunicorn.conf.py, W workers x T threads
+
+`--endpoint audit` (default) runs the full /audit path, so the spaCy model
+must be installed; `--endpoint chat` exercises only the LLM round trip.
+
+Usage:
+    python benchmarks/load_test.py --configs dev gunicorn:2x8 gunicorn:2x32 --concurrency 64
+    python benchmarks/load_test.py --endpoint chat --latency-ms 500 --requests 400
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+from benchmarks.benchmark_async_audit import NOTE, serve
+
+DEV_SERVER = "import sys, app; app.app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_command(config, port):
+    if config == "dev":
+        return [sys.executable, "-c", DEV_SERVER, str(port)]
+    kind, _, size = config.partition(":")
+    if kind != "gunicorn" or "x" not in size:
+        raise SystemExit(f"Unknown configuration {config!r}; expected dev or gunicorn:WxT")
+    workers, threads = size.split("x")
+    return [sys.executable, "-m", "gunicorn", "app:app", "--bind", f"127.0.0.1:{port}",
+            "--workers", workers, "--threads", threads, "--access-logfile", "/dev/null"]
+
+
+def wait_until_up(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{url}/get_scenarios", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not come up")
+
+
+def payload(endpoint, i):
+    if endpoint == "chat":
+        return {"context": NOTE, "audit_results": {}, "question": f"Is the repair supported? ({i})"}
+    # Distinct text per request so the audit cache never answers
+    return {"text": f"{NOTE} Visit {i}.", "cpt_codes": ["12001"], "dx_codes": ["S01.01XA"],
+            "date_of_service": "2024-06-01"}
+
+
+def run_load(url, endpoint, total, concurrency):
+    """(elapsed seconds, latencies, errors) for `total` requests from `concurrency` threads."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def client():
+        session = requests.Session()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            try:
+                response = session.post(f"{url}/{endpoint}", json=payload(endpoint, i), timeout=120)
+                ok = response.status_code == 200 and "error" not in response.json()
+            except (requests.RequestException, ValueError):
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, errors
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else values[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the app under different serving configurations.")
+    parser.add_argument('--configs', nargs='+', default=["dev", "gunicorn:1x32", "gunicorn:2x32"])
+    parser.add_argument('--endpoint', choices=("audit", "chat"), default="audit")
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--latency-ms', type=float, default=500, help="Simulated model time per call")
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    llm = multiprocessing.Process(target=serve, args=(port_queue, args.latency_ms), daemon=True)
+    llm.start()
+    env = dict(os.environ, ANTHROPIC_API_KEY="fake", ANTHROPIC_BASE_URL=f"http://127.0.0.1:{port_queue.get(timeout=10)}",
+               LLM_PROVIDER="anthropic", DEMO_MODE="false")
+
+    print(f"POST /{args.endpoint}: {args.requests} requests, {args.concurrency} concurrent clients, "
+          f"{args.latency_ms:g} ms simulated model time")
+    try:
+        for config in args.configs:
+            port = free_port()
+            server = subprocess.Popen(server_command(config, port), cwd=ROOT, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                url = f"http://127.0.0.1:{port}"
+                wait_until_up(url)
+                run_load(url, args.endpoint, min(args.concurrency, args.requests), args.concurrency)  # warm-up
+                elapsed, latencies, errors = run_load(url, args.endpoint, args.requests, args.concurrency)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            if not latencies:
+                print(f"  {config:<15} all {len(errors)} requests failed")
+                continue
+            print(f"  {config:<15} {len(latencies) / elapsed:7.1f} req/s  p50 {percentile(latencies, 50) * 1000:7.0f} ms  "
+                  f"p99 {percentile(latencies, 99) * 1000:7.0f} ms  errors {len(errors)}")
+    finally:
+        llm.terminate()
+
+
+if __name__ == "__main__":
+    main()
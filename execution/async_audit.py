@@ -0,0 +1,308 @@
+"""
+Asyncio variant of the audit pipeline.
+
+`audit_medical_record_async` runs the same steps as `audit_medical_record`,
+but the LLM call goes through async Anthropic / Bedrock clients and the
+blocking work (Presidio sanitization, rule lookups, cache I/O) runs in an
+executor. One worker process can then keep hundreds of audits in flight on a
+single event loop instead of holding a thread per request.
+
+Outbound calls are bounded twice:
+- a semaphore caps in-flight LLM requests (LLM_MAX_IN_FLIGHT), and
+- `RateLimiter` is a token bucket for both the requests-per-minute
+  (LLM_RPM) and tokens-per-minute (LLM_TPM) quotas, so bursts queue
+  locally instead of coming back as 429s.
+
+Usage:
+    result = await audit_medical_record_async(text, ["12001"], ["S01.01XA"])
+"""
+import asyncio
+import functools
+import os
+import time
+import weakref
+
+import httpx
+
+from execution import medical_audit
+from execution.medical_audit import (LLM_POOL_SIZE, USAGE_FIELDS, LLMClientManager, _CallTrace, anthropic,
+                                     logger, response_output, tool_options)
+
+LLM_RPM = int(os.getenv("LLM_RPM", "0"))                        # 0 = unlimited
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))                        # 0 = unlimited
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "64"))   # concurrent LLM calls per event loop
+ASYNC_POOL_SHARD_SIZE = int(os.getenv("ASYNC_POOL_SHARD_SIZE", "16"))  # connections per httpx.AsyncClient
+
+MAX_TOKENS = 4096
+CHARS_PER_TOKEN = 4  # rough estimate used until the response reports real usage
+WAIT_TOLERANCE = 1e-6  # refill float error; never sleep for less than this
+
+
+def estimate_tokens(prompt, system_prompt, max_tokens=MAX_TOKENS):
+    """Tokens to reserve for a call: estimated input plus the full output budget."""
+    if isinstance(system_prompt, list):  # content blocks (prompt caching)
+        system_prompt = "".join(block.get("text", "") for block in system_prompt)
+    return (len(prompt) + len(system_prompt or "")) // CHARS_PER_TOKEN + max_tokens
+
+
+class RateLimiter:
+    """
+    Token bucket over two quotas: requests per minute and tokens per minute.
+    Each bucket starts full and refills continuously at quota / 60 per second.
+    A quota of 0 disables that bucket.
+
+    Callers reserve an estimate with `acquire()`, then `settle()` it against
+    the usage the API reports, so over- or under-estimates are paid back.
+    Waiters are served in arrival order, so a large request is not starved
+    by a stream of small ones.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, clock=time.monotonic, sleep=asyncio.sleep):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._clock = clock
+        self._sleep = sleep
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = clock()
+        self._lock = None
+        self.metrics = {"acquired": 0, "waits": 0, "wait_seconds": 0.0}
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _wait_seconds(self, tokens):
+        """Time until both buckets can cover this call (0 if they already can)."""
+        wait = 0.0
+        if self.rpm and self._requests < 1:
+            wait = (1 - self._requests) * 60 / self.rpm
+        if self.tpm and self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+        return wait
+
+    async def acquire(self, tokens=0):
+        """Wait until one request and `tokens` tokens are available, then take them. Returns tokens taken."""
+        if self.tpm:
+            tokens = min(tokens, self.tpm)  # a call bigger than the whole quota still runs, alone
+        else:
+            tokens = 0
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            waited = 0.0
+            while True:
+                self._refill()
+                wait = self._wait_seconds(tokens)
+                if wait <= WAIT_TOLERANCE:
+                    break
+                waited += wait
+                await self._sleep(wait)
+            if self.rpm:
+                self._requests -= 1
+            self._tokens -= tokens
+            self.metrics["acquired"] += 1
+            if waited:
+                self.metrics["waits"] += 1
+                self.metrics["wait_seconds"] += waited
+        return tokens
+
+    def settle(self, reserved, used):
+        """Return unused reserved tokens (or charge extra) once real usage is known."""
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + reserved - used)
+
+    def stats(self):
+        return dict(self.metrics, wait_seconds=round(self.metrics["wait_seconds"], 3),
+                    rpm=self.rpm, tpm=self.tpm)
+
+
+class _AsyncCallTrace(_CallTrace):
+    """httpcore awaits the trace callback on async connections."""
+    __slots__ = ()
+
+    async def __call__(self, name, info):
+        self.events[name] = time.perf_counter()
+
+
+class AsyncLLMClientManager(LLMClientManager):
+    """
+    Async counterpart of LLMClientManager: lazily built AsyncAnthropic /
+    AsyncAnthropicBedrock clients over keep-alive httpx.AsyncClient pools,
+    with the same connect / TTFB metrics. Both providers go through httpx
+    here, so Bedrock calls get connect timings too.
+
+    httpcore scans every pooled connection each time it assigns a request,
+    so one large async pool costs O(connections) CPU per request. The
+    `pool_size` connections are therefore split into shards of at most
+    `shard_size`, and calls are spread over the shards round-robin.
+
+    Bound to the event loop that first uses it; close with `aclose()`.
+    """
+
+    def __init__(self, pool_size=LLM_POOL_SIZE, shard_size=ASYNC_POOL_SHARD_SIZE, **kwargs):
+        super().__init__(pool_size=pool_size, **kwargs)
+        self.shard_size = max(1, min(shard_size, pool_size))
+        self.shards = -(-pool_size // self.shard_size)
+        self._http_clients = []
+        self._next_shard = 0
+
+    def http_client(self):
+        """A new keep-alive httpx.AsyncClient holding one shard of the pool."""
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.shard_size,
+                                max_keepalive_connections=self.shard_size),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            event_hooks={"request": [self._start_trace], "response": [self._finish_trace]})
+        self._http_clients.append(client)
+        return client
+
+    def _sharded(self, factory):
+        clients = [factory(self.http_client()) for _ in range(self.shards)]
+        self.metrics["clients_created"] += len(clients)
+        return clients
+
+    def anthropic(self):
+        if self._anthropic is None:
+            self._anthropic = self._sharded(lambda http_client: anthropic.AsyncAnthropic(
+                api_key=medical_audit.ANTHROPIC_API_KEY,
+                http_client=http_client,
+                max_retries=self.max_retries,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout)))
+        return self._anthropic
+
+    def bedrock(self):
+        if self._bedrock is None:
+            self._bedrock = self._sharded(lambda http_client: anthropic.AsyncAnthropicBedrock(
+                aws_region=medical_audit.AWS_REGION,
+                base_url=medical_audit.BEDROCK_ENDPOINT_URL,
+                http_client=http_client,
+                max_retries=self.max_retries,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout)))
+        return self._bedrock
+
+    def client(self):
+        """(client, model id) for the active LLM_PROVIDER, rotating over the shards."""
+        if medical_audit.LLM_PROVIDER.lower() == "bedrock":
+            clients, model = self.bedrock(), medical_audit.BEDROCK_MODEL_ID
+        else:
+            if not medical_audit.ANTHROPIC_API_KEY:
+                raise ValueError("ANTHROPIC_API_KEY not found in .env file.")
+            clients, model = self.anthropic(), medical_audit.MODEL_NAME
+        self._next_shard = (self._next_shard + 1) % len(clients)
+        return clients[self._next_shard], model
+
+    def reset(self):
+        raise TypeError("Async clients must be closed with `await aclose()`.")
+
+    async def aclose(self):
+        http_clients, self._http_clients = self._http_clients, []
+        self._anthropic = None
+        self._bedrock = None
+        for http_client in http_clients:
+            await http_client.aclose()
+
+    def stats(self):
+        return dict(super().stats(), shards=self.shards)
+
+    async def _start_trace(self, request):
+        request.extensions["trace"] = _AsyncCallTrace()
+
+    async def _finish_trace(self, response):
+        super()._finish_trace(response)
+
+
+class AsyncAuditRuntime:
+    """Per-event-loop LLM state: async clients, the in-flight semaphore and the rate limiter."""
+
+    def __init__(self, max_in_flight=LLM_MAX_IN_FLIGHT, requests_per_minute=LLM_RPM,
+                 tokens_per_minute=LLM_TPM):
+        # One connection per permitted in-flight call, so calls never queue inside httpx
+        self.clients = AsyncLLMClientManager(pool_size=max_in_flight)
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+
+    async def query(self, prompt, system_prompt, max_tokens=MAX_TOKENS, usage=None, tool=None):
+        """
+        One LLM call under the concurrency and rate limits. Returns the
+        response text (the tool input when `tool` is given); token counts
+        are added to `usage` if given.
+        """
+        client, model = self.clients.client()
+        async with self.semaphore:
+            reserved = await self.limiter.acquire(estimate_tokens(prompt, system_prompt, max_tokens))
+            used = reserved
+            self.in_flight += 1
+            try:
+                response = await client.messages.create(
+                    model=model,
+                    max_tokens=max_tokens,
+                    temperature=0,
+                    system=system_prompt,
+                    messages=[{"role": "user", "content": prompt}],
+                    **tool_options(tool))
+                counts = self.clients.record_usage(response.usage, into=usage)
+                # Cache reads do not count towards the input-tokens-per-minute limit
+                used = counts["input_tokens"] + counts["cache_creation_input_tokens"] + counts["output_tokens"]
+                return response_output(response.content) if response.content else None
+            finally:
+                self.in_flight -= 1
+                self.limiter.settle(reserved, used)
+
+    def stats(self):
+        return {"in_flight": self.in_flight, "max_in_flight": self.max_in_flight,
+                "rate_limiter": self.limiter.stats(), "clients": self.clients.stats()}
+
+    async def aclose(self):
+        await self.clients.aclose()
+
+_runtimes = weakref.WeakKeyDictionary()
+
+def get_runtime():
+    """The AsyncAuditRuntime for the running event loop (created on first use)."""
+    loop = asyncio.get_running_loop()
+    runtime = _runtimes.get(loop)
+    if runtime is None:
+        runtime = _runtimes[loop] = AsyncAuditRuntime()
+    return runtime
+
+async def audit_medical_record_async(raw_text, cpt_list, diagnosis_codes, units_map=None,
+                                     sanitization_token=None, pre_sanitized=False, date_of_service=None,
+                                     use_cache=True, executor=None):
+    """
+    Async `audit_medical_record`: same arguments and result. Sanitization,
+    rule lookups and cache I/O run in `executor` (default: the loop's
+    thread pool); the LLM call is awaited under the runtime's limits.
+    """
+    loop = asyncio.get_running_loop()
+    audit = await loop.run_in_executor(executor, functools.partial(
+        medical_audit.prepare_audit, raw_text, cpt_list, diagnosis_codes, units_map,
+        sanitization_token, pre_sanitized, date_of_service, use_cache))
+    if audit.cached is not None:
+        return audit.cached
+    if audit.prompt is None:
+        return await loop.run_in_executor(executor, medical_audit.rules_only_result, audit)
+
+    runtime = get_runtime()
+    usage = dict.fromkeys(USAGE_FIELDS, 0)
+    output = medical_audit.AuditOutput(audit)
+    while (prompt := output.next_prompt()) is not None:
+        try:
+            output.feed(await runtime.query(prompt, audit.system_prompt, usage=usage, **output.query_options))
+        except Exception as e:
+            output.failed(e)
+    medical_audit.log_audit_usage(audit, usage)
+    result_json = output.result()
+    if result_json is None:
+        return output.error()
+
+    return await loop.run_in_executor(executor, functools.partial(
+        medical_audit.finish_audit, audit, result_json, problems=output.problems))
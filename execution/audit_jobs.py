@@ -0,0 +1,297 @@
+"""
+Asynchronous audit jobs.
+
+`POST /audit/jobs` queues an audit and returns a job ID right away; a small
+thread pool runs `audit_medical_record`, and the outcome is read back with
+`GET /audit/jobs/<id>` or POSTed to a callback URL. Request latency no longer
+depends on LLM latency, and the queue depth limit turns overload into a 429
+instead of piling up held connections.
+
+Job records hold status, timestamps and the audit result (sanitized text
+only; the submitted note stays in memory until the audit runs). Stores:
+- MemoryJobStore: this process only. Under gunicorn with several workers a
+  poll that lands on another worker gets a 404, so gunicorn.conf.py switches
+  to sqlite there unless AUDIT_JOB_STORE is set.
+- SQLiteJobStore: a file shared by every worker process, so any worker can
+  answer a status poll.
+
+Queues are per process: with N workers up to N * AUDIT_JOB_QUEUE_LIMIT jobs
+can be waiting in total.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from lazy_import import lazy_import
+
+# Only needed once a job with a callback URL finishes
+httpx = lazy_import("httpx")
+
+logger = logging.getLogger(__name__)
+
+AUDIT_JOB_STORE = os.getenv("AUDIT_JOB_STORE", "memory")          # "memory" or "sqlite"
+AUDIT_JOB_DB = os.getenv("AUDIT_JOB_DB", "audit_jobs.db")
+AUDIT_JOB_WORKERS = int(os.getenv("AUDIT_JOB_WORKERS", "4"))
+AUDIT_JOB_QUEUE_LIMIT = int(os.getenv("AUDIT_JOB_QUEUE_LIMIT", "100"))  # queued (not yet running) jobs per process
+AUDIT_JOB_TTL = float(os.getenv("AUDIT_JOB_TTL", "86400"))       # seconds a job record is kept
+# Hosts callback URLs may point at; callbacks are refused while this is empty
+AUDIT_JOB_CALLBACK_HOSTS = {host.strip().lower() for host in os.getenv("AUDIT_JOB_CALLBACK_HOSTS", "").split(",")
+                            if host.strip()}
+CALLBACK_TIMEOUT = 10.0
+CALLBACK_ATTEMPTS = 3
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+
+class QueueFull(Exception):
+    """Raised by AuditJobManager.submit when the queue depth limit is reached."""
+
+
+def validate_callback_url(url, allowed_hosts=None):
+    """Error message for a callback URL that may not be used, or None if it is fine."""
+    allowed_hosts = AUDIT_JOB_CALLBACK_HOSTS if allowed_hosts is None else allowed_hosts
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return "callback_url must be an http(s) URL"
+    if parsed.hostname.lower() not in allowed_hosts:
+        return f"callback_url host '{parsed.hostname}' is not in AUDIT_JOB_CALLBACK_HOSTS"
+    return None
+
+
+class MemoryJobStore:
+    """Job records in this process. Finished jobs expire after `ttl_seconds`; the oldest go first past `max_entries`."""
+
+    def __init__(self, max_entries=10000, ttl_seconds=AUDIT_JOB_TTL, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._jobs = OrderedDict()  # job_id -> record, oldest first
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._evict()
+            self._jobs[job["job_id"]] = dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def _evict(self):
+        expired_before = self._clock() - self.ttl_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job["status"] in FINISHED and job["updated_at"] <= expired_before]:
+            del self._jobs[job_id]
+        while len(self._jobs) >= self.max_entries:
+            finished = next((job_id for job_id, job in self._jobs.items() if job["status"] in FINISHED), None)
+            if finished is None:
+                break
+            del self._jobs[finished]
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {"backend": "memory", "jobs": len(self._jobs), "by_status": counts}
+
+
+class SQLiteJobStore:
+    """
+    Job records in a SQLite file (WAL) shared by worker processes. Expired
+    jobs are deleted as new ones are created. Connect lazily, so a store
+    built before a fork opens its connection in the worker.
+    """
+
+    def __init__(self, path=AUDIT_JOB_DB, ttl_seconds=AUDIT_JOB_TTL, clock=time.time):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS audit_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    record TEXT NOT NULL
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_jobs_updated ON audit_jobs (updated_at)")
+            self._conn = conn
+        return self._conn
+
+    def create(self, job):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM audit_jobs WHERE status IN (?, ?) AND updated_at <= ?",
+                         (*FINISHED, self._clock() - self.ttl_seconds))
+            conn.execute("INSERT INTO audit_jobs VALUES (?, ?, ?, ?)",
+                         (job["job_id"], job["status"], job["updated_at"], json.dumps(job)))
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connection().execute("SELECT record FROM audit_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT record FROM audit_jobs WHERE job_id = ?", (job_id,)).fetchone()
+                if row:
+                    job = dict(json.loads(row[0]), **fields)
+                    conn.execute("UPDATE audit_jobs SET status = ?, updated_at = ?, record = ? WHERE job_id = ?",
+                                 (job["status"], job["updated_at"], json.dumps(job), job_id))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def stats(self):
+        with self._lock:
+            rows = self._connection().execute("SELECT status, COUNT(*) FROM audit_jobs GROUP BY status").fetchall()
+        return {"backend": "sqlite", "path": self.path, "jobs": sum(n for _, n in rows), "by_status": dict(rows)}
+
+
+def make_job_store(backend=None):
+    backend = (backend or AUDIT_JOB_STORE).lower()
+    if backend == "sqlite":
+        return SQLiteJobStore()
+    if backend == "memory":
+        return MemoryJobStore()
+    raise ValueError(f"Unknown AUDIT_JOB_STORE {backend!r}; expected 'memory' or 'sqlite'")
+
+
+def post_callback(url, job):
+    """POST the finished job to `url`, retrying transient failures. Returns 'delivered' or the last error."""
+    error = None
+    for attempt in range(CALLBACK_ATTEMPTS):
+        try:
+            response = httpx.post(url, json=job, timeout=CALLBACK_TIMEOUT)
+            if response.status_code < 500:
+                return "delivered" if response.is_success else f"rejected: HTTP {response.status_code}"
+            error = f"HTTP {response.status_code}"
+        except httpx.HTTPError as e:
+            error = str(e) or type(e).__name__
+        if attempt < CALLBACK_ATTEMPTS - 1:
+            time.sleep(2 ** attempt)
+    logger.warning(f"Callback to {url} failed after {CALLBACK_ATTEMPTS} attempts: {error}")
+    return f"failed: {error}"
+
+
+class AuditJobManager:
+    """
+    Runs audits on `workers` threads and records them in `store`.
+    At most `max_queue` jobs wait for a worker; beyond that `submit` raises
+    QueueFull. `audit_fn` is called with the parsed /audit arguments.
+    """
+
+    def __init__(self, audit_fn, store=None, workers=AUDIT_JOB_WORKERS, max_queue=AUDIT_JOB_QUEUE_LIMIT,
+                 deliver=post_callback, clock=time.time):
+        self.audit_fn = audit_fn
+        self.store = store if store is not None else make_job_store()
+        self.workers = workers
+        self.max_queue = max_queue
+        self.deliver = deliver
+        self._clock = clock
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="audit-job")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.metrics = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0}
+
+    def submit(self, audit_args, callback_url=None):
+        """Queue an audit; returns the new job record."""
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.metrics["rejected"] += 1
+                raise QueueFull(f"{self.queued} audit jobs already queued (limit {self.max_queue})")
+            self.queued += 1
+            self.metrics["submitted"] += 1
+
+        now = self._clock()
+        job = {"job_id": uuid.uuid4().hex, "status": QUEUED, "created_at": now, "updated_at": now,
+               "started_at": None, "finished_at": None, "result": None, "error": None,
+               "callback_url": callback_url, "callback_status": "pending" if callback_url else None}
+        try:
+            self.store.create(job)
+            self._pool.submit(self._run, job["job_id"], audit_args, callback_url)
+        except Exception:
+            with self._lock:
+                self.queued -= 1
+            raise
+        return job
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def _run(self, job_id, audit_args, callback_url):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        now = self._clock()
+        self.store.update(job_id, status=RUNNING, started_at=now, updated_at=now)
+        try:
+            result = self.audit_fn(**audit_args)
+            error = result.get("error") if isinstance(result, dict) else None
+        except Exception as e:
+            logger.error(f"Audit job {job_id} failed: {e}")
+            result, error = None, str(e)
+
+        status = FAILED if error else SUCCEEDED
+        now = self._clock()
+        self.store.update(job_id, status=status, result=result, error=error, finished_at=now, updated_at=now)
+        with self._lock:
+            self.running -= 1
+            self.metrics[status] += 1
+
+        if callback_url:
+            callback_status = self.deliver(callback_url, self.store.get(job_id))
+            self.store.update(job_id, callback_status=callback_status, updated_at=self._clock())
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.metrics, queued=self.queued, running=self.running,
+                            workers=self.workers, max_queue=self.max_queue)
+        return dict(counters, store=self.store.stats())
+
+    def close(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_job_manager(audit_fn):
+    """The process-wide AuditJobManager (created on first use, so after any fork)."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = AuditJobManager(audit_fn)
+    return _manager
+
+def job_manager_stats():
+    return _manager.stats() if _manager is not None else None
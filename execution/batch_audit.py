@@ -0,0 +1,387 @@
+"""
+Batch audit: run a whole manifest of claims through the audit pipeline.
+
+Claims are read from a JSONL or CSV manifest and flow through pipelined
+stages connected by bounded queues, so PHI sanitization, NCCI/MUE rule
+checks and LLM calls overlap instead of running one claim at a time:
+
+    read -> sanitize -> rules -> llm -> write
+
+Results are appended to a JSONL file, one line per claim, flushed as they
+complete. That file is also the checkpoint: re-running with the same output
+skips every claim_id already written without an error, so an interrupted
+run picks up where it stopped.
+
+Manifest formats
+    JSONL   one /audit request body per line, plus "claim_id":
+            {"claim_id": "A1", "text": "...", "cpt_codes": [{"code": "12001", "user_units": 1}],
+             "dx_codes": ["S01.01XA"], "date_of_service": "2024-06-01"}
+            "text_file" (path relative to the manifest) may replace "text".
+    CSV     columns claim_id, text or text_file, cpt_codes, dx_codes, date_of_service;
+            codes separated by spaces or semicolons, units as CODE:UNITS (e.g. "12001:1;11042:2").
+
+Usage:
+    python execution/batch_audit.py claims.jsonl --output .tmp/batch_results.jsonl --llm-workers 8
+"""
+import argparse
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Allow `from execution...` imports when run as a script
+sys.path.insert(0, os.path.join(BASE_DIR, '..'))
+
+import sanitize_phi
+from execution import medical_audit
+from execution.coding_rules import normalize_date_of_service
+
+QUEUE_SIZE = 64
+REPORT_INTERVAL = 10  # seconds between progress lines
+
+_STOP = object()
+
+
+class BatchClaim:
+    """One claim moving through the pipeline. Once `error` is set, later stages pass it through."""
+    __slots__ = ("claim_id", "kwargs", "sanitized_text", "audit", "result", "error", "stage")
+
+    def __init__(self, claim_id, kwargs=None, error=None):
+        self.claim_id = claim_id
+        self.kwargs = kwargs
+        self.sanitized_text = None
+        self.audit = None
+        self.result = None
+        self.error = error
+        self.stage = "read" if error else None
+
+    def output_record(self):
+        if self.error:
+            return {"claim_id": self.claim_id, "error": self.error, "stage": self.stage}
+        return {"claim_id": self.claim_id, "result": self.result}
+
+
+def split_codes(value):
+    if isinstance(value, list):
+        return value
+    return [c for c in (value or "").replace(";", " ").split() if c]
+
+def claim_from_record(record, base_dir="."):
+    """Turn one manifest record (JSONL object or CSV row) into a BatchClaim."""
+    claim_id = str(record.get("claim_id") or "").strip()
+    try:
+        text = record.get("text")
+        if not text and record.get("text_file"):
+            with open(os.path.join(base_dir, record["text_file"]), encoding="utf-8") as f:
+                text = f.read()
+
+        cpt_list = []
+        units_map = {}
+        for item in split_codes(record.get("cpt_codes")):
+            if isinstance(item, dict):
+                code, units = item.get("code"), item.get("user_units", 1)
+            else:
+                code, _, units = str(item).partition(":")
+            cpt_list.append(code)
+            units_map[code] = int(units or 1)
+
+        if not claim_id:
+            raise ValueError("Missing claim_id")
+        if not text or not cpt_list:
+            raise ValueError("Missing text or CPT codes")
+
+        return BatchClaim(claim_id, {
+            "raw_text": text,
+            "cpt_list": cpt_list,
+            "diagnosis_codes": split_codes(record.get("dx_codes")),
+            "units_map": units_map,
+            "date_of_service": normalize_date_of_service(record.get("date_of_service") or None),
+        })
+    except (OSError, ValueError, TypeError) as e:
+        return BatchClaim(claim_id or "?", error=str(e))
+
+def read_manifest(path):
+    """Yield a BatchClaim per manifest record (JSONL unless the file ends in .csv)."""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield claim_from_record(row, base_dir)
+            return
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield BatchClaim(f"line-{line_no}", error=f"Invalid JSON: {e}")
+                continue
+            yield claim_from_record(record, base_dir)
+
+def load_checkpoint(output_path):
+    """claim_ids already written successfully to `output_path` (failed claims are retried)."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn last line from an interrupted run
+            if "result" in record:
+                done.add(record["claim_id"])
+    return done
+
+
+# --- Pipeline stages ---
+
+def sanitize_stage(claims, service=None):
+    """Sanitize a batch of claims: on the worker processes of `service` if given, else in this process."""
+    texts = [claim.kwargs["raw_text"] for claim in claims]
+    outputs = service.sanitize_many(texts) if service else sanitize_phi.sanitize_many(texts)
+    for claim, (sanitized_text, _) in zip(claims, outputs):
+        claim.sanitized_text = sanitized_text
+
+def rules_stage(claim, use_cache=True):
+    kwargs = claim.kwargs
+    claim.audit = medical_audit.prepare_audit(
+        claim.sanitized_text, kwargs["cpt_list"], kwargs["diagnosis_codes"], kwargs["units_map"],
+        pre_sanitized=True, date_of_service=kwargs["date_of_service"], use_cache=use_cache)
+
+def llm_stage(claim):
+    result = medical_audit.complete_audit(claim.audit)
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    claim.result = result
+
+
+class StageStats:
+    """Per-stage counters: items done, errors and busy time summed over workers."""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.done = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, failed):
+        with self._lock:
+            self.done += 1
+            self.errors += failed
+            self.busy_seconds += seconds
+
+    def summary(self, elapsed):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "done": self.done,
+                "errors": self.errors,
+                "per_second": round(self.done / elapsed, 2) if elapsed else 0.0,
+                # Share of worker time spent working; a stage near 1.0 is the bottleneck
+                "utilization": round(self.busy_seconds / (elapsed * self.workers), 3) if elapsed else 0.0,
+            }
+
+
+class Stage:
+    """
+    `workers` threads taking claims from `inbox`, applying `fn` and passing
+    them to `outbox`. The last worker to see the stop marker forwards it.
+
+    With a `batch_size`, `fn` gets a list instead: up to `batch_size` claims
+    that are already queued (a worker never waits to fill a batch).
+    """
+
+    def __init__(self, name, fn, inbox, outbox, workers=1, batch_size=None):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.stats = StageStats(name, workers)
+        self._running = workers
+        self._lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._work, name=f"batch-{name}-{i}", daemon=True)
+                        for i in range(workers)]
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+        return self
+
+    def _next_batch(self):
+        """Block for one claim, then take whatever else is queued, up to batch_size. None at the end."""
+        claim = self.inbox.get()
+        if claim is _STOP:
+            self.inbox.put(_STOP)  # release sibling workers
+            return None
+        batch = [claim]
+        while len(batch) < (self.batch_size or 1):
+            try:
+                claim = self.inbox.get_nowait()
+            except queue.Empty:
+                break
+            if claim is _STOP:
+                self.inbox.put(_STOP)
+                break
+            batch.append(claim)
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            pending = [claim for claim in batch if claim.error is None]
+            if pending:
+                started = time.perf_counter()
+                try:
+                    if self.batch_size:
+                        self.fn(pending)
+                    else:
+                        self.fn(pending[0])
+                except Exception as e:
+                    for claim in pending:
+                        claim.error, claim.stage = str(e), self.name
+                share = (time.perf_counter() - started) / len(pending)
+                for claim in pending:
+                    self.stats.record(share, claim.error is not None)
+            for claim in batch:
+                self.outbox.put(claim)
+
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last:
+            self.outbox.put(_STOP)
+
+
+def write_results(inbox, output_path, stats):
+    """Append each finished claim to the output JSONL (the checkpoint) as it arrives."""
+    with open(output_path, "a+", encoding="utf-8") as out:
+        # Terminate a torn last line left by a killed run
+        if out.tell():
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")
+        while True:
+            claim = inbox.get()
+            if claim is _STOP:
+                break
+            out.write(json.dumps(claim.output_record()) + "\n")
+            out.flush()
+            stats.record(0.0, claim.error is not None)
+
+def report_progress(stages, queues, writer_stats, started, stop_event, interval, stream):
+    while not stop_event.wait(interval):
+        elapsed = time.perf_counter() - started
+        parts = []
+        for stage, q in zip(stages, queues):
+            s = stage.stats.summary(elapsed)
+            parts.append(f"{stage.name} {s['done']} ({s['per_second']}/s, {s['utilization']:.0%} busy, "
+                         f"queue {q.qsize()}/{q.maxsize})")
+        parts.append(f"written {writer_stats.done}")
+        print(f"[{elapsed:7.1f}s] " + " | ".join(parts), file=stream, flush=True)
+
+def run_batch(manifest_path, output_path, llm_workers=None, sanitize_processes=0, rules_workers=1,
+              queue_size=QUEUE_SIZE, use_cache=True, report_interval=REPORT_INTERVAL, stream=sys.stderr,
+              sanitize_batch_size=sanitize_phi.SANITIZE_BATCH_SIZE):
+    """
+    Audit every claim in `manifest_path` not already in `output_path`.
+    `sanitize_processes` > 0 runs PHI sanitization on that many worker
+    processes (one feeding thread each); 0 sanitizes in this process.
+    Returns a summary: claims read/skipped/written and per-stage throughput.
+    """
+    llm_workers = llm_workers or medical_audit.LLM_POOL_SIZE
+    service = None
+    if sanitize_processes:
+        service = sanitize_phi.SanitizationService(sanitize_processes, batch_size=sanitize_batch_size)
+        service.warm_up()
+    done = load_checkpoint(output_path)
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(4)]
+    stages = [
+        Stage("sanitize", lambda claims: sanitize_stage(claims, service), queues[0], queues[1],
+              max(1, sanitize_processes), batch_size=sanitize_batch_size),
+        Stage("rules", lambda claim: rules_stage(claim, use_cache), queues[1], queues[2], rules_workers),
+        Stage("llm", llm_stage, queues[2], queues[3], llm_workers),
+    ]
+    writer_stats = StageStats("write", 1)
+    writer = threading.Thread(target=write_results, args=(queues[3], output_path, writer_stats),
+                              name="batch-write", daemon=True)
+
+    started = time.perf_counter()
+    stop_reporting = threading.Event()
+    reporter = threading.Thread(target=report_progress, daemon=True, args=(
+        stages, queues[:3], writer_stats, started, stop_reporting, report_interval, stream))
+
+    for stage in stages:
+        stage.start()
+    writer.start()
+    reporter.start()
+
+    read = skipped = 0
+    seen = set()
+    try:
+        for claim in read_manifest(manifest_path):
+            read += 1
+            if claim.claim_id in done or claim.claim_id in seen:
+                skipped += 1
+                continue
+            seen.add(claim.claim_id)
+            queues[0].put(claim)  # blocks while the pipeline is full
+    finally:
+        queues[0].put(_STOP)
+        writer.join()
+        stop_reporting.set()
+        if service:
+            service.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "read": read,
+        "skipped": skipped,
+        "written": writer_stats.done,
+        "errors": writer_stats.errors,
+        "elapsed_seconds": round(elapsed, 2),
+        "claims_per_second": round(writer_stats.done / elapsed, 2) if elapsed else 0.0,
+        "stages": {stage.name: stage.stats.summary(elapsed) for stage in stages},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Audit a manifest of claims (JSONL or CSV) into a JSONL file.')
+    parser.add_argument('manifest', help='Claims manifest (.jsonl or .csv)')
+    parser.add_argument('--output', default='.tmp/batch_results.jsonl',
+                        help='Results JSONL; also the resume checkpoint')
+    parser.add_argument('--llm-workers', type=int, default=None,
+                        help='Concurrent LLM calls (default LLM_POOL_SIZE)')
+    parser.add_argument('--sanitize-processes', type=int, default=sanitize_phi.SANITIZE_WORKERS,
+                        help='PHI sanitization worker processes (default SANITIZE_WORKERS; 0 = in-process)')
+    parser.add_argument('--sanitize-batch-size', type=int, default=sanitize_phi.SANITIZE_BATCH_SIZE,
+                        help='Documents per spaCy batch')
+    parser.add_argument('--rules-workers', type=int, default=1)
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE, help='Claims buffered between stages')
+    parser.add_argument('--no-cache', action='store_true', help='Skip the audit result cache')
+    parser.add_argument('--report-interval', type=float, default=REPORT_INTERVAL,
+                        help='Seconds between progress lines')
+    args = parser.parse_args()
+
+    summary = run_batch(args.manifest, args.output, args.llm_workers, args.sanitize_processes,
+                        args.rules_workers, args.queue_size, not args.no_cache, args.report_interval,
+                        sanitize_batch_size=args.sanitize_batch_size)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
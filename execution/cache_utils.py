@@ -0,0 +1,248 @@
+"""
+Small in-process caching helpers shared by the execution scripts.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_hash(*parts):
+    """
+    Stable SHA-256 hex digest over one or more string parts.
+    Parts are length-prefixed so ("ab", "c") and ("a", "bc") never collide.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8") if isinstance(part, str) else bytes(part)
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a maximum entry count and a per-entry TTL.
+    Expired entries are evicted lazily on access and whenever a new entry is stored.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=900, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            now = self._clock()
+            self._entries[key] = (now + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            self._evict(now)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return entry[1] if entry else default
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self, now):
+        # Drop expired entries first (oldest are at the front), then enforce the size bound.
+        while self._entries:
+            oldest_key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[oldest_key]
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class SQLiteCache:
+    """
+    Persistent LRU/TTL cache of JSON-serializable values in a SQLite file.
+    WAL mode lets several worker processes share one file. Expiry uses wall
+    clock time, so entries survive restarts.
+    """
+
+    def __init__(self, path, max_entries=10000, ttl_seconds=86400, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                value TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)")
+        return conn
+
+    def reopen(self):
+        """
+        Open a fresh connection after a fork; SQLite connections must not
+        cross it. The inherited one is dropped, not closed, so the parent's
+        connection state is left untouched.
+        """
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+
+    def get(self, key, default=None):
+        with self._lock:
+            now = self._clock()
+            row = self._conn.execute("SELECT expires_at, value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or row[0] <= now:
+                if row is not None:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    self.evictions += 1
+                self.misses += 1
+                return default
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[1])
+
+    def put(self, key, value):
+        data = json.dumps(value)
+        with self._lock:
+            now = self._clock()
+            self._conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                               (key, now + self.ttl_seconds, now, data))
+            self._evict(now)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+        return json.loads(row[0]) if row else default
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+    def _evict(self, now):
+        evicted = self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,)).rowcount
+        excess = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            evicted += self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (excess,)).rowcount
+        self.evictions += evicted
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self):
+        entries = len(self)
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class TieredCache:
+    """
+    In-memory TTLCache in front of an optional persistent tier (e.g. SQLiteCache).
+    Disk hits are promoted to memory; writes go to both tiers.
+    """
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key, default=None):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        return default if value is None else value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def pop(self, key, default=None):
+        value = self.memory.pop(key)
+        if self.disk is not None:
+            disk_value = self.disk.pop(key)
+            value = value if value is not None else disk_value
+        return default if value is None else value
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def reopen(self):
+        if self.disk is not None:
+            self.disk.reopen()
+
+    def stats(self):
+        return {"memory": self.memory.stats(), "disk": self.disk.stats() if self.disk is not None else None}
@@ -0,0 +1,454 @@
+"""
+Coding rules access layer (NCCI bundling edits, MUE limits, CPT descriptions).
+Backed by the SQLite database built by ingest_coding_rules.py.
+"""
+import logging
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import lru_cache
+
+from execution.cpt_data import CPT_DEFINITIONS
+
+logger = logging.getLogger(__name__)
+
+def normalize_date_of_service(value):
+    """
+    Date of service as the NCCI file format (YYYYMMDD string), or None.
+    Accepts date/datetime objects, "YYYY-MM-DD" and "YYYYMMDD".
+    Raises ValueError for anything else.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return value.strftime("%Y%m%d")
+    return _parse_date_text(str(value).strip())
+
+@lru_cache(maxsize=4096)
+def _parse_date_text(text):
+    # Cached: bulk re-audits repeat the same few dates and strptime is slow
+    for fmt in ("%Y-%m-%d", "%Y%m%d"):
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y%m%d")
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid date of service: {text!r} (expected YYYY-MM-DD)")
+
+# An edit applies on a date of service when it is already effective and not
+# yet deleted. Deletion dates are exclusive; "*" (or any non-date) means none.
+# ncci_edits is WITHOUT ROWID, so the dates come from the same primary-key search.
+SQL_NCCI_ACTIVE = "AND effective_date <= ? AND (deletion_date > ? OR deletion_date NOT GLOB '[0-9]*')"
+
+def read_rules_version(conn):
+    """Latest applied rules_version in a coding_rules.db connection (0 for pre-versioned DBs)."""
+    try:
+        row = conn.execute("SELECT MAX(version) FROM rules_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+class ClaimRules:
+    """
+    Rules data for every code on one claim, fetched in one batched lookup.
+    Shared by the prompt builder and the post-processing merge so neither
+    has to go back to the database.
+    """
+    __slots__ = ("codes", "units_map", "descriptions", "mue_rows", "ncci_rows", "date_of_service")
+
+    def __init__(self, codes, units_map=None, descriptions=None, mue_rows=None, ncci_rows=None,
+                 date_of_service=None):
+        self.codes = codes
+        self.units_map = units_map or {}
+        self.date_of_service = date_of_service  # YYYYMMDD the NCCI rows were filtered on
+        self.descriptions = descriptions or {}  # code -> short_desc
+        self.mue_rows = mue_rows or {}  # code -> (max_units, mai, rationale)
+        self.ncci_rows = ncci_rows or []  # [(column1_code, column2_code, modifier_indicator)]
+
+    def units(self, code):
+        """Billed units for a code (defaults to 1)."""
+        return self.units_map.get(code, 1)
+
+    def definition(self, code):
+        """
+        Priority:
+        1. Augmented Rules (CPT_DEFINITIONS) - Contains custom logic/requirements
+        2. Official Short Desc (DB) - Fallback
+        """
+        definition = CPT_DEFINITIONS.get(code)
+        if definition:
+            return definition
+        desc = self.descriptions.get(code)
+        if desc:
+            return f"{desc} (Official Short Description)"
+        return "No internal definition found - relying on general knowledge."
+
+    def ncci_findings(self):
+        return [CodingRulesDB.ncci_alert(c1, c2, mod_ind)
+                for c1, c2, mod_ind in self.ncci_rows if c1 != c2]
+
+    def mue_finding(self, code):
+        row = self.mue_rows.get(code)
+        return CodingRulesDB.mue_alert(row, self.units(code)) if row else None
+
+    def alerts_by_code(self):
+        """
+        Map each code to its deterministic alerts: NCCI bundling first, then MUE.
+        """
+        alerts = {}
+        for finding in self.ncci_findings():
+            alerts.setdefault(finding['code'], []).append(finding)
+
+        for code in self.codes:
+            mue_finding = self.mue_finding(code)
+            if mue_finding:
+                # Store raw data for processing, but also make a friendly alert string
+                alerts.setdefault(code, []).append({
+                    "code": code,
+                    "conflict_with": "MUE LIMIT",
+                    "mod_indicator": f"MAI {mue_finding['mai']}",
+                    "limit": mue_finding['limit'],
+                    "billed": self.units(code),
+                    "mai": mue_finding['mai'],
+                    "alert": "HIGH - MUE EXCEEDED"
+                })
+        return alerts
+
+class CodingRulesDB:
+    """
+    Read-only access layer for coding_rules.db.
+
+    Connections are opened once (read-only, immutable, memory-mapped) and kept
+    in a bounded pool, so a query never pays for a connect/close cycle. Use
+    `get_rules_db()` for the shared process-wide instance.
+    """
+    # Fixed statement text lets sqlite3's per-connection statement cache
+    # keep these prepared across calls.
+    SQL_MUE = "SELECT max_units, mai, rationale FROM mue_limits WHERE hcpcs_code=?"
+    SQL_CPT_DESC = "SELECT short_desc FROM cpt_codes WHERE code=?"
+
+    def __init__(self, db_path="coding_rules.db", pool_size=8, immutable=True,
+                 mmap_size=256 * 1024 * 1024, timeout=5.0):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self.timeout = timeout
+
+        self._idle = queue.LifoQueue()  # LIFO keeps the warmest connection in use
+        self._lock = threading.Lock()
+        self._open_count = 0
+        self._rules_version = None
+        self.metrics = {
+            "connections_opened": 0,
+            "connection_errors": 0,
+            "acquisitions": 0,
+            "pool_waits": 0,
+            "queries": 0,
+        }
+
+    def _connect(self):
+        uri = pathlib.Path(self.db_path).absolute().as_uri() + "?mode=ro"
+        if self.immutable:
+            # The rules DB is rebuilt offline; immutable=1 skips file locking entirely.
+            uri += "&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=128)
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._open_count < self.pool_size
+            if can_open:
+                self._open_count += 1
+
+        if can_open:
+            try:
+                conn = self._connect()
+            except sqlite3.Error as e:
+                with self._lock:
+                    self._open_count -= 1
+                    self.metrics["connection_errors"] += 1
+                logger.error(f"Error connecting to DB: {e}")
+                return None
+            with self._lock:
+                self.metrics["connections_opened"] += 1
+            return conn
+
+        # Pool exhausted: wait for another thread to hand a connection back
+        with self._lock:
+            self.metrics["pool_waits"] += 1
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            logger.error(f"Timed out waiting for a DB connection (pool size {self.pool_size})")
+            return None
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection. Yields None if the DB is unavailable."""
+        conn = self._acquire()
+        if conn is not None:
+            with self._lock:
+                self.metrics["acquisitions"] += 1
+        try:
+            yield conn
+        finally:
+            if conn is not None:
+                self._idle.put(conn)
+
+    def _query(self, conn, sql, params=()):
+        with self._lock:
+            self.metrics["queries"] += 1
+        return conn.execute(sql, params)
+
+    def close(self):
+        """Close idle pooled connections (e.g. at shutdown or after a fork)."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._open_count -= 1
+
+    @property
+    def rules_version(self):
+        """Version of the rule set this instance reads (the file never changes under it)."""
+        if self._rules_version is None:
+            with self.connection() as conn:
+                if not conn: return 0
+                self._rules_version = read_rules_version(conn)
+        return self._rules_version
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics,
+                        rules_version=self._rules_version,  # None until first read
+                        pool_size=self.pool_size,
+                        open_connections=self._open_count,
+                        idle_connections=self._idle.qsize())
+
+    @staticmethod
+    def mue_alert(row, user_units):
+        """Build the MUE finding for a (max_units, mai, rationale) row, or None."""
+        max_units, mai, rationale = row
+        if user_units > max_units:
+            return {
+                "alert": "HIGH - MUE EXCEEDED",
+                "limit": max_units,
+                "mai": mai,
+                "rationale": f"MAI {mai} indicates specific rules apply. {rationale}"
+            }
+        return None
+
+    @staticmethod
+    def ncci_alert(c1, c2, mod_ind):
+        # c1 is Column 1 (Comprehensive), c2 is Column 2 (Component)
+        return {
+            "code": c2, # The component code causing the issue
+            "conflict_with": c1,
+            "mod_indicator": mod_ind,
+            "alert": f"HIGH - NCCI BUNDLING (Bundles into {c1})"
+        }
+
+    def check_mue(self, code, user_units):
+        with self.connection() as conn:
+            if not conn: return None
+            row = self._query(conn, self.SQL_MUE, (code,)).fetchone()
+
+        if row:
+            return self.mue_alert(row, user_units)
+        return None
+
+    def get_cpt_description(self, code):
+        """Fetch short description from DB."""
+        with self.connection() as conn:
+            if not conn: return None
+            row = self._query(conn, self.SQL_CPT_DESC, (code,)).fetchone()
+        return row[0] if row else None
+
+    def check_ncci(self, codes, date_of_service=None):
+        """
+        Optimized Batch NCCI Check.
+        Instead of iterating permutations (N^2), we do one query.
+        With a date of service, only edits active on that date are returned.
+        """
+        if not codes or len(codes) < 2: return []
+
+        alerts = []
+
+        # Prepare placeholders for IN clause
+        placeholders = ','.join(['?'] * len(codes))
+
+        # Optimization: Fetch ALL edges where both nodes are in our code list.
+        # This is strictly O(1) query roundtrip instead of O(N^2).
+        query = f"""
+            SELECT column1_code, column2_code, modifier_indicator
+            FROM ncci_edits
+            WHERE column1_code IN ({placeholders})
+              AND column2_code IN ({placeholders})
+        """
+
+        # We pass the list twice (once for col1, once for col2)
+        params = codes + codes
+
+        dos = normalize_date_of_service(date_of_service)
+        if dos:
+            query += SQL_NCCI_ACTIVE
+            params += [dos, dos]
+
+        try:
+            with self.connection() as conn:
+                if not conn: return []
+                rows = self._query(conn, query, params).fetchall()
+
+            for row in rows:
+                c1, c2, mod_ind = row
+                # c1 is Column 1 (Comprehensive), c2 is Column 2 (Component)
+                # If we found a row, it means c2 bundles into c1.
+
+                # Check if it's a self-reference (rare data error, but possible)
+                if c1 == c2: continue
+
+                alerts.append(self.ncci_alert(c1, c2, mod_ind))
+
+        except sqlite3.Error as e:
+            logger.error(f"DB Error during NCCI check: {e}")
+
+        return alerts
+
+    def lookup_claim(self, codes, units_map=None, date_of_service=None):
+        """
+        Batched rule lookup for a whole claim.
+        Fetches descriptions, MUE rows and NCCI pairs for every code with one
+        IN (...) query per table on a single pooled connection, so the cost is
+        a fixed 3 round trips regardless of claim size.
+        NCCI pairs are limited to edits active on `date_of_service` when given.
+        """
+        unique_codes = list(dict.fromkeys(codes))
+        dos = normalize_date_of_service(date_of_service)
+        claim = ClaimRules(list(codes), units_map, date_of_service=dos)
+        if not unique_codes:
+            return claim
+
+        placeholders = ','.join(['?'] * len(unique_codes))
+        try:
+            with self.connection() as conn:
+                if not conn: return claim
+
+                claim.descriptions = dict(self._query(
+                    conn, f"SELECT code, short_desc FROM cpt_codes WHERE code IN ({placeholders})",
+                    unique_codes).fetchall())
+
+                claim.mue_rows = {
+                    code: (max_units, mai, rationale)
+                    for code, max_units, mai, rationale in self._query(
+                        conn,
+                        f"SELECT hcpcs_code, max_units, mai, rationale FROM mue_limits WHERE hcpcs_code IN ({placeholders})",
+                        unique_codes).fetchall()
+                }
+
+                if len(unique_codes) > 1:
+                    query = f"""SELECT column1_code, column2_code, modifier_indicator
+                                FROM ncci_edits
+                                WHERE column1_code IN ({placeholders})
+                                  AND column2_code IN ({placeholders})"""
+                    params = unique_codes + unique_codes
+                    if dos:
+                        query += SQL_NCCI_ACTIVE
+                        params += [dos, dos]
+                    claim.ncci_rows = self._query(conn, query, params).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"DB Error during claim lookup: {e}")
+
+        return claim
+
+# Shared process-wide rules DB (lazy, like the Presidio analyzer)
+RULES_DB_PATH = os.getenv("RULES_DB_PATH", "coding_rules.db")
+# "sqlite" (pooled queries), "memory" (CompactRulesIndex loaded at startup)
+# or "snapshot" (mmapped file written by ingest_coding_rules.py)
+RULES_ENGINE = os.getenv("RULES_ENGINE", "sqlite")
+RULES_SNAPSHOT_PATH = os.getenv("RULES_SNAPSHOT_PATH", "coding_rules.snapshot")
+# Seconds between checks for a newly ingested rules file (0 disables hot reload)
+RULES_RELOAD_INTERVAL = float(os.getenv("RULES_RELOAD_INTERVAL", "30"))
+_rules_db = None
+_rules_db_lock = threading.Lock()
+_rules_db_stamp = None
+_rules_db_checked_at = 0.0
+_retired_rules_db = None  # replaced engine, closed at the next reload check
+
+def load_rules_engine(engine=None, db_path=None, snapshot_path=None):
+    engine = (engine or RULES_ENGINE).lower()
+    db_path = db_path or RULES_DB_PATH
+
+    if engine == "snapshot":
+        from execution.rules_snapshot import RulesSnapshot, SnapshotError
+        snapshot_path = snapshot_path or RULES_SNAPSHOT_PATH
+        try:
+            return RulesSnapshot(snapshot_path)
+        except (OSError, ValueError, SnapshotError) as e:
+            logger.error(f"Could not open rules snapshot {snapshot_path} ({e}); falling back to SQLite.")
+
+    if engine == "memory":
+        from execution.rules_engine import CompactRulesIndex
+        try:
+            index = CompactRulesIndex.from_sqlite(db_path)
+            logger.info(f"Loaded in-memory rules index: {index.stats()}")
+            return index
+        except sqlite3.Error as e:
+            logger.error(f"Could not build in-memory rules index ({e}); falling back to SQLite.")
+
+    return CodingRulesDB(db_path, pool_size=int(os.getenv("RULES_DB_POOL_SIZE", "8")))
+
+def _rules_file_stamp():
+    """Identity of the file the configured engine reads; changes when ingest swaps in a new one."""
+    path = RULES_SNAPSHOT_PATH if RULES_ENGINE.lower() == "snapshot" else RULES_DB_PATH
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def get_rules_db():
+    """
+    Shared rules engine. Ingest replaces the rules file atomically, so when the
+    file changes a new engine is loaded and swapped in; requests already
+    holding the old one finish against the old rule set. The old engine is
+    closed one reload interval later, so a request that fetched it just
+    before the swap still gets to run its lookup.
+    """
+    global _rules_db, _rules_db_stamp, _rules_db_checked_at, _retired_rules_db
+    if _rules_db is not None and (
+            RULES_RELOAD_INTERVAL <= 0 or time.monotonic() - _rules_db_checked_at < RULES_RELOAD_INTERVAL):
+        return _rules_db
+
+    with _rules_db_lock:
+        now = time.monotonic()
+        if _rules_db is None:
+            _rules_db_stamp = _rules_file_stamp()
+            _rules_db = load_rules_engine()
+        elif RULES_RELOAD_INTERVAL > 0 and now - _rules_db_checked_at >= RULES_RELOAD_INTERVAL:
+            if _retired_rules_db is not None:
+                _retired_rules_db.close()
+                _retired_rules_db = None
+            stamp = _rules_file_stamp()
+            if stamp is not None and stamp != _rules_db_stamp:
+                _retired_rules_db = _rules_db
+                _rules_db = load_rules_engine()
+                _rules_db_stamp = stamp
+                logger.info(f"Reloaded coding rules (version {_rules_db.rules_version}).")
+        _rules_db_checked_at = now
+    return _rules_db
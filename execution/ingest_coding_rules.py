@@ -2,190 +2,610 @@ import sqlite3
 import csv
 import glob
 import os
+import re
+import sys
+import time
+import argparse
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # DB is in parent directory of 'execution'
 DB_PATH = os.path.join(BASE_DIR, '../coding_rules.db')
+SNAPSHOT_PATH = os.path.join(BASE_DIR, '../coding_rules.snapshot')
+
+# Allow `from execution...` imports when run as a script
+sys.path.insert(0, os.path.join(BASE_DIR, '..'))
 
 INPUT_DIR = 'inputs'
-if not os.path.exists(INPUT_DIR):
-    os.makedirs(INPUT_DIR)
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
+# Rows per executemany() call
+BATCH_SIZE = 50000
+
+# Byte range handed to each parser process when --workers > 1
+CHUNK_BYTES = 8 * 1024 * 1024
+
+NCCI_COLUMNS = "column1_code, column2_code, effective_date, deletion_date, modifier_indicator"
+MUE_COLUMNS = "hcpcs_code, max_units, mai, rationale"
+CPT_COLUMNS = "code, short_desc"
+
+def init_db(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    create_schema(conn)
+    conn.commit()
+    return conn
+
+def create_schema(conn):
     c = conn.cursor()
-    
+
+    # The rule tables are WITHOUT ROWID: rows are stored in the primary-key
+    # B-tree itself, so every lookup the engine runs (by code, or by
+    # column 1 + column 2 code with the date filter) is a covering key search,
+    # and the file holds one copy of each row instead of table + PK index.
+
     # NCCI Edits Table
     c.execute('''
         CREATE TABLE IF NOT EXISTS ncci_edits (
-            column1_code TEXT,
-            column2_code TEXT,
+            column1_code TEXT NOT NULL,
+            column2_code TEXT NOT NULL,
             effective_date TEXT,
             deletion_date TEXT,
             modifier_indicator TEXT,
             rationale TEXT,
             PRIMARY KEY (column1_code, column2_code)
-        )
+        ) WITHOUT ROWID
     ''')
-    
+
     # MUE Limits Table
     c.execute('''
         CREATE TABLE IF NOT EXISTS mue_limits (
-            hcpcs_code TEXT PRIMARY KEY,
+            hcpcs_code TEXT PRIMARY KEY NOT NULL,
             max_units INTEGER,
             mai TEXT,
             rationale TEXT
-        )
+        ) WITHOUT ROWID
     ''')
-    
+
     # CPT Descriptions Table (NEW)
     c.execute('''
         CREATE TABLE IF NOT EXISTS cpt_codes (
-            code TEXT PRIMARY KEY,
+            code TEXT PRIMARY KEY NOT NULL,
             short_desc TEXT
+        ) WITHOUT ROWID
+    ''')
+
+    # One row per applied load, so running audits/caches can tell rule sets apart
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS rules_version (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            applied_at TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            source_files TEXT,
+            changes TEXT
         )
     ''')
-    
-    conn.commit()
-    return conn
+
+def record_rules_version(conn, mode, source_files, changes):
+    """Append a rules_version row and return the new version number."""
+    cursor = conn.execute(
+        "INSERT INTO rules_version (applied_at, mode, source_files, changes) VALUES (?, ?, ?, ?)",
+        (time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), mode,
+         json.dumps([os.path.basename(f) for f in source_files]), json.dumps(changes)))
+    return cursor.lastrowid
+
+# --- Row Parsers (generators, so files are streamed rather than loaded) ---
+
+def iter_mue_rows(csv_path):
+    # Try cp1252 (common for Excel/Windows CSVs) if utf-8 fails
+    with open(csv_path, 'r', encoding='cp1252', errors='replace') as f:
+        reader = csv.reader(f)
+
+        for row in reader:
+            if len(row) < 3: continue
+            code = row[0].strip()
+
+            # Loose heuristic: HCPCS/CPT codes are 5 chars long.
+            # headers are usually long strings.
+            if len(code) != 5: continue
+
+            # Ensure it looks like a code (digit or char start)
+            if not code[0].isalnum(): continue
+
+            try:
+                # Corrected Schema based on inspection:
+                # Col 0: Code
+                # Col 1: MUE Value (Int)
+                # Col 2: MAI (String/Int)
+                # Col 3: Rationale
+                mue = int(row[1].strip())
+                mai = row[2].strip()
+                rationale = row[3].strip() if len(row) > 3 else ""
+            except ValueError:
+                continue
+            yield (code, mue, mai, rationale)
+
+def parse_ncci_line(line):
+    """Parse one NCCI PTP line into an ncci_edits row, or None for headers/junk."""
+    # NCCI files are often tab or space delimited.
+    # Format: Col1 Col2 EffDate DelDate ModInd ...
+    parts = line.split()
+    if len(parts) < 5: return None
+
+    c1 = parts[0]
+    c2 = parts[1]
+
+    # Basic validation: codes are 5 chars
+    if len(c1) != 5 or len(c2) != 5: return None
+
+    # 20220101 format date check to verify it's a data row
+    if not parts[2].isdigit(): return None
+
+    # (c1, c2, eff_date, del_date, mod_ind)
+    return (c1, c2, parts[2], parts[3], parts[4])
+
+def iter_ncci_rows(file_path):
+    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            row = parse_ncci_line(line)
+            if row:
+                yield row
+
+def parse_ncci_chunk(task):
+    """
+    Worker: parse the lines of `file_path` that START inside [start, end).
+    A line straddling `start` belongs to the previous chunk, so every line is
+    parsed exactly once no matter where the byte boundaries fall.
+    """
+    file_path, start, end = task
+    rows = []
+    with open(file_path, 'rb') as f:
+        if start:
+            f.seek(start - 1)
+            f.readline()  # finish the line that began before this chunk
+        pos = f.tell()
+        while pos < end:
+            line = f.readline()
+            if not line: break
+            pos += len(line)
+            row = parse_ncci_line(line.decode('utf-8', errors='ignore'))
+            if row:
+                rows.append(row)
+    return rows
+
+def plan_chunks(file_path, chunk_bytes=None):
+    size = os.path.getsize(file_path)
+    chunk_bytes = chunk_bytes or CHUNK_BYTES
+    return [(file_path, start, min(start + chunk_bytes, size)) for start in range(0, size, chunk_bytes)]
+
+def iter_ncci_batches(file_path, pool=None, max_in_flight=4, chunk_bytes=None):
+    """
+    Yield lists of parsed NCCI rows in file order.
+    With a process pool, byte-range chunks are parsed in parallel; a bounded
+    window of in-flight chunks keeps memory flat when the writer is slower.
+    """
+    if pool is None:
+        rows = iter_ncci_rows(file_path)
+        while True:
+            batch = list(islice(rows, BATCH_SIZE))
+            if not batch:
+                return
+            yield batch
+
+    window = deque()
+    for task in plan_chunks(file_path, chunk_bytes):
+        window.append(pool.submit(parse_ncci_chunk, task))
+        if len(window) >= max_in_flight:
+            yield window.popleft().result()
+    while window:
+        yield window.popleft().result()
+
+def iter_cpt_rows(filename):
+    # Pattern: Code (5 chars) + Space + Desc (variable) + Space + Status (1 char)
+    pattern = re.compile(r"^(\w{5})\s+(.+?)\s{2,}")
+
+    with open(filename, 'r') as f:
+        for line in f:
+            if line.startswith("HDR"): continue
+
+            match = pattern.search(line)
+            if match:
+                yield (match.group(1), match.group(2).strip())
+
+def find_ncci_files(txt_patterns):
+    files = []
+    for pattern in txt_patterns:
+        files.extend(glob.glob(pattern))
+    # Case-insensitive filesystems match both *.TXT and *.txt
+    return list(dict.fromkeys(os.path.normcase(os.path.abspath(f)) for f in files))
+
+def insert_batches(conn, sql, rows, batch_size=BATCH_SIZE):
+    """
+    executemany() in large batches. The caller owns the transaction.
+    Returns the number of rows sent.
+    """
+    rows = iter(rows)
+    return write_batches(conn, sql, iter(lambda: list(islice(rows, batch_size)), []))
+
+def write_batches(conn, sql, batches):
+    """Single writer: insert pre-built row batches in the order given."""
+    count = 0
+    for batch in batches:
+        conn.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+def parser_pool(workers):
+    """Process pool for NCCI parsing, or None to parse inline."""
+    return ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+
+def report_throughput(label, count, started):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"  {label}: {count} rows in {elapsed:.2f}s ({count / elapsed:,.0f} rows/sec)")
+
+# --- Incremental loaders (upsert into an existing database) ---
 
 def ingest_mue(conn, csv_path):
     print(f"Ingesting MUE from {csv_path}...")
-    cursor = conn.cursor()
-    count = 0
-    
+    started = time.perf_counter()
+
     try:
-        # Try cp1252 (common for Excel/Windows CSVs) if utf-8 fails
-        with open(csv_path, 'r', encoding='cp1252', errors='replace') as f:
-            reader = csv.reader(f)
-            
-            for row in reader:
-                if len(row) < 3: continue
-                code = row[0].strip()
-                
-                # Loose heuristic: HCPCS/CPT codes are 5 chars long.
-                # headers are usually long strings.
-                if len(code) != 5: continue
-                
-                # Ensure it looks like a code (digit or char start)
-                if not code[0].isalnum(): continue
-                
-                try:
-                    # Corrected Schema based on inspection:
-                    # Col 0: Code
-                    # Col 1: MUE Value (Int)
-                    # Col 2: MAI (String/Int)
-                    # Col 3: Rationale
-                    mue = int(row[1].strip())
-                    mai = row[2].strip()
-                    rationale = row[3].strip() if len(row) > 3 else ""
-                    
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO mue_limits (hcpcs_code, max_units, mai, rationale)
-                        VALUES (?, ?, ?, ?)
-                    ''', (code, mue, mai, rationale))
-                    count += 1
-                except ValueError:
-                    continue 
-        conn.commit()
+        with conn:
+            count = insert_batches(conn, f'''
+                INSERT OR REPLACE INTO mue_limits ({MUE_COLUMNS})
+                VALUES (?, ?, ?, ?)
+            ''', iter_mue_rows(csv_path))
         print(f"  Imported {count} MUE records.")
+        report_throughput("MUE", count, started)
     except Exception as e:
         print(f"Error reading MUE: {e}")
 
-def ingest_ncci(conn, txt_patterns):
+def ingest_ncci(conn, txt_patterns, workers=1):
     print("Ingesting NCCI Edits...")
-    cursor = conn.cursor()
     total_count = 0
-    
-    files = []
-    for pattern in txt_patterns:
-        files.extend(glob.glob(pattern))
-        
-    for file_path in files:
-        print(f"  Reading {file_path}...")
-        file_count = 0
-        try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                # NCCI files are often tab or space delimited.
-                # Format: Col1 Col2 EffDate DelDate ModInd ...
-                for line in f:
-                    parts = line.strip().split()
-                    if len(parts) < 5: continue
-                    
-                    c1 = parts[0]
-                    c2 = parts[1]
-                    
-                    # Basic validation: codes are 5 chars
-                    if len(c1) != 5 or len(c2) != 5: continue
-                    
-                    # 20220101 format date check to verify it's a data row
-                    if not parts[2].isdigit(): continue
-
-                    eff_date = parts[2]
-                    del_date = parts[3]
-                    mod_ind = parts[4]
-                    
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO ncci_edits 
-                        (column1_code, column2_code, effective_date, deletion_date, modifier_indicator)
+    started = time.perf_counter()
+    pool = parser_pool(workers)
+
+    try:
+        for file_path in find_ncci_files(txt_patterns):
+            print(f"  Reading {file_path}...")
+            try:
+                # Batches arrive in file order, so INSERT OR IGNORE still keeps the first occurrence
+                with conn:
+                    file_count = write_batches(conn, f'''
+                        INSERT OR IGNORE INTO ncci_edits ({NCCI_COLUMNS})
                         VALUES (?, ?, ?, ?, ?)
-                    ''', (c1, c2, eff_date, del_date, mod_ind))
-                    file_count += 1
-            
-            print(f"    - Added {file_count} edits.")
-            total_count += file_count
-            conn.commit()
-        except Exception as e:
-            print(f"Error reading {file_path}: {e}")
-            
+                    ''', iter_ncci_batches(file_path, pool, 2 * workers))
+
+                print(f"    - Added {file_count} edits.")
+                total_count += file_count
+            except Exception as e:
+                print(f"Error reading {file_path}: {e}")
+    finally:
+        if pool:
+            pool.shutdown()
+
     print(f"Total NCCI Edits imported: {total_count}")
+    report_throughput("NCCI", total_count, started)
+
+def cpt_descriptions_path():
+    return os.path.join(BASE_DIR, "PPRRVU2026_Jan_nonQPP.txt")
 
 def ingest_cpt_descriptions(conn):
-    filename = os.path.join(BASE_DIR, "PPRRVU2026_Jan_nonQPP.txt")
+    filename = cpt_descriptions_path()
     if not os.path.exists(filename):
         print(f"Skipping CPT Descriptions: {filename} not found.")
         return
 
     print(f"Ingesting CPT Descriptions from {filename}...")
-    c = conn.cursor()
-    
-    import re
-    # Pattern: Code (5 chars) + Space + Desc (variable) + Space + Status (1 char)
-    pattern = re.compile(r"^(\w{5})\s+(.+?)\s{2,}")
-    
-    count = 0
-    with open(filename, 'r') as f:
-        for line in f:
-            if line.startswith("HDR"): continue
-            
-            match = pattern.search(line)
-            if match:
-                code = match.group(1)
-                desc = match.group(2).strip()
-                
-                try:
-                    c.execute("INSERT OR REPLACE INTO cpt_codes VALUES (?, ?)", (code, desc))
-                    count += 1
-                except sqlite3.Error:
-                    pass
-
-    conn.commit()
+    started = time.perf_counter()
+    with conn:
+        count = insert_batches(conn, f"INSERT OR REPLACE INTO cpt_codes ({CPT_COLUMNS}) VALUES (?, ?)",
+                               iter_cpt_rows(filename))
     print(f"Inserted {count} CPT descriptions.")
+    report_throughput("CPT", count, started)
+
+def upsert_ingest(db_path=DB_PATH, mue_files=(), ncci_patterns=(), workers=1):
+    """
+    Upsert the given files into the rules database (the default ingest mode).
+
+    Readers open the live file with immutable=1, so it is never written in
+    place: the current rules are copied to <db>.building, upserted there and
+    swapped in with os.replace.
+    """
+    tmp_path = f"{db_path}.building"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = init_db(tmp_path)
+    try:
+        if os.path.exists(db_path):
+            source = sqlite3.connect(db_path)
+            source.backup(conn)  # page-level copy of the current rules
+            source.close()
+            create_schema(conn)  # older databases predate rules_version
+            conn.commit()
+
+        if mue_files:
+            ingest_mue(conn, mue_files[0])
+        ingest_ncci(conn, ncci_patterns, workers=workers)
+        ingest_cpt_descriptions(conn)
+
+        with conn:
+            version = record_rules_version(conn, "upsert", list(mue_files[:1]) + find_ncci_files(ncci_patterns), {})
+    except Exception:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+
+    os.replace(tmp_path, db_path)
+    return version
+
+# --- Bulk rebuild (fresh database from scratch) ---
+
+def configure_bulk_build(conn):
+    """
+    Build-time PRAGMAs. Safe only because the database is written to a temp
+    file that replaces the live one after a successful build: a crash just
+    leaves a partial temp file behind.
+    """
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+    conn.execute("PRAGMA cache_size=-262144")  # 256 MB page cache for the index build
+
+def load_staging(conn, mue_files, ncci_patterns, cpt_path, pool=None, max_in_flight=4):
+    """
+    Stream every source file into index-free staging tables.
+    rowid preserves file order, which is what resolves duplicates later.
+    """
+    conn.execute(f"CREATE TEMP TABLE ncci_staging ({NCCI_COLUMNS})")
+    conn.execute(f"CREATE TEMP TABLE mue_staging ({MUE_COLUMNS})")
+    conn.execute(f"CREATE TEMP TABLE cpt_staging ({CPT_COLUMNS})")
+
+    for csv_path in mue_files[:1]:
+        print(f"  Staging MUE from {csv_path}...")
+        started = time.perf_counter()
+        count = insert_batches(conn, "INSERT INTO mue_staging VALUES (?, ?, ?, ?)", iter_mue_rows(csv_path))
+        report_throughput("MUE staged", count, started)
+
+    for file_path in find_ncci_files(ncci_patterns):
+        print(f"  Staging NCCI from {file_path}...")
+        started = time.perf_counter()
+        count = write_batches(conn, "INSERT INTO ncci_staging VALUES (?, ?, ?, ?, ?)",
+                               iter_ncci_batches(file_path, pool, max_in_flight))
+        report_throughput("NCCI staged", count, started)
+
+    if cpt_path and os.path.exists(cpt_path):
+        print(f"  Staging CPT Descriptions from {cpt_path}...")
+        started = time.perf_counter()
+        count = insert_batches(conn, "INSERT INTO cpt_staging VALUES (?, ?)", iter_cpt_rows(cpt_path))
+        report_throughput("CPT staged", count, started)
+
+def publish_staging(conn):
+    """
+    Move staged rows into the real tables in primary-key order, so each
+    B-tree is built by appending instead of random inserts.
+    Duplicate handling matches the incremental loaders:
+    NCCI keeps the first occurrence (INSERT OR IGNORE), MUE/CPT the last (INSERT OR REPLACE).
+    """
+    started = time.perf_counter()
+    conn.execute(f'''
+        INSERT OR IGNORE INTO ncci_edits ({NCCI_COLUMNS})
+        SELECT {NCCI_COLUMNS} FROM ncci_staging ORDER BY column1_code, column2_code, rowid
+    ''')
+    conn.execute(f'''
+        INSERT OR REPLACE INTO mue_limits ({MUE_COLUMNS})
+        SELECT {MUE_COLUMNS} FROM mue_staging ORDER BY hcpcs_code, rowid
+    ''')
+    conn.execute(f'''
+        INSERT OR REPLACE INTO cpt_codes ({CPT_COLUMNS})
+        SELECT {CPT_COLUMNS} FROM cpt_staging ORDER BY code, rowid
+    ''')
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ("ncci_edits", "mue_limits", "cpt_codes")}
+    conn.execute("DROP TABLE ncci_staging")
+    conn.execute("DROP TABLE mue_staging")
+    conn.execute("DROP TABLE cpt_staging")
+    report_throughput("Indexed", sum(counts.values()), started)
+    return counts
+
+def bulk_rebuild(db_path=DB_PATH, mue_files=(), ncci_patterns=(), cpt_path=None, workers=1):
+    """
+    Rebuild the rules database from scratch in one transaction:
+    stream -> staging tables -> sorted insert into indexed tables -> swap into place.
+    """
+    tmp_path = f"{db_path}.building"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(tmp_path, isolation_level=None)
+    pool = parser_pool(workers)
+    try:
+        configure_bulk_build(conn)
+        conn.execute("BEGIN")
+        load_staging(conn, list(mue_files), list(ncci_patterns), cpt_path, pool, 2 * workers)
+        create_schema(conn)
+        counts = publish_staging(conn)
+        record_rules_version(conn, "full", list(mue_files[:1]) + find_ncci_files(ncci_patterns), counts)
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+        if pool:
+            pool.shutdown()
+
+    # Atomic swap: running audits keep their open (old) file until they reload
+    os.replace(tmp_path, db_path)
+    print(f"  Imported {counts['mue_limits']} MUE records, {counts['ncci_edits']} NCCI edits, "
+          f"{counts['cpt_codes']} CPT descriptions.")
+    report_throughput("Total", sum(counts.values()), started)
+    return counts
+
+# --- Delta ingest (apply a new quarter as inserts/updates/deletes) ---
+
+# table, staging table, key columns, compared value columns, duplicate rule
+DELTA_TABLES = (
+    ("ncci_edits", "ncci_staging", ("column1_code", "column2_code"),
+     ("effective_date", "deletion_date", "modifier_indicator"), "IGNORE"),
+    ("mue_limits", "mue_staging", ("hcpcs_code",), ("max_units", "mai", "rationale"), "REPLACE"),
+    ("cpt_codes", "cpt_staging", ("code",), ("short_desc",), "REPLACE"),
+)
+
+# Refuse a delta that would delete more than this share of a table unless forced
+# (usually means only some of the quarter's files were supplied).
+MAX_DELETE_FRACTION = 0.5
+
+def diff_table(conn, table, staging, keys, values, duplicate_rule):
+    """
+    Compare the staged quarter with the live table using set-based EXCEPT
+    queries (SQLite sorts/hashes both sides once) and stage the result as
+    temp tables <table>_upserts and <table>_deletes.
+    Returns change counts, or None when no new data was supplied for the table.
+    """
+    if conn.execute(f"SELECT 1 FROM {staging} LIMIT 1").fetchone() is None:
+        return None
+
+    cols = ", ".join(keys + values)
+    key_list = ", ".join(keys)
+    key_match = " AND ".join(f"t.{k} = u.{k}" for k in keys)
+
+    # Deduplicate the new files exactly like a full load would
+    conn.execute(f"CREATE TEMP TABLE {table}_new ({cols}, PRIMARY KEY ({key_list}))")
+    conn.execute(f"INSERT OR {duplicate_rule} INTO {table}_new SELECT {cols} FROM {staging} ORDER BY rowid")
+
+    conn.execute(f"""CREATE TEMP TABLE {table}_upserts AS
+                     SELECT {cols} FROM {table}_new EXCEPT SELECT {cols} FROM main.{table}""")
+    conn.execute(f"""CREATE TEMP TABLE {table}_deletes AS
+                     SELECT {key_list} FROM main.{table} EXCEPT SELECT {key_list} FROM {table}_new""")
+
+    upserts = conn.execute(f"SELECT COUNT(*) FROM {table}_upserts").fetchone()[0]
+    inserted = conn.execute(f"""SELECT COUNT(*) FROM {table}_upserts u
+                                WHERE NOT EXISTS (SELECT 1 FROM main.{table} t WHERE {key_match})""").fetchone()[0]
+    return {
+        "inserted": inserted,
+        "updated": upserts - inserted,
+        "deleted": conn.execute(f"SELECT COUNT(*) FROM {table}_deletes").fetchone()[0],
+        "current": conn.execute(f"SELECT COUNT(*) FROM main.{table}").fetchone()[0],
+    }
+
+def apply_table_delta(conn, table, keys, values):
+    cols = ", ".join(keys + values)
+    key_list = ", ".join(keys)
+    conn.execute(f"DELETE FROM main.{table} WHERE ({key_list}) IN (SELECT {key_list} FROM {table}_deletes)")
+    conn.execute(f"INSERT OR REPLACE INTO main.{table} ({cols}) SELECT {cols} FROM {table}_upserts")
+    for suffix in ("new", "upserts", "deletes"):
+        conn.execute(f"DROP TABLE {table}_{suffix}")
+
+def delta_ingest(db_path=DB_PATH, mue_files=(), ncci_patterns=(), cpt_path=None, workers=1, force=False):
+    """
+    Apply a new quarter's files as a diff against the current database.
+
+    The live file is never written: the delta is applied to a copy that is
+    swapped in with os.replace, so running audits keep reading the old rules
+    (no write lock) until they notice the new file and reload.
+    Tables whose source files are not supplied are left untouched.
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"{db_path} does not exist; run a full build (--bulk) first.")
+
+    next_path = f"{db_path}.next"
+    if os.path.exists(next_path):
+        os.remove(next_path)
+
+    started = time.perf_counter()
+    source = sqlite3.connect(db_path)
+    conn = sqlite3.connect(next_path, isolation_level=None)
+    pool = parser_pool(workers)
+    try:
+        source.backup(conn)  # page-level copy of the current rules
+        source.close()
+
+        configure_bulk_build(conn)
+        conn.execute("BEGIN")
+        create_schema(conn)
+        load_staging(conn, list(mue_files), list(ncci_patterns), cpt_path, pool, 2 * workers)
+
+        changes = {}
+        for table, staging, keys, values, duplicate_rule in DELTA_TABLES:
+            diff = diff_table(conn, table, staging, keys, values, duplicate_rule)
+            if diff is None:
+                continue
+            if diff["current"] and diff["deleted"] > MAX_DELETE_FRACTION * diff["current"] and not force:
+                raise ValueError(f"Delta would delete {diff['deleted']} of {diff['current']} rows from {table}. "
+                                 "Check that every file for the quarter was supplied, or pass --force.")
+            apply_table_delta(conn, table, keys, values)
+            changes[table] = {k: diff[k] for k in ("inserted", "updated", "deleted")}
+            print(f"  {table}: +{diff['inserted']} inserted, ~{diff['updated']} updated, -{diff['deleted']} deleted")
+
+        for staging in ("ncci_staging", "mue_staging", "cpt_staging"):
+            conn.execute(f"DROP TABLE {staging}")
+
+        sources = list(mue_files[:1]) + find_ncci_files(ncci_patterns) + ([cpt_path] if cpt_path and os.path.exists(cpt_path) else [])
+        version = record_rules_version(conn, "delta", sources, changes)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.close()
+        os.remove(next_path)
+        raise
+    finally:
+        if pool:
+            pool.shutdown()
+    conn.close()
+
+    os.replace(next_path, db_path)
+    print(f"  Rules version {version} applied in {time.perf_counter() - started:.2f}s.")
+    return version, changes
+
+def build_snapshot(db_path=DB_PATH, snapshot_path=SNAPSHOT_PATH):
+    """
+    Compile the rules tables into the mmappable snapshot used by
+    RULES_ENGINE=snapshot (fast cold start on Lambda).
+    """
+    from execution.rules_engine import CompactRulesIndex
+    from execution.rules_snapshot import write_snapshot
+
+    print(f"Writing rules snapshot to {snapshot_path}...")
+    start = time.perf_counter()
+    index = CompactRulesIndex.from_sqlite(db_path)
+    size = write_snapshot(index, snapshot_path)
+    print(f"  Snapshot: {len(index.codes)} codes, {len(index.ncci_targets)} NCCI edges, "
+          f"{size / 1e6:.1f} MB in {time.perf_counter() - start:.1f}s.")
 
 if __name__ == "__main__":
-    conn = init_db()
-    
-    # 1. Ingest MUE
+    parser = argparse.ArgumentParser(description='Build coding_rules.db from CMS NCCI/MUE/RVU files.')
+    parser.add_argument('--bulk', action='store_true',
+                        help='Rebuild the database from scratch using the fast bulk loader')
+    parser.add_argument('--delta', action='store_true',
+                        help='Apply new quarterly files as inserts/updates/deletes against the current database')
+    parser.add_argument('--force', action='store_true',
+                        help='With --delta: allow deleting more than half of a table')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Parse NCCI files in N processes (single writer keeps insert order)')
+    args = parser.parse_args()
+
+    if not os.path.exists(INPUT_DIR):
+        os.makedirs(INPUT_DIR)
+
     mue_files = glob.glob("MCR_MUE_*.csv")
-    if mue_files:
-        ingest_mue(conn, mue_files[0])
-    
-    # 2. Ingest NCCI
     # Matches ccipra-v320r0-f1.TXT etc.
-    ingest_ncci(conn, ["ccipra-*.TXT", "ccipra-*.txt"])
-    
-    # 3. Ingest CPT Descriptions (NEW)
-    ingest_cpt_descriptions(conn)
-    
-    conn.close()
+    ncci_patterns = ["ccipra-*.TXT", "ccipra-*.txt"]
+
+    if args.delta:
+        print(f"Applying delta to {DB_PATH}...")
+        delta_ingest(DB_PATH, mue_files, ncci_patterns, cpt_descriptions_path(),
+                     workers=args.workers, force=args.force)
+    elif args.bulk:
+        print(f"Bulk rebuilding {DB_PATH}...")
+        bulk_rebuild(DB_PATH, mue_files, ncci_patterns, cpt_descriptions_path(), workers=args.workers)
+    else:
+        # MUE, NCCI and CPT descriptions upserted into a copy, swapped into place
+        print(f"Updating {DB_PATH}...")
+        upsert_ingest(DB_PATH, mue_files, ncci_patterns, workers=args.workers)
+
+    # Precompiled snapshot for fast cold start
+    build_snapshot()
     print("Database build complete.")
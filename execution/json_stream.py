@@ -0,0 +1,113 @@
+"""
+Incremental parser for streamed audit responses.
+
+The model streams one JSON document (possibly inside a ```json fence) whose
+"audit_results" array is what the UI waits for. `AuditResultsStreamParser`
+is fed text deltas as they arrive and returns each array element as soon as
+its closing brace is seen, without waiting for the rest of the document.
+"""
+import json
+
+_SEEK_KEY, _SEEK_ARRAY, _IN_ARRAY, _DONE = range(4)
+
+
+class AuditResultsStreamParser:
+    """
+    Usage:
+        parser = AuditResultsStreamParser()
+        for delta in text_stream:
+            for item in parser.feed(delta):
+                ...            # a complete audit_results entry (dict)
+        parser.text            # full response, for the final json parse
+    """
+
+    def __init__(self, key="audit_results"):
+        self._key = f'"{key}"'
+        self.text = ""
+        self._pos = 0          # next character to scan
+        self._state = _SEEK_KEY
+        self._start = None     # index of the current element's opening brace
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.items_emitted = 0
+
+    @property
+    def done(self):
+        """True once the closing bracket of the array has been seen."""
+        return self._state == _DONE
+
+    def feed(self, delta):
+        self.text += delta
+        items = []
+        text = self.text
+
+        while self._pos < len(text) and self._state != _DONE:
+            if self._state == _SEEK_KEY:
+                found = text.find(self._key, max(0, self._pos - len(self._key)))
+                if found == -1:
+                    self._pos = len(text)
+                    break
+                self._pos = found + len(self._key)
+                self._state = _SEEK_ARRAY
+
+            elif self._state == _SEEK_ARRAY:
+                char = text[self._pos]
+                self._pos += 1
+                if char == "[":
+                    self._state = _IN_ARRAY
+
+            elif self._start is None:
+                # Between elements: skip whitespace and commas
+                char = text[self._pos]
+                if char == "{":
+                    self._start = self._pos
+                    self._depth = 1
+                elif char == "]":
+                    self._state = _DONE
+                self._pos += 1
+
+            else:
+                item = self._scan_object(text)
+                if item is not None:
+                    items.append(item)
+
+        self.items_emitted += len(items)
+        return items
+
+    def _scan_object(self, text):
+        """Advance through the current element; return it once it closes."""
+        pos = self._pos
+        end = len(text)
+        depth = self._depth
+        in_string = self._in_string
+        escaped = self._escaped
+
+        while pos < end:
+            char = text[pos]
+            pos += 1
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{" or char == "[":
+                depth += 1
+            elif char == "}" or char == "]":
+                depth -= 1
+                if depth == 0:
+                    start, self._start = self._start, None
+                    self._pos = pos
+                    self._depth, self._in_string, self._escaped = 0, False, False
+                    try:
+                        return json.loads(text[start:pos], strict=False)
+                    except ValueError:
+                        return None  # malformed element; the final full parse decides
+
+        self._pos = pos
+        self._depth, self._in_string, self._escaped = depth, in_string, escaped
+        return None
@@ -0,0 +1,30 @@
+"""
+Deferred imports for heavy dependencies.
+
+`lazy_import("anthropic")` registers the module right away but runs its code
+only when an attribute is first read. The web process, the batch CLI and the
+sanitization workers each import the whole execution package, but only
+some of them ever touch the LLM SDK.
+"""
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """The module `name`, loaded on first attribute access (already-imported modules are returned as is)."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def is_loaded(module):
+    """False while a lazily imported module has not run yet."""
+    return type(module).__name__ != "_LazyModule"
@@ -4,14 +4,26 @@ Medical Coding Audit Tool.
 2. Sends redacted text to Anthropic (Claude) for CPT Verification.
 """
 import sys
+import copy
 import json
 import os
-import anthropic
 from dotenv import load_dotenv
-from sanitize_phi import sanitize_text
+from sanitize_phi import resolve_sanitized_text
+from cache_utils import SQLiteCache, TieredCache, TTLCache, content_hash
+from lazy_import import lazy_import
+from json_stream import AuditResultsStreamParser
 import sqlite3
 import itertools
+import contextlib
 import re
+import threading
+import time
+from collections import deque
+from datetime import date
+
+# The SDK and its HTTP client are loaded on the first LLM call (or by prewarm), not at import
+anthropic = lazy_import("anthropic")
+httpx = lazy_import("httpx")
 
 # Load environment variables
 load_dotenv(override=False)
@@ -30,14 +42,269 @@ LLM_PROVIDER = os.getenv("LLM_PROVIDER", "bedrock") # Default to bedrock for AWS
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 BEDROCK_MODEL_ID = os.getenv("BEDROCK_MODEL_ID", "us.anthropic.claude-sonnet-4-5-20250929-v1:0")
 
-def query_bedrock(prompt, system_prompt):
+# LLM client pools (shared by every request in the process)
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10"))  # keep-alive connections per client
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "600"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+BEDROCK_ENDPOINT_URL = os.getenv("BEDROCK_ENDPOINT_URL")  # override, e.g. a local fake server
+
+# Token counts the Messages API reports per call. With prompt caching,
+# input_tokens covers only the uncached part of the prompt.
+USAGE_FIELDS = ("input_tokens", "cache_read_input_tokens", "cache_creation_input_tokens", "output_tokens")
+
+def read_usage(usage):
+    """USAGE_FIELDS counts from an SDK usage object or a raw API dict (missing counts are 0)."""
+    get = usage.get if isinstance(usage, dict) else lambda field: getattr(usage, field, None)
+    counts = {}
+    for field in USAGE_FIELDS:
+        value = get(field) if usage is not None else None
+        counts[field] = value if isinstance(value, int) else 0
+    return counts
+
+class LatencyStats:
+    """Count/mean/max plus p50/p95 over a window of recent samples, reported in ms."""
+
+    def __init__(self, window=1024):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        recent = sorted(self._samples)
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 2),
+            "p50_ms": round(recent[len(recent) // 2] * 1000, 2),
+            "p95_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+class _CallTrace:
+    """httpcore trace callback: timestamps every connection/HTTP event of one request."""
+    __slots__ = ("started", "events")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.events = {}
+
+    def __call__(self, name, info):
+        self.events[name] = time.perf_counter()
+
+    def _span(self, start, end):
+        if start in self.events and end in self.events:
+            return self.events[end] - self.events[start]
+        return None
+
+    def connect_seconds(self):
+        """TCP connect + TLS handshake, or None if a pooled connection was reused."""
+        tcp = self._span("connection.connect_tcp.started", "connection.connect_tcp.complete")
+        if tcp is None:
+            return None
+        return tcp + (self._span("connection.start_tls.started", "connection.start_tls.complete") or 0.0)
+
+    def ttfb_seconds(self):
+        """From sending the request headers to receiving the response headers."""
+        for proto in ("http11", "http2"):
+            span = self._span(f"{proto}.send_request_headers.started", f"{proto}.receive_response_headers.complete")
+            if span is not None:
+                return span
+        return None
+
+class LLMClientManager:
     """
-    Query AWS Bedrock (Claude 4.5 Sonnet).
+    Process-wide LLM clients, created lazily on first use and then reused, so
+    requests skip client construction, credential resolution and TLS
+    handshakes. Both SDK clients are thread-safe and keep a bounded pool of
+    keep-alive connections.
+
+    Token usage reported by each call is summed (`record_usage`); wrap an
+    audit in `track_usage()` to get its own totals as well.
+
+    Per-call latency is split into connect time (new connections only) and
+    time to first byte. Anthropic calls are timed with httpx trace hooks.
+    Bedrock goes through botocore/urllib3, which exposes no connect events,
+    so only its TTFB is recorded.
+    """
+
+    def __init__(self, pool_size=LLM_POOL_SIZE, connect_timeout=LLM_CONNECT_TIMEOUT,
+                 read_timeout=LLM_READ_TIMEOUT, max_retries=LLM_MAX_RETRIES):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._anthropic = None
+        self._bedrock = None
+        self._bedrock_calls = threading.local()
+        self.metrics = {"clients_created": 0, "calls": 0, "new_connections": 0}
+        self.usage = dict.fromkeys(USAGE_FIELDS, 0)
+        self._tracked = threading.local()
+        self.latency = {"connect": LatencyStats(), "ttfb": LatencyStats(), "total": LatencyStats()}
+
+    # --- Clients ---
+
+    def http_client(self):
+        """Shared keep-alive httpx pool (used by the Anthropic client)."""
+        if self._http_client is None:
+            with self._lock:
+                if self._http_client is None:
+                    self._http_client = httpx.Client(
+                        limits=httpx.Limits(max_connections=self.pool_size,
+                                            max_keepalive_connections=self.pool_size),
+                        timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                        event_hooks={"request": [self._start_trace], "response": [self._finish_trace]})
+        return self._http_client
+
+    def anthropic(self):
+        if self._anthropic is None:
+            http_client = self.http_client()
+            with self._lock:
+                if self._anthropic is None:
+                    self._anthropic = anthropic.Anthropic(
+                        api_key=ANTHROPIC_API_KEY,
+                        http_client=http_client,
+                        max_retries=self.max_retries,
+                        timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout))
+                    self.metrics["clients_created"] += 1
+        return self._anthropic
+
+    def bedrock(self):
+        if self._bedrock is None:
+            with self._lock:
+                if self._bedrock is None:
+                    import boto3
+                    from botocore.config import Config
+
+                    client = boto3.session.Session().client(
+                        service_name="bedrock-runtime",
+                        region_name=AWS_REGION,
+                        endpoint_url=BEDROCK_ENDPOINT_URL,
+                        config=Config(max_pool_connections=self.pool_size,
+                                      connect_timeout=self.connect_timeout,
+                                      read_timeout=self.read_timeout,
+                                      retries={"max_attempts": self.max_retries + 1, "mode": "standard"},
+                                      tcp_keepalive=True))
+                    client.meta.events.register("before-send.bedrock-runtime", self._bedrock_before_send)
+                    client.meta.events.register("response-received.bedrock-runtime", self._bedrock_response_received)
+                    self._bedrock = client
+                    self.metrics["clients_created"] += 1
+        return self._bedrock
+
+    def warm(self):
+        """Build the client for LLM_PROVIDER now (SDK import, credentials) instead of on the first audit."""
+        if LLM_PROVIDER.lower() == "bedrock":
+            return self.bedrock()
+        return self.anthropic()
+
+    def reset(self):
+        """Drop every client and its sockets (e.g. after a fork; sockets must not be shared)."""
+        with self._lock:
+            http_client, self._http_client = self._http_client, None
+            self._anthropic = None
+            self._bedrock = None
+        if http_client is not None:
+            http_client.close()
+
+    # --- Token usage ---
+
+    def record_usage(self, usage, into=None):
+        """Add one response's usage to the totals, to `into` and to the current `track_usage()` dict."""
+        counts = read_usage(usage)
+        with self._lock:
+            for field, value in counts.items():
+                self.usage[field] += value
+        for tracked in (into, getattr(self._tracked, "usage", None)):
+            if tracked is not None:
+                for field, value in counts.items():
+                    tracked[field] = tracked.get(field, 0) + value
+        return counts
+
+    @contextlib.contextmanager
+    def track_usage(self):
+        """Collect the usage of every call made by this thread inside the block into the yielded dict."""
+        previous = getattr(self._tracked, "usage", None)
+        usage = self._tracked.usage = dict.fromkeys(USAGE_FIELDS, 0)
+        try:
+            yield usage
+        finally:
+            self._tracked.usage = previous
+            if previous is not None:  # nested blocks count towards the outer one too
+                for field, value in usage.items():
+                    previous[field] += value
+
+    # --- Latency tracing ---
+
+    def _start_trace(self, request):
+        request.extensions["trace"] = _CallTrace()
+
+    def _finish_trace(self, response):
+        trace = response.request.extensions.get("trace")
+        if isinstance(trace, _CallTrace):
+            self._record(trace.connect_seconds(), trace.ttfb_seconds(), time.perf_counter() - trace.started)
+
+    def _bedrock_before_send(self, **kwargs):
+        self._bedrock_calls.started = time.perf_counter()
+
+    def _bedrock_response_received(self, **kwargs):
+        started = getattr(self._bedrock_calls, "started", None)
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            self._record(None, elapsed, elapsed)
+            self._bedrock_calls.started = None
+
+    def _record(self, connect, ttfb, total):
+        with self._lock:
+            self.metrics["calls"] += 1
+            if connect is not None:
+                self.metrics["new_connections"] += 1
+                self.latency["connect"].add(connect)
+            if ttfb is not None:
+                self.latency["ttfb"].add(ttfb)
+            self.latency["total"].add(total)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics,
+                        pool_size=self.pool_size,
+                        usage=dict(self.usage),
+                        latency={name: stats.summary() for name, stats in self.latency.items()})
+
+llm_clients = LLMClientManager()
+
+def tool_options(tool):
+    """Messages API arguments that force a call to `tool` (none if `tool` is None)."""
+    if tool is None:
+        return {}
+    return {"tools": [tool], "tool_choice": {"type": "tool", "name": tool["name"]}}
+
+def response_output(content):
+    """The input of the first tool_use block in a response, else its first text (SDK objects or raw dicts)."""
+    def field(block, name):
+        return block.get(name) if isinstance(block, dict) else getattr(block, name, None)
+
+    for block in content:
+        if field(block, "type") == "tool_use":
+            return field(block, "input")
+    return field(content[0], "text")
+
+def query_bedrock(prompt, system_prompt, tool=None):
+    """
+    Query AWS Bedrock (Claude 4.5 Sonnet). With `tool`, the model must call
+    it and the tool input (a dict) is returned instead of the text.
     """
-    import boto3
-    
     try:
-        client = boto3.client(service_name="bedrock-runtime", region_name=AWS_REGION)
+        client = llm_clients.bedrock()
         
         # Claude 3 Messages API payload for Bedrock
         body = json.dumps({
@@ -47,7 +314,8 @@ def query_bedrock(prompt, system_prompt):
             "system": system_prompt,
             "messages": [
                 {"role": "user", "content": prompt}
-            ]
+            ],
+            **tool_options(tool)
         })
         
         response = client.invoke_model(
@@ -58,27 +326,29 @@ def query_bedrock(prompt, system_prompt):
         )
         
         response_body = json.loads(response.get("body").read())
+        llm_clients.record_usage(response_body.get("usage"))
         content_list = response_body.get("content", [])
         if not content_list:
              logger.error(f"Bedrock returned empty content list. Full Body: {response_body}")
              return None
              
-        text_content = content_list[0].get("text")
-        if not text_content:
-             logger.error(f"Bedrock returned empty text. Full Body: {response_body}")
+        output = response_output(content_list)
+        if not output:
+             logger.error(f"Bedrock returned empty output. Full Body: {response_body}")
              
-        return text_content
+        return output
         
     except Exception as e:
         logger.error(f"Error querying AWS Bedrock: {e}")
         raise e
 
-def query_anthropic(prompt, system_prompt):
+def query_anthropic(prompt, system_prompt, tool=None):
     """
     Router function: Queries either Bedrock or Anthropic Direct based on LLM_PROVIDER.
+    Returns the response text, or the tool input when `tool` is given.
     """
     if LLM_PROVIDER.lower() == "bedrock":
-        return query_bedrock(prompt, system_prompt)
+        return query_bedrock(prompt, system_prompt, tool)
         
     # Fallback to Direct Anthropic API
     if not ANTHROPIC_API_KEY:
@@ -87,7 +357,7 @@ def query_anthropic(prompt, system_prompt):
         
     logger.debug(f"Loaded API Key: {ANTHROPIC_API_KEY[:4]}... (Length: {len(ANTHROPIC_API_KEY)})")
     
-    client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+    client = llm_clients.anthropic()
     
     try:
         response = client.messages.create(
@@ -97,109 +367,217 @@ def query_anthropic(prompt, system_prompt):
             system=system_prompt,
             messages=[
                 {"role": "user", "content": prompt}
-            ]
+            ],
+            **tool_options(tool)
         )
-        return response.content[0].text
+        llm_clients.record_usage(response.usage)
+        return response_output(response.content)
     except Exception as e:
         logger.error(f"Error querying Anthropic: {e}")
         raise e
 
+def stream_bedrock(prompt, system_prompt):
+    """
+    Stream text deltas from AWS Bedrock (InvokeModelWithResponseStream).
+    """
+    client = llm_clients.bedrock()
+    body = json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 4096,
+        "temperature": 0,
+        "system": system_prompt,
+        "messages": [
+            {"role": "user", "content": prompt}
+        ]
+    })
+    response = client.invoke_model_with_response_stream(
+        body=body,
+        modelId=BEDROCK_MODEL_ID,
+        accept="application/json",
+        contentType="application/json"
+    )
+    usage = {}
+    for event in response.get("body"):
+        chunk = json.loads(event["chunk"]["bytes"]) if "chunk" in event else {}
+        if chunk.get("type") == "content_block_delta":
+            text = chunk.get("delta", {}).get("text")
+            if text:
+                yield text
+        elif chunk.get("type") == "message_start":
+            usage.update(chunk.get("message", {}).get("usage", {}))
+        elif chunk.get("type") == "message_delta":
+            usage.update(chunk.get("usage", {}))
+    llm_clients.record_usage(usage)
+
+def stream_anthropic(prompt, system_prompt):
+    """
+    Streaming router: yields response text deltas from Bedrock or Anthropic Direct.
+    """
+    if LLM_PROVIDER.lower() == "bedrock":
+        yield from stream_bedrock(prompt, system_prompt)
+        return
+
+    if not ANTHROPIC_API_KEY:
+        raise ValueError("ANTHROPIC_API_KEY not found in .env file.")
+
+    with llm_clients.anthropic().messages.stream(
+        model=MODEL_NAME,
+        max_tokens=4096,
+        temperature=0,
+        system=system_prompt,
+        messages=[
+            {"role": "user", "content": prompt}
+        ]
+    ) as stream:
+        yield from stream.text_stream
+        llm_clients.record_usage(stream.get_final_message().usage)
+
+from execution.coding_rules import CodingRulesDB, ClaimRules, get_rules_db, normalize_date_of_service
 from execution.cpt_data import CPT_DEFINITIONS
 
-class CodingRulesDB:
-    def __init__(self, db_path="coding_rules.db"):
-        self.db_path = db_path
-        
-    def get_connection(self):
-        try:
-            return sqlite3.connect(self.db_path)
-        except sqlite3.Error as e:
-            logger.error(f"Error connecting to DB: {e}")
-            return None
+AUDIT_SYSTEM_PROMPT = "You are an EXPERT Medical Quality Auditor known for precision and strict adherence to CPT guidelines. You also validate ICD-10 Diagnosis specificity."
 
-    def check_mue(self, code, user_units):
-        conn = self.get_connection()
-        if not conn: return None
-        
-        cursor = conn.cursor()
-        cursor.execute("SELECT max_units, mai, rationale FROM mue_limits WHERE hcpcs_code=?", (code,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            max_units, mai, rationale = row
-            if user_units > max_units:
-                return {
-                    "alert": "HIGH - MUE EXCEEDED", 
-                    "limit": max_units, 
-                    "mai": mai,
-                    "rationale": f"MAI {mai} indicates specific rules apply. {rationale}"
-                }
-        return None
+# Static part of every audit request: instructions, output format and the
+# CPT reference. It is sent as the system prompt and marked for prompt
+# caching, so calls and retries within the cache TTL only pay for the claim.
+# Anthropic ignores cache_control on prefixes under the model minimum (1024
+# tokens for Sonnet); the CPT reference keeps the block above it. Without
+# caching the reference would be paid for on every call, so it is left out
+# and the claim carries the definitions of its own codes instead.
+AUDIT_INSTRUCTIONS = """ROLE: You are an expert Medical Coding Auditor. Perform a two-step audit of the CPT codes in the CLAIM message against its clinical documentation.
 
-    def get_cpt_description(self, code):
-        """Fetch short description from DB."""
-        conn = self.get_connection()
-        if not conn: return None
-        
-        cursor = conn.cursor()
-        cursor.execute("SELECT short_desc FROM cpt_codes WHERE code=?", (code,))
-        row = cursor.fetchone()
-        conn.close()
-        return row[0] if row else None
-
-    def check_ncci(self, codes):
-        """
-        Optimized Batch NCCI Check.
-        Instead of iterating permutations (N^2), we do one query.
-        """
-        if not codes or len(codes) < 2: return []
-        
-        conn = self.get_connection()
-        if not conn: return []
-        
-        cursor = conn.cursor()
-        alerts = []
-        
-        # Prepare placeholders for IN clause
-        placeholders = ','.join(['?'] * len(codes))
-        
-        # Optimization: Fetch ALL edges where both nodes are in our code list.
-        # This is strictly O(1) query roundtrip instead of O(N^2).
-        query = f"""
-            SELECT column1_code, column2_code, modifier_indicator 
-            FROM ncci_edits 
-            WHERE column1_code IN ({placeholders}) 
-              AND column2_code IN ({placeholders})
-        """
-        
-        # We pass the list twice (once for col1, once for col2)
-        params = codes + codes
-        
-        try:
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
-            
-            for row in rows:
-                c1, c2, mod_ind = row
-                # c1 is Column 1 (Comprehensive), c2 is Column 2 (Component)
-                # If we found a row, it means c2 bundles into c1.
-                
-                # Check if it's a self-reference (rare data error, but possible)
-                if c1 == c2: continue
-
-                alerts.append({
-                    "code": c2, # The component code causing the issue
-                    "conflict_with": c1,
-                    "mod_indicator": mod_ind,
-                    "alert": f"HIGH - NCCI BUNDLING (Bundles into {c1})"
-                })
-                
-        except sqlite3.Error as e:
-            logger.error(f"DB Error during NCCI check: {e}")
-            
-        conn.close()
-        return alerts
+STEP 1: DOCUMENTATION VERIFICATION
+- Verify if the text supports the code description.
+- INDEPENDENTLY calculate the 'correct' supported units based on measurements.
+- MATH: If definition says "each additional X cm or part thereof", round up (2.1 = 3).
+
+STEP 2: REIMBURSEMENT RISK ANALYSIS
+- SYSTEM ALERTS in the claim are FACTUAL database checks. Do not dispute them; explain them, using their exact rationale.
+- Check for "Cloned Note" or "Copy-Billed" text.
+- Validate medical necessity.
+
+STEP 3: DIAGNOSIS VALIDATION
+- Check if the diagnosis codes listed support the CPT codes.
+- Flag any VAGUE or UNSPECIFIED codes (e.g., Unspecified side, Unspecified injury, Z-codes for encounters) as HIGH RISK.
+
+CRITICAL OUTPUT RULES:
+1. You MUST return a result object for EVERY SINGLE CPT CODE listed in the claim.
+2. Do NOT skip codes. If 5 codes are input, 5 results must be returned.
+3. Even if a code is clearly supported or clearly wrong, it MUST be in the "audit_results" array.
+4. If the CPT code is invalid or unknown, mark it as FAIL and explain why.
+5. Use the CPT REFERENCE (when given) and the claim's additional CPT definitions for code definitions.
+
+OUTPUT FORMAT (JSON ONLY):
+{"audit_results": [{"code": "CPT Code", "documentation_status": "PASS" or "FAIL" or "PARTIAL", "clinical_evidence": "One sentence quote from text or 'No evidence found'", "calculated_units": "Integer (Your independent count derived from text)", "billing_risk_alert": "NONE" or "HIGH - MUE EXCEEDED" or "HIGH - NCCI BUNDLING", "risk_rationale": "Clear explanation. If Risk exists, use the human-readable explanation from SYSTEM ALERTS."}, ... (Repeat for ALL input codes)],
+ "diagnosis_analysis": "Summary paragraph validating diagnosis specificity. Use Markdown bullet points for readability.",
+ "documentation_improvement": "Advice for the provider. Use Markdown bullet points for readability."}"""
+
+CPT_REFERENCE = "CPT REFERENCE:\n" + "\n".join(f"- {code}: {definition}"
+                                                for code, definition in CPT_DEFINITIONS.items())
+
+# Per-claim part (user message), filled with str.format
+AUDIT_CLAIM_TEMPLATE = """CLAIM
+CPT codes: {cpt_codes}
+Billed units: {units_json}
+Diagnosis codes: {diagnosis_codes}
+Additional CPT definitions: {cpt_context}
+SYSTEM ALERTS: {system_alerts}
+Clinical documentation:
+\"\"\"
+{sanitized_text}
+\"\"\""""
+
+# Mark the static prefix with cache_control (Anthropic and Bedrock)
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "True").lower() == "true"
+
+def audit_system_prompt():
+    """
+    System prompt for an audit call. With PROMPT_CACHE on, the static prefix
+    and CPT reference as a cacheable block; otherwise just the instructions.
+    """
+    text = f"{AUDIT_SYSTEM_PROMPT}\n\n{AUDIT_INSTRUCTIONS}"
+    if not PROMPT_CACHE:
+        return text
+    return [{"type": "text", "text": f"{text}\n\n{CPT_REFERENCE}", "cache_control": {"type": "ephemeral"}}]
+
+# How the model returns its answer: "tool" forces a record_audit tool call
+# whose input follows AUDIT_TOOL's schema; "json" parses JSON out of the
+# response text. Streaming always uses text, which it parses as it arrives.
+AUDIT_OUTPUT_MODE = os.getenv("AUDIT_OUTPUT_MODE", "tool").lower()
+AUDIT_MAX_LLM_CALLS = 3  # per audit, counting retries and repair requests
+
+AUDIT_STATUSES = ("PASS", "FAIL", "PARTIAL")
+
+AUDIT_TOOL = {
+    "name": "record_audit",
+    "description": "Record the audit result for the CPT codes in the claim.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "audit_results": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "code": {"type": "string"},
+                        "documentation_status": {"type": "string", "enum": list(AUDIT_STATUSES)},
+                        "clinical_evidence": {"type": "string"},
+                        "calculated_units": {"type": "integer", "minimum": 0},
+                        "billing_risk_alert": {"type": "string"},
+                        "risk_rationale": {"type": "string"},
+                    },
+                    "required": ["code", "documentation_status", "clinical_evidence", "calculated_units",
+                                 "billing_risk_alert", "risk_rationale"],
+                },
+            },
+            "diagnosis_analysis": {"type": "string"},
+            "documentation_improvement": {"type": "string"},
+        },
+        "required": ["audit_results"],
+    },
+}
+
+# Appended to the claim when only some entries of an answer need redoing
+AUDIT_REPAIR_TEMPLATE = """{prompt}
+
+REPAIR: Your previous answer had missing or invalid "audit_results" entries for these codes:
+{problems}
+Return "audit_results" with entries for ONLY these codes."""
+
+# Any edit to the prompt text (or the CPT reference inside it) changes this,
+# so cached results from an older prompt are never served.
+PROMPT_VERSION = content_hash(AUDIT_SYSTEM_PROMPT, AUDIT_INSTRUCTIONS, CPT_REFERENCE, AUDIT_CLAIM_TEMPLATE,
+                              AUDIT_REPAIR_TEMPLATE, json.dumps(AUDIT_TOOL, sort_keys=True))[:16]
+
+# Audit result cache: memory LRU, plus an optional SQLite file shared by workers/restarts
+AUDIT_CACHE_SIZE = int(os.getenv("AUDIT_CACHE_SIZE", "512"))
+AUDIT_CACHE_TTL = int(os.getenv("AUDIT_CACHE_TTL", "86400"))
+AUDIT_CACHE_DB = os.getenv("AUDIT_CACHE_DB")  # e.g. .tmp/audit_cache.db; unset = memory only
+AUDIT_CACHE_DISK_ENTRIES = int(os.getenv("AUDIT_CACHE_DISK_ENTRIES", "20000"))
+audit_cache = TieredCache(
+    TTLCache(max_entries=AUDIT_CACHE_SIZE, ttl_seconds=AUDIT_CACHE_TTL),
+    SQLiteCache(AUDIT_CACHE_DB, max_entries=AUDIT_CACHE_DISK_ENTRIES, ttl_seconds=AUDIT_CACHE_TTL)
+    if AUDIT_CACHE_DB else None)
+
+# Lines that NCCI/MUE rules alone decide are answered without the model
+AUDIT_FAST_PATH = os.getenv("AUDIT_FAST_PATH", "True").lower() == "true"
+
+def active_model_id():
+    return BEDROCK_MODEL_ID if LLM_PROVIDER.lower() == "bedrock" else MODEL_NAME
+
+def audit_cache_key(sanitized_text, cpt_codes, units_map, diagnosis_codes, date_of_service, rules_version):
+    """
+    Content address of an audit: everything that can change its result.
+    Whitespace is collapsed and code lists are sorted, so trivial UI edits and
+    reordering still hit.
+    """
+    codes = sorted(set(cpt_codes))
+    units = {code: int((units_map or {}).get(code, 1)) for code in codes}
+    return content_hash(
+        PROMPT_VERSION, "fast-path" if AUDIT_FAST_PATH else "llm-only",
+        LLM_PROVIDER.lower(), active_model_id(), str(rules_version), date_of_service or "",
+        " ".join(sanitized_text.split()),
+        json.dumps(codes), json.dumps(units, sort_keys=True), json.dumps(sorted(set(diagnosis_codes or []))))
 
 def get_readable_rationale(alert_Data):
     """
@@ -240,21 +618,87 @@ def audit_medical_record(raw_text, cpt_data, diagnosis_codes):
     
     # Normalize Inputs
     cpt_list = [] # Just codes for LLM
-def audit_medical_record(raw_text, cpt_list, diagnosis_codes, units_map=None):
+def decisive_alerts(alerts):
     """
-    Main orchestration function.
-    1. Sanitizes Text
-    2. Checks DB Rules (NCCI / MUE)
-    3. Prompts Claude (Agent)
+    The alerts that settle a line without reading the documentation:
+    NCCI indicator 0 (never payable with its column 1 code, no modifier
+    override) and MUE with MAI 2 (absolute per-day limit, not appealable).
+    """
+    decisive = []
+    for a in alerts:
+        if a.get('conflict_with') == "MUE LIMIT":
+            if str(a.get('mai')).strip().startswith("2"):
+                decisive.append(a)
+        elif str(a.get('mod_indicator')) == '0':
+            decisive.append(a)
+    return decisive
+
+def triage_claim(cpt_codes, claim_rules, ncci_alerts):
+    """
+    Pre-LLM triage. Returns (decided, llm_codes): finished audit_results
+    entries for lines the rules decide, and the codes still needing the model.
     """
+    decided = []
+    llm_codes = []
+    for code in dict.fromkeys(cpt_codes):
+        decisive = decisive_alerts(ncci_alerts.get(code, ())) if AUDIT_FAST_PATH else []
+        if not decisive:
+            llm_codes.append(code)
+            continue
+        item = {
+            "code": code,
+            "documentation_status": "NOT REVIEWED",
+            "clinical_evidence": "Not reviewed: the line is decided by NCCI/MUE rules regardless of documentation.",
+            "calculated_units": str(claim_rules.units(code)),
+            "billing_risk_alert": "NONE",
+            "risk_rationale": "",
+            "decision_path": "rules",
+        }
+        decided.append(merge_deterministic_findings(item, claim_rules, ncci_alerts))
+    return decided, llm_codes
+
+def order_results(items, cpt_codes):
+    """Sort audit_results into the claim's line order (unknown codes last)."""
+    position = {code: i for i, code in reversed(list(enumerate(cpt_codes)))}
+    return sorted(items, key=lambda item: position.get(item.get("code"), len(position)))
+
+class PreparedAudit:
+    """
+    Everything an audit needs before the LLM call, shared by the blocking and
+    streaming paths. `cached` holds a finished result on a cache hit (the
+    remaining fields are then unset). `decided` holds the entries settled by
+    triage; `prompt` is None when no line is left for the model.
+    """
+    __slots__ = ("cpt_codes", "cache_key", "cached", "claim_rules", "ncci_alerts", "prompt", "system_prompt",
+                 "decided")
+
+    def __init__(self, cpt_codes, cache_key=None, cached=None, claim_rules=None, ncci_alerts=None,
+                 prompt=None, system_prompt=None, decided=()):
+        self.cpt_codes = cpt_codes
+        self.cache_key = cache_key
+        self.cached = cached
+        self.claim_rules = claim_rules
+        self.ncci_alerts = ncci_alerts
+        self.prompt = prompt
+        self.system_prompt = system_prompt
+        self.decided = list(decided)
+
+def prepare_audit(raw_text, cpt_list, diagnosis_codes, units_map=None,
+                  sanitization_token=None, pre_sanitized=False, date_of_service=None,
+                  use_cache=True):
+    """Steps 1-2 of an audit: sanitize, look up NCCI/MUE rules, check the cache and build the prompt."""
     # Normalize input
     if isinstance(cpt_list, str): cpt_list = [cpt_list]
     cpt_codes = cpt_list # Use this for rest of function
     
     if isinstance(diagnosis_codes, str): diagnosis_codes = [diagnosis_codes]
 
-    logger.info("Step 1: Sanitizing PHI locally...")
-    sanitized_text, _ = sanitize_text(raw_text)
+    if pre_sanitized:
+        logger.info("Step 1: Using pre-sanitized text (PHI pass skipped).")
+        sanitized_text = raw_text
+    else:
+        logger.info("Step 1: Sanitizing PHI locally...")
+        sanitized_text, _ = resolve_sanitized_text(raw_text, sanitization_token)
     logger.info(f"Sanitized Text Preview: {sanitized_text[:100]}...")
     
     # Log Active Provider
@@ -262,245 +706,494 @@ def audit_medical_record(raw_text, cpt_list, diagnosis_codes, units_map=None):
     if LLM_PROVIDER.lower() == "bedrock":
         logger.info(f"Bedrock Region: {AWS_REGION}, Model: {BEDROCK_MODEL_ID}")
     
-    # Retrieve definitions for all codes
-    # Priority: 
-    # 1. Augmented Rules (CPT_DEFINITIONS) - Contains custom logic/requirements
-    # 2. Official Short Desc (DB) - Fallback
-    
-    db = CodingRulesDB()
+    # --- DB Rules Check ---
+    # One batched lookup feeds both the prompt and the post-processing merge
+    date_of_service = normalize_date_of_service(date_of_service or date.today())
+    rules_db = get_rules_db()
+
+    cache_key = None
+    if use_cache:
+        cache_key = audit_cache_key(sanitized_text, cpt_codes, units_map, diagnosis_codes,
+                                    date_of_service, rules_db.rules_version)
+        cached = audit_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Audit cache hit: returning stored result (LLM skipped).")
+            return PreparedAudit(cpt_codes, cache_key, cached=copy.deepcopy(cached))
+
+    claim_rules = rules_db.lookup_claim(cpt_codes, units_map, date_of_service=date_of_service)
+
+    # NCCI bundling + MUE (billed units vs limits), keyed by code
+    ncci_alerts = claim_rules.alerts_by_code()
+
+    # Lines the rules alone decide never reach the model
+    decided, llm_codes = triage_claim(cpt_codes, claim_rules, ncci_alerts)
+    if decided:
+        logger.info(f"Fast path: {[d['code'] for d in decided]} decided by NCCI/MUE rules.")
+    if not llm_codes:
+        logger.info("Every line decided by rules; LLM skipped.")
+        return PreparedAudit(cpt_codes, cache_key, claim_rules=claim_rules, ncci_alerts=ncci_alerts,
+                             decided=decided)
+
+    # Definitions for reviewed codes that the cached CPT reference does not
+    # cover; every reviewed code when the reference is not sent
     cpt_context = ""
-    
-    for code in cpt_codes:
-        definition = CPT_DEFINITIONS.get(code)
-        
-        if not definition:
-            # Fallback to DB
-            desc = db.get_cpt_description(code)
-            if desc:
-                definition = f"{desc} (Official Short Description)"
-            else:
-                definition = "No internal definition found - relying on general knowledge."
-        
-        cpt_context += f"- CPT {code}: {definition}\n"
+    for code in llm_codes:
+        if not PROMPT_CACHE or code not in CPT_DEFINITIONS:
+            cpt_context += f"\n- CPT {code}: {claim_rules.definition(code)}"
 
-    logger.info(f"Step 2: Auditing CPTs {cpt_codes} against documentation...")
+    logger.info(f"Step 2: Auditing CPTs {llm_codes} against documentation...")
     logger.debug(f"Definitions:\n{cpt_context}")
     
-    system_prompt = "You are an EXPERT Medical Quality Auditor known for precision and strict adherence to CPT guidelines. You also validate ICD-10 Diagnosis specificity."
-    
-    # --- DB Rules Check ---
-    db = CodingRulesDB()
-    mue_alerts = {}
-    ncci_alerts = {}
-    
-    # 1. NCCI Checks
-    ncci_findings = db.check_ncci(cpt_codes)
-    for finding in ncci_findings:
-        # Map alert to the code
-        code = finding['code']
-        if code not in ncci_alerts:
-            ncci_alerts[code] = []
-        ncci_alerts[code].append(finding)
-
-    # 2. MUE Checks (Verify User Billing Units vs Limits)
-    for code in cpt_codes:
-        # Determine user units (default to 1 if not provided)
-        user_units = 1
-        if units_map and code in units_map:
-            user_units = units_map[code]
-            
-        mue_finding = db.check_mue(code, user_units)
-        
-        if mue_finding:
-            # Map alert to code
-            if code not in ncci_alerts:
-                ncci_alerts[code] = []
-            
-            # Add MUE Alert
-            # Store raw data for processing, but also make a friendly alert string
-            alert_obj = {
-                "code": code,
-                "conflict_with": "MUE LIMIT",
-                "mod_indicator": f"MAI {mue_finding['mai']}",
-                "limit": mue_finding['limit'],
-                "billed": user_units,
-                "mai": mue_finding['mai'],
-                "alert": f"HIGH - MUE EXCEEDED"
-            }
-            ncci_alerts[code].append(alert_obj)
+    system_prompt = audit_system_prompt()
 
     # 3. Generate Human Readable Context for LLM
     # We want the LLM to see the 'Translated' reasoning, not raw MAI codes
     risk_context_str = ""
     for code, alerts in ncci_alerts.items():
-        risk_context_str += f"\n- Code {code} Risks:\n"
+        if code not in llm_codes:
+            continue
+        risk_context_str += f"\n- Code {code}:"
         for a in alerts:
             readable = get_readable_rationale(a)
-            risk_context_str += f"  * {a['alert']}: {readable}\n"
+            risk_context_str += f"\n  * {a['alert']}: {readable}"
 
-    prompt = f"""
-    ROLE: You are an expert Medical Coding Auditor. 
-    Your task is to perform a two-step audit on the provided CPT codes based on the clinical text.
-    
-    INPUT DATA:
-    - CPT Codes: {cpt_codes}
-    - Billed Units: {json.dumps(units_map)}
-    - Diagnosis Codes: {diagnosis_codes}
-    - CPT Definitions: {cpt_context}
-    - SYSTEM ALERTS (These are FACTUAL database checks. Do not dispute them. explain them):
-      {risk_context_str if risk_context_str else "None."}
-    - Clinical Documentation: 
-    \"\"\"
-    {sanitized_text}
-    \"\"\"
-    
-    INSTRUCTIONS:
-    
-    STEP 1: DOCUMENTATION VERIFICATION
-    - Verify if the text supports the code description.
-    - INDEPENDENTLY calculate the 'correct' supported units based on measurements.
-    - MATH: If definition says "each additional X cm or part thereof", round up (2.1 = 3).
-    
-    STEP 2: REIMBURSEMENT RISK ANALYSIS
-    - Apply the SYSTEM ALERTS provided above. Use the exact rationale provided in SYSTEM ALERTS.
-    - Check for "Cloned Node" or "Copy-Billed" text.
-    - Validate medical necessity.
-    
-    STEP 2: DIAGNOSIS VALIDATION
-    - Check if the diagnosis codes listed support the CPT codes.
-    - Flag any VAGUE or UNSPECIFIED codes (e.g., Unspecified side, Unspecified injury, Z-codes for encounters) as HIGH RISK.
-    
-    CRITICAL OUTPUT RULES:
-    1. You MUST return a result object for EVERY SINGLE CPT CODE listed in "INPUT DATA". 
-    2. Do NOT skip codes. If 5 codes are input, 5 results must be returned.
-    3. Even if a code is clearly supported or clearly wrong, it MUST be in the "audit_results" array.
-    4. If the CPT code is invalid or unknown, mark it as FAIL and explain why.
-
-    OUTPUT FORMAT (JSON ONLY):
-    Respond strictly in this JSON structure:
-    
-    {{
-        "audit_results": [
-            {{
-                "code": "CPT Code",
-                "documentation_status": "PASS" or "FAIL" or "PARTIAL",
-                "clinical_evidence": "One sentence quote from text or 'No evidence found'",
-                "calculated_units": "Integer (Your independent count derived from text)",
-                "billing_risk_alert": "NONE" or "HIGH - MUE EXCEEDED" or "HIGH - NCCI BUNDLING",
-                "risk_rationale": "Clear explanation. If Risk exists, use the human-readable explanation from SYSTEM ALERTS."
-            }}
-            ... (Repeat for ALL input codes)
-        ],
-        "diagnosis_analysis": "Summary paragraph validating diagnosis specificity. Use Markdown bullet points for readability.",
-        "documentation_improvement": "Advice for the provider. Use Markdown bullet points for readability."
-    }}
-    """
-    
-    
-    max_retries = 3
-    last_error = None
-    
-    for attempt in range(max_retries):
+    prompt = AUDIT_CLAIM_TEMPLATE.format(
+        cpt_codes=json.dumps(llm_codes),
+        units_json=json.dumps({code: units for code, units in (units_map or {}).items() if code in llm_codes}),
+        diagnosis_codes=json.dumps(diagnosis_codes),
+        cpt_context=cpt_context or "None.",
+        system_alerts=risk_context_str or "None.",
+        sanitized_text=sanitized_text.strip())
+
+    return PreparedAudit(cpt_codes, cache_key, claim_rules=claim_rules, ncci_alerts=ncci_alerts,
+                         prompt=prompt, system_prompt=system_prompt, decided=decided)
+
+def extract_json(response_text):
+    """Parse the model's JSON answer, tolerating markdown fences and surrounding prose."""
+    # Robust JSON Extraction
+    # 1. Try finding a markdown block first
+    json_match = re.search(r"```(?:json)?(.*?)```", response_text, re.DOTALL)
+    if json_match:
+        cleaned_text = json_match.group(1).strip()
+    else:
+        # 2. Key fallback: Find first { and last }
+        start = response_text.find('{')
+        end = response_text.rfind('}')
+        if start != -1 and end != -1:
+            cleaned_text = response_text[start:end+1]
+        else:
+            cleaned_text = response_text.strip()
+
+    return json.loads(cleaned_text, strict=False)
+
+class InvalidAuditOutput(ValueError):
+    """A model answer that cannot be used at all; `reason` is its metrics label."""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+def parse_audit_output(output):
+    """The answer as a dict with an `audit_results` list of objects, from tool input or response text."""
+    if not output:
+        raise InvalidAuditOutput("empty", "Empty response from LLM")
+    if isinstance(output, str):
         try:
-            response_text = query_anthropic(prompt, system_prompt)
-            if not response_text:
-                raise ValueError("Empty response from LLM")
-                
-            # Robust JSON Extraction
-            # 1. Try finding a markdown block first
-            json_match = re.search(r"```(?:json)?(.*?)```", response_text, re.DOTALL)
-            if json_match:
-                cleaned_text = json_match.group(1).strip()
+            output = extract_json(output)
+        except ValueError as e:
+            raise InvalidAuditOutput("unparseable", f"Response is not valid JSON: {e}")
+    if not isinstance(output, dict) or not isinstance(output.get("audit_results"), list):
+        raise InvalidAuditOutput("schema", "Response has no audit_results list")
+    output["audit_results"] = [item for item in output["audit_results"] if isinstance(item, dict)]
+    return output
+
+def audit_entry_problem(item):
+    """Why an audit_results entry does not follow AUDIT_TOOL's schema, or None if it does."""
+    if item.get("documentation_status") not in AUDIT_STATUSES:
+        return "invalid documentation_status"
+    units = item.get("calculated_units")
+    if isinstance(units, bool) or not (isinstance(units, int) or (isinstance(units, str) and units.strip().isdigit())):
+        return "invalid calculated_units"
+    for field in ("clinical_evidence", "billing_risk_alert", "risk_rationale"):
+        if not isinstance(item.get(field), str):
+            return f"missing {field}"
+    return None
+
+def audit_output_problems(answer, codes):
+    """{code: problem} for each of `codes` without a valid audit_results entry in `answer`."""
+    found = {}
+    for item in answer["audit_results"]:
+        code = item.get("code")
+        if code in codes and found.get(code, "missing") is not None:
+            found[code] = audit_entry_problem(item)
+    problems = {code: found.get(code, "missing") for code in codes}
+    return {code: problem for code, problem in problems.items() if problem is not None}
+
+class AuditOutputStats:
+    """Process-wide counters: LLM calls per audit, failed calls by reason, and entry repairs by problem."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.metrics = {"audits": 0, "llm_calls": 0, "valid_first_answer": 0, "repair_requests": 0,
+                        "repaired_codes": 0, "unrepaired_codes": 0, "failed_audits": 0}
+        self.failed_calls = {}    # reason -> LLM calls whose answer could not be used
+        self.entry_problems = {}  # problem -> audit_results entries that needed a repair
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.metrics[name] += n
+
+    def count_reason(self, table, reason):
+        with self._lock:
+            table[reason] = table.get(reason, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics, failed_calls=dict(self.failed_calls), entry_problems=dict(self.entry_problems))
+
+audit_output_stats = AuditOutputStats()
+
+class AuditOutput:
+    """
+    The model's answer for one audit, built over at most `max_calls` LLM
+    calls. An unusable answer (empty, not JSON, no audit_results) is asked
+    for again in full. When only some entries are missing or invalid, just
+    those codes are requested (AUDIT_REPAIR_TEMPLATE) and the fixed entries
+    replace the bad ones. Callers loop:
+
+        while (prompt := output.next_prompt()) is not None:
+            try:
+                output.feed(query_anthropic(prompt, audit.system_prompt, **output.query_options))
+            except Exception as e:
+                output.failed(e)
+    """
+
+    def __init__(self, audit, max_calls=AUDIT_MAX_LLM_CALLS, stats=None):
+        self.audit = audit
+        decided = {item["code"] for item in audit.decided}
+        self.codes = [code for code in dict.fromkeys(audit.cpt_codes) if code not in decided]
+        self.max_calls = max_calls
+        self.stats = stats or audit_output_stats
+        self.calls = 0
+        self.result_json = None
+        self.problems = {}  # code -> problem, still to repair
+        self.repaired = set()
+        self.last_error = None
+        self.stats.count("audits")
+
+    @property
+    def query_options(self):
+        return {"tool": AUDIT_TOOL} if AUDIT_OUTPUT_MODE == "tool" else {}
+
+    def next_prompt(self):
+        """The prompt for the next call, or None when the answer is complete or no calls are left."""
+        if self.calls >= self.max_calls or (self.result_json is not None and not self.problems):
+            return None
+        self.calls += 1
+        self.stats.count("llm_calls")
+        if self.result_json is None:
+            return self.audit.prompt
+        self.stats.count("repair_requests")
+        problems = "\n".join(f"- {code}: {problem}" for code, problem in self.problems.items())
+        return AUDIT_REPAIR_TEMPLATE.format(prompt=self.audit.prompt, problems=problems)
+
+    def feed(self, output):
+        """Take the answer to the last prompt. Raises InvalidAuditOutput if it is unusable."""
+        answer = parse_audit_output(output)
+        if self.result_json is None:
+            self.result_json = answer
+            self.problems = audit_output_problems(answer, self.codes)
+            if not self.problems:
+                self.stats.count("valid_first_answer")
+            for problem in self.problems.values():
+                self.stats.count_reason(self.stats.entry_problems, problem)
+            return
+
+        remaining = audit_output_problems(answer, list(self.problems))
+        results = self.result_json["audit_results"]
+        for item in answer["audit_results"]:
+            code = item.get("code")
+            if code not in self.problems or code in remaining or code in self.repaired:
+                continue
+            stale = next((i for i, old in enumerate(results) if old.get("code") == code), None)
+            if stale is None:
+                results.append(item)
             else:
-                # 2. Key fallback: Find first { and last }
-                start = response_text.find('{')
-                end = response_text.rfind('}')
-                if start != -1 and end != -1:
-                    cleaned_text = response_text[start:end+1]
-                else:
-                    cleaned_text = response_text.strip()
-    
-            result_json = json.loads(cleaned_text, strict=False)
-            break # Success!
-            
+                results[stale] = item
+            self.repaired.add(code)
+            self.stats.count("repaired_codes")
+        for key in ("diagnosis_analysis", "documentation_improvement"):
+            if key not in self.result_json and key in answer:
+                self.result_json[key] = answer[key]
+        self.problems = remaining
+
+    def failed(self, error):
+        """Record a call that raised or whose answer was unusable."""
+        self.last_error = error
+        reason = getattr(error, "reason", "error")
+        self.stats.count_reason(self.stats.failed_calls, reason)
+        logger.warning(f"LLM call {self.calls}/{self.max_calls} failed ({reason}): {error}")
+
+    def result(self):
+        """The answer (with any entries that could not be repaired left as they were), or None."""
+        if self.result_json is None:
+            self.stats.count("failed_audits")
+            return None
+        if self.problems:
+            self.stats.count("unrepaired_codes", len(self.problems))
+            logger.warning(f"Audit answer still missing or invalid for {self.problems}")
+        return self.result_json
+
+    def error(self):
+        return {"error": f"LLM failed after {self.calls} attempts. Last error: {self.last_error}"}
+
+def query_audit_output(output):
+    """Complete `output` with blocking LLM calls; returns `output.result()`."""
+    while (prompt := output.next_prompt()) is not None:
+        try:
+            output.feed(query_anthropic(prompt, output.audit.system_prompt, **output.query_options))
         except Exception as e:
-            logger.warning(f"Attempt {attempt + 1}/{max_retries} failed: {e}")
-            last_error = e
-            if attempt == max_retries - 1:
-                return {"error": f"LLM failed after {max_retries} attempts. Last error: {str(last_error)}"}
-        
-    # --- POST-PROCESS: INJECT DETERMINISTIC NCCI/MUE DATA ---
-    if "audit_results" in result_json:
-        for item in result_json["audit_results"]:
-            code = item.get("code")
-            user_units = units_map.get(code, 1)
-            item["billed_units"] = user_units # Pass back to frontend
-            
-            # Check Unit Discrepancy
-            calc_units = item.get("calculated_units")
-            try:
-                calc_val = int(calc_units) if calc_units else 0
-                if calc_val != user_units:
-                    # Add a discrepancy alert if risk is currently NONE (or append)
-                    disc_msg = f"Unit Discrepancy: Billed {user_units} but Doc supports {calc_val}. "
-                    
-                    current_risk = item.get("billing_risk_alert", "NONE")
-                    if current_risk == "NONE":
-                        item["billing_risk_alert"] = "UNIT DISCREPANCY"
-                        item["risk_rationale"] = disc_msg + item.get('risk_rationale', '')
-                    else:
-                        # Prepend to rationale
-                        item["risk_rationale"] = disc_msg + item.get('risk_rationale', '')
-                        
-            except:
-                pass
-
-            # Overwrite/Append NCCI info from DB if exists
-            if code in ncci_alerts:
-                details = ncci_alerts[code]
-                
-                # Determine highest priority risk
-                # If MUE exists, it's usually High.
-                # NCCI is also High.
-                
-                # Build consolidated human readable string
-                reasons = []
-                risks = []
-                for d in details:
-                    # Use our new human readable helper
-                    reasons.append(get_readable_rationale(d))
-                    risks.append(d['alert'])
-
-                # Consolidate Risk Label
-                if any("MUE" in r for r in risks):
-                    item["billing_risk_alert"] = "HIGH - MUE EXCEEDED"
-                elif any("NCCI" in r for r in risks):
-                    item["billing_risk_alert"] = "HIGH - NCCI BUNDLING"
-                
-                current = item.get("risk_rationale", "")
-                clean_db_rationale = " | ".join(reasons)
-                
-                # Merge Logic:
-                # DB Rationale (The Rules) + LLM Rationale (The Clinical Context)
-                # Avoid duplication if LLM just repeated the rule.
-                
-                combined_rationale = clean_db_rationale
-                
-                if "Unit Discrepancy" in current:
-                    # Extract discrepancy part
-                    disc_part = current.split("Unit Discrepancy")[1].split(".")[0]
-                    combined_rationale = f"Unit Discrepancy{disc_part}. {combined_rationale}"
-                    # Remove discrepancy from current to check rest
-                    current = current.replace(f"Unit Discrepancy{disc_part}.", "").strip()
-
-                # Append clinical context if meaningful and short
-                if current and len(current) > 10 and current not in clean_db_rationale:
-                    combined_rationale += f"\n[Clinical Note]: {current}"
-                    
-                item["risk_rationale"] = combined_rationale
+            output.failed(e)
+    return output.result()
+
+def merge_deterministic_findings(item, claim_rules, ncci_alerts):
+    """
+    Post-process one audit_results entry: inject billed units, flag unit
+    discrepancies and overwrite/append the deterministic NCCI/MUE findings.
+    Mutates and returns `item`.
+    """
+    code = item.get("code")
+    user_units = claim_rules.units(code)
+    item["billed_units"] = user_units # Pass back to frontend
+    item.setdefault("decision_path", "llm")
+
+    # Check Unit Discrepancy
+    calc_units = item.get("calculated_units")
+    try:
+        calc_val = int(calc_units) if calc_units else 0
+        if calc_val != user_units:
+            # Add a discrepancy alert if risk is currently NONE (or append)
+            disc_msg = f"Unit Discrepancy: Billed {user_units} but Doc supports {calc_val}. "
+
+            current_risk = item.get("billing_risk_alert", "NONE")
+            if current_risk == "NONE":
+                item["billing_risk_alert"] = "UNIT DISCREPANCY"
+                item["risk_rationale"] = disc_msg + item.get('risk_rationale', '')
+            else:
+                # Prepend to rationale
+                item["risk_rationale"] = disc_msg + item.get('risk_rationale', '')
+
+    except:
+        pass
+
+    # Overwrite/Append NCCI info from DB if exists
+    if code in ncci_alerts:
+        details = ncci_alerts[code]
+
+        # Determine highest priority risk
+        # If MUE exists, it's usually High.
+        # NCCI is also High.
 
+        # Build consolidated human readable string
+        reasons = []
+        risks = []
+        for d in details:
+            # Use our new human readable helper
+            reasons.append(get_readable_rationale(d))
+            risks.append(d['alert'])
+
+        # Consolidate Risk Label
+        if any("MUE" in r for r in risks):
+            item["billing_risk_alert"] = "HIGH - MUE EXCEEDED"
+        elif any("NCCI" in r for r in risks):
+            item["billing_risk_alert"] = "HIGH - NCCI BUNDLING"
+
+        current = item.get("risk_rationale", "")
+        clean_db_rationale = " | ".join(reasons)
+
+        # Merge Logic:
+        # DB Rationale (The Rules) + LLM Rationale (The Clinical Context)
+        # Avoid duplication if LLM just repeated the rule.
+
+        combined_rationale = clean_db_rationale
+
+        if "Unit Discrepancy" in current:
+            # Extract discrepancy part
+            disc_part = current.split("Unit Discrepancy")[1].split(".")[0]
+            combined_rationale = f"Unit Discrepancy{disc_part}. {combined_rationale}"
+            # Remove discrepancy from current to check rest
+            current = current.replace(f"Unit Discrepancy{disc_part}.", "").strip()
+
+        # Append clinical context if meaningful and short
+        if current and len(current) > 10 and current not in clean_db_rationale:
+            combined_rationale += f"\n[Clinical Note]: {current}"
+
+        item["risk_rationale"] = combined_rationale
+
+    return item
+
+# Returned in place of the model's narrative when triage leaves nothing to review
+RULES_ONLY_RESULT = {
+    "diagnosis_analysis": "Not reviewed: every line was decided by NCCI/MUE rules, so the documentation was not sent for review.",
+    "documentation_improvement": "None.",
+}
+
+def finish_audit(audit, result_json, merged_items=(), problems=None):
+    """
+    Merge deterministic findings into every entry not already merged (the
+    streaming path merges entries as they arrive), add the lines decided by
+    triage in claim order, and cache the result. An answer with `problems`
+    (entries still missing or invalid after the last repair) is not cached,
+    so the next run of the claim asks the model again.
+    """
+    if "audit_results" in result_json:
+        merged_items = list(merged_items)
+        llm_items = merged_items + [
+            merge_deterministic_findings(item, audit.claim_rules, audit.ncci_alerts)
+            for item in result_json["audit_results"][len(merged_items):]
+        ]
+        if audit.decided:
+            # The model may still comment on a decided line; the rules win
+            decided_codes = {item["code"] for item in audit.decided}
+            llm_items = [item for item in llm_items if item.get("code") not in decided_codes]
+            llm_items = order_results(llm_items + audit.decided, audit.cpt_codes)
+        result_json["audit_results"] = llm_items
+        if audit.cache_key and not problems:
+            audit_cache.put(audit.cache_key, copy.deepcopy(result_json))
     return result_json
 
+def rules_only_result(audit):
+    """Finish an audit whose every line was decided by triage (no LLM call)."""
+    return finish_audit(audit, dict(RULES_ONLY_RESULT, audit_results=[]))
+
+def audit_medical_record(raw_text, cpt_list, diagnosis_codes, units_map=None,
+                         sanitization_token=None, pre_sanitized=False, date_of_service=None,
+                         use_cache=True):
+    """
+    Main orchestration function.
+    1. Sanitizes Text
+    2. Checks DB Rules (NCCI / MUE)
+    3. Prompts Claude (Agent)
+
+    Sanitization is skipped when the caller already holds a result:
+    - `sanitization_token`: token returned by `sanitize_session` (/sanitize).
+      Reused only if `raw_text` is unchanged since that session.
+    - `pre_sanitized=True`: `raw_text` is trusted as already redacted
+      (internal callers only; never set this from client input).
+
+    NCCI edits are evaluated as of `date_of_service` (date or "YYYY-MM-DD",
+    default today), so deleted edits stop firing and future ones don't fire early.
+
+    Results are cached by content (see `audit_cache_key`); `use_cache=False`
+    forces a fresh LLM call.
+
+    Lines decided by NCCI indicator 0 or an exceeded MAI 2 MUE are answered
+    from the rules (`decision_path: "rules"`); only the rest go to the model,
+    which is not called at all if nothing is left.
+    """
+    audit = prepare_audit(raw_text, cpt_list, diagnosis_codes, units_map, sanitization_token,
+                          pre_sanitized, date_of_service, use_cache)
+    return complete_audit(audit)
+
+def log_audit_usage(audit, usage):
+    """Log the tokens one audit used, over all its attempts."""
+    logger.info(f"Audit tokens for {len(audit.cpt_codes)} codes: input {usage['input_tokens']} "
+                f"(+{usage['cache_read_input_tokens']} cache read, +{usage['cache_creation_input_tokens']} cache write), "
+                f"output {usage['output_tokens']}")
+
+def complete_audit(audit):
+    """Step 3 of an audit: call the model (unless cached or fully decided by rules) and merge."""
+    if audit.cached is not None:
+        return audit.cached
+    if audit.prompt is None:
+        return rules_only_result(audit)
+
+    output = AuditOutput(audit)
+    with llm_clients.track_usage() as usage:
+        result_json = query_audit_output(output)
+    log_audit_usage(audit, usage)
+    if result_json is None:
+        return output.error()
+
+    # --- POST-PROCESS: INJECT DETERMINISTIC NCCI/MUE DATA ---
+    return finish_audit(audit, result_json, problems=output.problems)
+
+def stream_audit_medical_record(raw_text, cpt_list, diagnosis_codes, units_map=None,
+                                sanitization_token=None, pre_sanitized=False, date_of_service=None,
+                                use_cache=True):
+    """
+    Streaming variant of `audit_medical_record`. Yields (event, data) pairs:
+    - ("start", {"codes": [...], "cached": bool})
+    - ("result", entry): one merged audit_results entry; lines decided by
+      triage first, then each model entry as soon as the model finishes it
+    - ("replace", entry): a repaired entry for a code already sent as a
+      result; it supersedes that row (each code is sent as "result" once)
+    - ("complete", result): the full result, identical to `audit_medical_record`
+    - ("error", {"error": message})
+    A failed attempt is retried only if no entry has been sent yet.
+    """
+    audit = prepare_audit(raw_text, cpt_list, diagnosis_codes, units_map, sanitization_token,
+                          pre_sanitized, date_of_service, use_cache)
+    yield "start", {"codes": audit.cpt_codes, "cached": audit.cached is not None}
+    if audit.cached is not None:
+        for item in audit.cached.get("audit_results", []):
+            yield "result", item
+        yield "complete", audit.cached
+        return
+
+    for item in audit.decided:
+        yield "result", item
+    if audit.prompt is None:
+        yield "complete", rules_only_result(audit)
+        return
+
+    decided_codes = {item["code"] for item in audit.decided}
+    with llm_clients.track_usage() as usage:
+        yield from _stream_model_results(audit, decided_codes)
+    log_audit_usage(audit, usage)
+
+def _stream_model_results(audit, decided_codes):
+    """The model part of `stream_audit_medical_record`, with its retries and repairs."""
+    output = AuditOutput(audit)
+    while output.result_json is None and output.next_prompt() is not None:
+        parser = AuditResultsStreamParser()
+        merged = []
+        try:
+            for delta in stream_anthropic(audit.prompt, audit.system_prompt):
+                for item in parser.feed(delta):
+                    merged.append(merge_deterministic_findings(item, audit.claim_rules, audit.ncci_alerts))
+                    if item.get("code") not in decided_codes:
+                        yield "result", merged[-1]
+            output.feed(parser.text)
+        except Exception as e:
+            output.failed(e)
+            if merged:
+                break
+    if output.result_json is None:
+        output.result()  # records the failed audit
+        yield "error", {"error": f"LLM stream failed: {output.last_error}"}
+        return
+
+    # Missing or invalid entries are requested without streaming, then sent as they come back
+    result_json = query_audit_output(output)
+    if output.repaired:
+        result = finish_audit(audit, result_json, problems=output.problems)
+        sent = {item.get("code") for item in merged} | decided_codes
+        for item in result["audit_results"]:
+            code = item.get("code")
+            if code not in sent:
+                yield "result", item
+            elif code in output.repaired:
+                yield "replace", item
+    else:
+        # Entries the incremental parser could not split out are merged (and sent) now
+        result = finish_audit(audit, result_json, merged, output.problems)
+        sent = {id(item) for item in merged + audit.decided}
+        for item in result.get("audit_results", []):
+            if id(item) not in sent:
+                yield "result", item
+    yield "complete", result
+
 def print_human_readable_result(result):
     if "error" in result:
         print(f"\nERROR: {result['error']}")
@@ -552,7 +1245,7 @@ def consult_auditor(context_text, audit_results, question):
     """
     Follow-up chat with the Auditor Agent.
     """
-    client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+    client = llm_clients.anthropic()
     
     # Construct context from the previous audit
     # We want the agent to know what it previously decided.
@@ -0,0 +1,282 @@
+"""
+In-process NCCI/MUE rule engine with compact array-backed indexes.
+
+Loads `ncci_edits`, `mue_limits` and `cpt_codes` once and answers the same
+queries as CodingRulesDB without touching SQLite:
+- Codes are interned to integer IDs (their position in the sorted code list).
+- NCCI edits are a CSR adjacency list keyed by the column 1 code:
+  `ncci_offsets[id]:ncci_offsets[id + 1]` is the sorted slice of column 2 IDs
+  in `ncci_targets`, so a pairwise check is one bisect.
+- Modifier indicators are packed 2 bits per edge.
+- Effective/deletion dates are per-edge uint32 YYYYMMDD arrays parallel to
+  `ncci_targets`, so a date-of-service check is two integer compares on an
+  edge that has already been found.
+- MUE limits and descriptions are per-code arrays pointing into a shared
+  string table.
+
+For 2.3M edges this is roughly 4 bytes per edge plus the code table, versus
+well over 100 bytes per edge for a dict of tuples.
+"""
+import logging
+import pathlib
+import sqlite3
+import threading
+from array import array
+from bisect import bisect_left
+
+from execution.coding_rules import ClaimRules, CodingRulesDB, normalize_date_of_service, read_rules_version
+
+logger = logging.getLogger(__name__)
+
+# 2-bit modifier indicator encoding. Anything unexpected is kept as "?" rather
+# than dropped, so the edge still fires.
+MOD_INDICATORS = ("0", "1", "9", "?")
+_MOD_CODES = {value: i for i, value in enumerate(MOD_INDICATORS)}
+
+NO_ENTRY = -1
+
+# Deletion date for edits that are still active ("*" in the NCCI files)
+OPEN_ENDED = 0xFFFFFFFF
+
+
+def date_key(value):
+    """YYYYMMDD string -> integer for array storage; non-dates map to OPEN_ENDED."""
+    value = str(value or "")
+    return int(value) if value.isdigit() else OPEN_ENDED
+
+
+class CompactRulesIndex:
+    """
+    Array-backed replacement for CodingRulesDB.
+    Build with `from_sqlite` (or `from_rows` for tests/benchmarks).
+    """
+
+    def __init__(self, codes, ncci_offsets, ncci_targets, ncci_mods, ncci_effective, ncci_deletion,
+                 mue_units, mue_mai, mue_rationale, cpt_desc, strings, rules_version=0):
+        self.codes = codes                  # sorted code strings; index == code ID
+        self.ncci_offsets = ncci_offsets    # uint32[len(codes) + 1]
+        self.ncci_targets = ncci_targets    # uint32[edges], sorted within each row
+        self.ncci_mods = ncci_mods          # 2-bit packed modifier indicators
+        self.ncci_effective = ncci_effective  # uint32[edges] YYYYMMDD
+        self.ncci_deletion = ncci_deletion  # uint32[edges] YYYYMMDD, OPEN_ENDED if none
+        self.mue_units = mue_units          # int32[len(codes)], NO_ENTRY if no MUE row
+        self.mue_mai = mue_mai              # int32 string IDs
+        self.mue_rationale = mue_rationale  # int32 string IDs
+        self.cpt_desc = cpt_desc            # int32 string IDs
+        self.strings = strings              # shared string table
+        self.rules_version = rules_version  # rules_version row the index was built from
+        self._code_ids = {code: i for i, code in enumerate(codes)}
+        self._lock = threading.Lock()
+        self.metrics = {"queries": 0}
+
+    # --- Construction ---
+
+    @classmethod
+    def from_rows(cls, ncci_rows, mue_rows=(), cpt_rows=()):
+        """
+        ncci_rows: (column1_code, column2_code, modifier_indicator[, effective_date, deletion_date])
+                   (edits without dates are always active)
+        mue_rows: (hcpcs_code, max_units, mai, rationale)
+        cpt_rows: (code, short_desc)
+        """
+        ncci_rows = sorted(ncci_rows)
+        mue_rows = list(mue_rows)
+        cpt_rows = list(cpt_rows)
+        codes = sorted({c for row in ncci_rows for c in row[:2]}
+                       | {row[0] for row in mue_rows}
+                       | {row[0] for row in cpt_rows})
+        return cls._build(codes, ncci_rows, mue_rows, cpt_rows)
+
+    @classmethod
+    def from_sqlite(cls, db_path):
+        """Stream the rules tables out of coding_rules.db into compact arrays."""
+        conn = sqlite3.connect(pathlib.Path(db_path).absolute().as_uri() + "?mode=ro", uri=True)
+        try:
+            codes = [row[0] for row in conn.execute("""
+                SELECT column1_code FROM ncci_edits
+                UNION SELECT column2_code FROM ncci_edits
+                UNION SELECT hcpcs_code FROM mue_limits
+                UNION SELECT code FROM cpt_codes
+                ORDER BY 1
+            """)]
+            # Primary key order == (column 1 ID, column 2 ID) order, so the
+            # CSR arrays can be filled in a single streaming pass.
+            ncci_rows = conn.execute("""
+                SELECT column1_code, column2_code, modifier_indicator, effective_date, deletion_date
+                FROM ncci_edits ORDER BY column1_code, column2_code
+            """)
+            mue_rows = conn.execute("SELECT hcpcs_code, max_units, mai, rationale FROM mue_limits")
+            cpt_rows = conn.execute("SELECT code, short_desc FROM cpt_codes")
+            index = cls._build(codes, ncci_rows, mue_rows, cpt_rows)
+            index.rules_version = read_rules_version(conn)
+            return index
+        finally:
+            conn.close()
+
+    @classmethod
+    def _build(cls, codes, sorted_ncci_rows, mue_rows, cpt_rows):
+        code_ids = {code: i for i, code in enumerate(codes)}
+        n = len(codes)
+
+        ncci_offsets = array("I", [0]) * (n + 1)
+        ncci_targets = array("I")
+        ncci_mods = bytearray()
+        ncci_effective = array("I")
+        ncci_deletion = array("I")
+        for c1, c2, mod_ind, *dates in sorted_ncci_rows:
+            edge = len(ncci_targets)
+            ncci_targets.append(code_ids[c2])
+            effective_date, deletion_date = dates or (None, None)
+            ncci_effective.append(date_key(effective_date) if effective_date else 0)
+            ncci_deletion.append(date_key(deletion_date))
+            if edge % 4 == 0:
+                ncci_mods.append(0)
+            ncci_mods[edge >> 2] |= _MOD_CODES.get(str(mod_ind), 3) << ((edge & 3) * 2)
+            ncci_offsets[code_ids[c1] + 1] += 1
+
+        # Row counts -> cumulative offsets
+        for i in range(n):
+            ncci_offsets[i + 1] += ncci_offsets[i]
+
+        strings = []
+        string_ids = {}
+
+        def intern(value):
+            if value is None:
+                return NO_ENTRY
+            if value not in string_ids:
+                string_ids[value] = len(strings)
+                strings.append(value)
+            return string_ids[value]
+
+        mue_units = array("i", [NO_ENTRY]) * n
+        mue_mai = array("i", [NO_ENTRY]) * n
+        mue_rationale = array("i", [NO_ENTRY]) * n
+        for code, max_units, mai, rationale in mue_rows:
+            i = code_ids[code]
+            mue_units[i] = int(max_units)
+            mue_mai[i] = intern(mai)
+            mue_rationale[i] = intern(rationale)
+
+        cpt_desc = array("i", [NO_ENTRY]) * n
+        for code, desc in cpt_rows:
+            cpt_desc[code_ids[code]] = intern(desc)
+
+        return cls(codes, ncci_offsets, ncci_targets, bytes(ncci_mods), ncci_effective, ncci_deletion,
+                   mue_units, mue_mai, mue_rationale, cpt_desc, strings)
+
+    # --- Primitive lookups ---
+
+    def code_id(self, code):
+        return self._code_ids.get(code, NO_ENTRY)
+
+    def string(self, string_id):
+        return self.strings[string_id] if string_id != NO_ENTRY else None
+
+    def edge_index(self, c1_id, c2_id):
+        """Position of the (column 1, column 2) edge in ncci_targets, or NO_ENTRY."""
+        lo = self.ncci_offsets[c1_id]
+        hi = self.ncci_offsets[c1_id + 1]
+        i = bisect_left(self.ncci_targets, c2_id, lo, hi)
+        if i < hi and self.ncci_targets[i] == c2_id:
+            return i
+        return NO_ENTRY
+
+    def modifier_indicator(self, edge):
+        return MOD_INDICATORS[(self.ncci_mods[edge >> 2] >> ((edge & 3) * 2)) & 3]
+
+    def edge_active(self, edge, dos_key):
+        """True if the edge is in effect on dos_key (YYYYMMDD int); deletion date is exclusive."""
+        return self.ncci_effective[edge] <= dos_key < self.ncci_deletion[edge]
+
+    def _mue_row(self, code_id):
+        if code_id == NO_ENTRY or self.mue_units[code_id] == NO_ENTRY:
+            return None
+        return (self.mue_units[code_id],
+                self.string(self.mue_mai[code_id]),
+                self.string(self.mue_rationale[code_id]))
+
+    def _ncci_rows(self, codes, dos_key=None):
+        ids = sorted({i for i in map(self.code_id, codes) if i != NO_ENTRY})
+        id_set = set(ids)
+        rows = []
+        for c1_id in ids:
+            lo = self.ncci_offsets[c1_id]
+            hi = self.ncci_offsets[c1_id + 1]
+            if lo == hi:
+                continue
+            if hi - lo > 8 * len(ids):
+                # Long row: one bisect per claim code beats scanning the row
+                hits = [c2_id for c2_id in ids if self.edge_index(c1_id, c2_id) != NO_ENTRY]
+            else:
+                # Short row: C-level set intersection over the row slice
+                hits = sorted(id_set.intersection(self.ncci_targets[lo:hi]))
+            for c2_id in hits:
+                if c2_id == c1_id:
+                    continue
+                edge = bisect_left(self.ncci_targets, c2_id, lo, hi)
+                if dos_key is not None and not self.edge_active(edge, dos_key):
+                    continue
+                rows.append((self.codes[c1_id], self.codes[c2_id], self.modifier_indicator(edge)))
+        return rows
+
+    def _count_query(self):
+        with self._lock:
+            self.metrics["queries"] += 1
+
+    # --- CodingRulesDB interface ---
+
+    def check_mue(self, code, user_units):
+        self._count_query()
+        row = self._mue_row(self.code_id(code))
+        return CodingRulesDB.mue_alert(row, user_units) if row else None
+
+    def get_cpt_description(self, code):
+        self._count_query()
+        code_id = self.code_id(code)
+        return self.string(self.cpt_desc[code_id]) if code_id != NO_ENTRY else None
+
+    @staticmethod
+    def _dos_key(date_of_service):
+        dos = normalize_date_of_service(date_of_service)
+        return (dos, int(dos)) if dos else (None, None)
+
+    def check_ncci(self, codes, date_of_service=None):
+        if not codes or len(codes) < 2: return []
+        self._count_query()
+        _, dos_key = self._dos_key(date_of_service)
+        return [CodingRulesDB.ncci_alert(c1, c2, mod_ind) for c1, c2, mod_ind in self._ncci_rows(codes, dos_key)]
+
+    def lookup_claim(self, codes, units_map=None, date_of_service=None):
+        self._count_query()
+        dos, dos_key = self._dos_key(date_of_service)
+        claim = ClaimRules(list(codes), units_map, date_of_service=dos)
+        for code in dict.fromkeys(codes):
+            code_id = self.code_id(code)
+            if code_id == NO_ENTRY:
+                continue
+            desc = self.string(self.cpt_desc[code_id])
+            if desc is not None:
+                claim.descriptions[code] = desc
+            row = self._mue_row(code_id)
+            if row:
+                claim.mue_rows[code] = row
+        claim.ncci_rows = self._ncci_rows(codes, dos_key)
+        return claim
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics,
+                        engine=type(self).__name__,
+                        rules_version=self.rules_version,
+                        codes=len(self.codes),
+                        ncci_edges=len(self.ncci_targets),
+                        index_bytes=self.index_bytes())
+
+    def index_bytes(self):
+        arrays = (self.ncci_offsets, self.ncci_targets, self.ncci_effective, self.ncci_deletion, self.mue_units,
+                  self.mue_mai, self.mue_rationale, self.cpt_desc)
+        return sum(a.itemsize * len(a) for a in arrays) + len(self.ncci_mods)
+
+    def close(self):
+        pass
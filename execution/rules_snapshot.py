@@ -0,0 +1,257 @@
+"""
+Memory-mapped, precompiled rules snapshot.
+
+`ingest_coding_rules.py` writes the CompactRulesIndex arrays to a flat binary
+file. At runtime `RulesSnapshot` mmaps that file and reads it through
+zero-copy memoryviews, so opening it costs the same regardless of rule count
+and the OS page cache is shared by every worker process.
+
+Layout (native little-endian, sections 8-byte aligned):
+    header      magic, format version, counts, code width, rules version
+    sections    (offset, length) for each entry in SECTIONS
+    codes       sorted fixed-width ASCII codes, NUL padded
+    ...         one section per CompactRulesIndex array
+    strings     string_offsets (uint32[count + 1]) + UTF-8 string_data
+"""
+import contextlib
+import mmap
+import os
+import struct
+import sys
+import threading
+from bisect import bisect_left
+
+from execution.rules_engine import CompactRulesIndex, NO_ENTRY
+
+MAGIC = b"NCCISNAP"
+FORMAT_VERSION = 3
+
+# Section name -> memoryview format ("B" = raw bytes)
+SECTIONS = (
+    ("codes", "B"),
+    ("ncci_offsets", "I"),
+    ("ncci_targets", "I"),
+    ("ncci_mods", "B"),
+    ("ncci_effective", "I"),
+    ("ncci_deletion", "I"),
+    ("mue_units", "i"),
+    ("mue_mai", "i"),
+    ("mue_rationale", "i"),
+    ("cpt_desc", "i"),
+    ("string_offsets", "I"),
+    ("string_data", "B"),
+)
+
+# magic, format version, code count, code width, edge count, string count, rules version
+_HEADER = struct.Struct("<8sIIIIII")
+_SECTION = struct.Struct("<QQ")      # offset, length in bytes
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class _FixedWidthCodes:
+    """Read-only sequence view over the NUL-padded code table (bisect-able)."""
+
+    def __init__(self, view, width):
+        self._view = view
+        self._width = width
+
+    def __len__(self):
+        return len(self._view) // self._width
+
+    def __getitem__(self, i):
+        if i < 0 or i >= len(self):
+            raise IndexError(i)
+        start = i * self._width
+        return bytes(self._view[start:start + self._width]).rstrip(b"\0").decode("ascii")
+
+
+def write_snapshot(index, path):
+    """
+    Serialize a CompactRulesIndex to `path`.
+    Written to a temp file and renamed into place, so readers never see a
+    partial snapshot.
+    """
+    if sys.byteorder != "little":
+        raise SnapshotError("Snapshots are written in little-endian order only.")
+
+    width = max((len(code) for code in index.codes), default=1)
+    encoded_strings = [s.encode("utf-8") for s in index.strings]
+    string_offsets = [0]
+    for data in encoded_strings:
+        string_offsets.append(string_offsets[-1] + len(data))
+
+    payloads = {
+        "codes": b"".join(code.encode("ascii").ljust(width, b"\0") for code in index.codes),
+        "ncci_offsets": index.ncci_offsets.tobytes(),
+        "ncci_targets": index.ncci_targets.tobytes(),
+        "ncci_mods": bytes(index.ncci_mods),
+        "ncci_effective": index.ncci_effective.tobytes(),
+        "ncci_deletion": index.ncci_deletion.tobytes(),
+        "mue_units": index.mue_units.tobytes(),
+        "mue_mai": index.mue_mai.tobytes(),
+        "mue_rationale": index.mue_rationale.tobytes(),
+        "cpt_desc": index.cpt_desc.tobytes(),
+        "string_offsets": struct.pack(f"<{len(string_offsets)}I", *string_offsets),
+        "string_data": b"".join(encoded_strings),
+    }
+
+    offset = _HEADER.size + _SECTION.size * len(SECTIONS)
+    table = []
+    for name, _ in SECTIONS:
+        offset = (offset + 7) & ~7
+        table.append((offset, len(payloads[name])))
+        offset += len(payloads[name])
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(index.codes), width,
+                             len(index.ncci_targets), len(index.strings), index.rules_version))
+        for entry in table:
+            f.write(_SECTION.pack(*entry))
+        for (name, _), (section_offset, _) in zip(SECTIONS, table):
+            f.write(b"\0" * (section_offset - f.tell()))
+            f.write(payloads[name])
+    os.replace(tmp_path, path)
+    return offset
+
+
+class RulesSnapshot(CompactRulesIndex):
+    """
+    CompactRulesIndex backed by an mmapped snapshot file.
+    Nothing is copied or decoded up front; codes are found by binary search
+    over the fixed-width code table (memoized per code once seen) and strings
+    are decoded on access.
+
+    `close()` unmaps the file once in-flight lookups have finished; lookups
+    started after it raise SnapshotError.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        self._views = [view]  # released in reverse order on close
+
+        try:
+            magic, version, code_count, width, edge_count, _, rules_version = _HEADER.unpack_from(view, 0)
+        except struct.error:
+            raise SnapshotError(f"{path} is too small to be a rules snapshot.")
+        if magic != MAGIC:
+            raise SnapshotError(f"{path} is not a rules snapshot.")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"{path} has snapshot format v{version}; expected v{FORMAT_VERSION}. Re-run ingest_coding_rules.py.")
+
+        sections = {}
+        for i, (name, fmt) in enumerate(SECTIONS):
+            offset, length = _SECTION.unpack_from(view, _HEADER.size + i * _SECTION.size)
+            section = view[offset:offset + length]
+            self._views.append(section)
+            if fmt != "B":
+                section = section.cast(fmt)
+                self._views.append(section)
+            sections[name] = section
+
+        self.codes = _FixedWidthCodes(sections["codes"], width)
+        self.ncci_offsets = sections["ncci_offsets"]
+        self.ncci_targets = sections["ncci_targets"]
+        self.ncci_mods = sections["ncci_mods"]
+        self.ncci_effective = sections["ncci_effective"]
+        self.ncci_deletion = sections["ncci_deletion"]
+        self.mue_units = sections["mue_units"]
+        self.mue_mai = sections["mue_mai"]
+        self.mue_rationale = sections["mue_rationale"]
+        self.cpt_desc = sections["cpt_desc"]
+        self._string_offsets = sections["string_offsets"]
+        self._string_data = sections["string_data"]
+        self.rules_version = rules_version
+        self._code_ids = {}  # filled lazily as codes are looked up
+        self._lock = threading.Lock()
+        self._readers = 0
+        self._closing = False
+        self.metrics = {"queries": 0}
+
+        if len(self.codes) != code_count or len(self.ncci_targets) != edge_count:
+            raise SnapshotError(f"{path} is truncated or corrupt.")
+
+    @contextlib.contextmanager
+    def _reading(self):
+        """Hold the mapping open for one lookup."""
+        with self._lock:
+            if self._closing:
+                raise SnapshotError(f"Rules snapshot {self.path} is closed.")
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._readers -= 1
+                release = self._closing and self._readers == 0
+            if release:
+                self._release()
+
+    def check_mue(self, code, user_units):
+        with self._reading():
+            return super().check_mue(code, user_units)
+
+    def get_cpt_description(self, code):
+        with self._reading():
+            return super().get_cpt_description(code)
+
+    def check_ncci(self, codes, date_of_service=None):
+        with self._reading():
+            return super().check_ncci(codes, date_of_service)
+
+    def lookup_claim(self, codes, units_map=None, date_of_service=None):
+        with self._reading():
+            return super().lookup_claim(codes, units_map, date_of_service)
+
+    def code_id(self, code):
+        i = self._code_ids.get(code)
+        if i is not None:
+            return i
+        i = bisect_left(self.codes, code)
+        if i < len(self.codes) and self.codes[i] == code:
+            # Only real codes are memoized, so junk input cannot grow the map
+            self._code_ids[code] = i
+            return i
+        return NO_ENTRY
+
+    def string(self, string_id):
+        if string_id == NO_ENTRY:
+            return None
+        start = self._string_offsets[string_id]
+        end = self._string_offsets[string_id + 1]
+        return bytes(self._string_data[start:end]).decode("utf-8")
+
+    def index_bytes(self):
+        return len(self._mmap)
+
+    def stats(self):
+        with self._reading():
+            return dict(super().stats(), snapshot_path=self.path)
+
+    def close(self):
+        """Unmap the file now, or when the last in-flight lookup finishes."""
+        with self._lock:
+            if self._closing:
+                return
+            self._closing = True
+            release = self._readers == 0
+        if release:
+            self._release()
+
+    def _release(self):
+        # The mmap cannot close while any view of it is alive
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._code_ids = {}
+        self._mmap.close()
+
+    @property
+    def closed(self):
+        return self._mmap.closed
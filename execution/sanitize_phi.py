@@ -1,71 +1,121 @@
 """
 Sanitize PHI from medical text using Microsoft Presidio.
 Run locally to ensure privacy before sending data to LLMs.
+
+Presidio and spaCy are imported when the analyzer / anonymizer are first
+built (see `prewarm`), not when this module is imported.
 """
+import os
+import re
 import sys
-from presidio_analyzer import AnalyzerEngine, PatternRecognizer, Pattern
-from presidio_anonymizer import AnonymizerEngine
-from presidio_anonymizer.entities import OperatorConfig
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from cache_utils import SQLiteCache, TieredCache, TTLCache, content_hash
+
+# Custom recognizer patterns
+MRN_REGEX = r"\b(mrn|acct|account|visit|pat|id)\s*#?[:\.-]?\s*([0-9\-]+)"
+PATIENT_NAME_REGEX = r"(?:patient\s+name|patient)\s*[:\.-]\s*([A-Za-z,\s]+?)(?:\s{2,}|\n|$)"
+
+# --- NLP engine ---
+# Presidio only reads entities and lemmas from the spaCy doc. The tagger,
+# parser and friends are loaded (and run on every document) for nothing.
+# A profile picks the model and the components to leave out; SPACY_MODEL /
+# SPACY_EXCLUDE override either half. The chosen model must be installed.
+NER_ONLY = ("tok2vec", "tagger", "parser", "senter", "attribute_ruler", "lemmatizer")
+NLP_PROFILES = {
+    "full": ("en_core_web_lg", ()),         # the whole pipeline (default)
+    "lg-ner": ("en_core_web_lg", NER_ONLY),
+    "md-ner": ("en_core_web_md", NER_ONLY),
+    "sm-ner": ("en_core_web_sm", NER_ONLY),
+}
+SANITIZE_NLP_PROFILE = os.getenv("SANITIZE_NLP_PROFILE", "full")
+if SANITIZE_NLP_PROFILE not in NLP_PROFILES:
+    raise ValueError(f"Unknown SANITIZE_NLP_PROFILE {SANITIZE_NLP_PROFILE!r}; expected one of {sorted(NLP_PROFILES)}")
+SPACY_MODEL = os.getenv("SPACY_MODEL") or NLP_PROFILES[SANITIZE_NLP_PROFILE][0]
+SPACY_EXCLUDE = tuple(name.strip() for name in os.getenv("SPACY_EXCLUDE", ",".join(NLP_PROFILES[SANITIZE_NLP_PROFILE][1])).split(",")
+                      if name.strip())
 
 # Initialize engines lazily
-# Note: This requires 'en_core_web_lg' to be installed.
 analyzer = None
-anonymizer = AnonymizerEngine()
+anonymizer = None
 
 def get_analyzer():
     global analyzer
     if analyzer is None:
-        analyzer = AnalyzerEngine()
+        from presidio_analyzer import AnalyzerEngine, PatternRecognizer, Pattern
+        from spacy_engine import TrimmedSpacyNlpEngine
+
+        nlp_engine = TrimmedSpacyNlpEngine(SPACY_MODEL, SPACY_EXCLUDE)
+        nlp_engine.load()
+        analyzer = AnalyzerEngine(nlp_engine=nlp_engine, supported_languages=["en"])
         
         # 1. Custom MRN Recognizer (Regex)
-        mrn_pattern = Pattern(name="mrn_pattern", regex=r"(?i)\b(mrn|acct|account|visit|pat|id)\s*#?[:\.-]?\s*([0-9\-]+)", score=1.0)
+        mrn_pattern = Pattern(name="mrn_pattern", regex="(?i)" + MRN_REGEX, score=1.0)
         mrn_recognizer = PatternRecognizer(supported_entity="MEDICAL_RECORD_NUMBER", patterns=[mrn_pattern])
         analyzer.registry.add_recognizer(mrn_recognizer)
         # 2. Custom Patient Name Recognizer (Contextual Regex)
-        pat_name_pattern = Pattern(name="pat_name_pattern", regex=r"(?i)(?:patient\s+name|patient)\s*[:\.-]\s*([A-Za-z,\s]+?)(?:\s{2,}|\n|$)", score=0.9)
+        pat_name_pattern = Pattern(name="pat_name_pattern", regex="(?i)" + PATIENT_NAME_REGEX, score=0.9)
         pat_name_recognizer = PatternRecognizer(supported_entity="PATIENT_NAME_HEADER", patterns=[pat_name_pattern])
         analyzer.registry.add_recognizer(pat_name_recognizer)
 
     return analyzer
 
-def sanitize_text(text):
-    """
-    Analyze and anonymize PHI in the given text.
-    Returns:
-        sanitized_text (str): The text with PHI replaced by placeholders.
-        results (list): List of redacted entities (for debug/verification).
-    """
-    if not text:
-        return "", []
+# Entities Presidio is asked to find
+ENTITIES = [
+    "PERSON",
+    "PHONE_NUMBER",
+    "EMAIL_ADDRESS",
+    "US_SSN",
+    "US_PASSPORT",
+    "US_DRIVER_LICENSE",
+    "LOCATION",
+    "DATE_TIME",
+    "MEDICAL_LICENSE",
+    "MEDICAL_RECORD_NUMBER",
+    "PATIENT_NAME_HEADER"
+]
 
-    # Lazy Init
-    analyzer_instance = get_analyzer()
+# Filter for reasonable score
+# Presidio sometimes has low confidence FP. Lowered to 0.35 per user request.
+MIN_SCORE = 0.35
 
-    # Analyze
-    results = analyzer_instance.analyze(text=text,
-                               language='en',
-                               entities=[
-                                   "PERSON", 
-                                   "PHONE_NUMBER", 
-                                   "EMAIL_ADDRESS", 
-                                   "US_SSN", 
-                                   "US_PASSPORT",
-                                   "US_DRIVER_LICENSE",
-                                   "LOCATION",
-                                   "DATE_TIME",
-                                   "MEDICAL_LICENSE",
-                                   "MEDICAL_RECORD_NUMBER",
-                                   "PATIENT_NAME_HEADER"
-                               ])
-    
-    # Filter for reasonable score
-    # Presidio sometimes has low confidence FP. Lowered to 0.35 per user request.
-    # Exclude allow-listed medical terms often mistaken for names.
-    ALLOW_LIST = {"fasciocutaneous", "xerofonn", "xeroform", "fascia lata", "fascia", "lata"}
-    
+# Exclude allow-listed medical terms often mistaken for names.
+ALLOW_LIST = {"fasciocutaneous", "xerofonn", "xeroform", "fascia lata", "fascia", "lata"}
+
+# Anonymize
+# Replace with <ENTITY_TYPE>
+PLACEHOLDERS = {
+    "PERSON": "<PERSON>",
+    "PHONE_NUMBER": "<PHONE>",
+    "EMAIL_ADDRESS": "<EMAIL>",
+    "DATE_TIME": "<DATE>",
+    "LOCATION": "<LOC>",
+    "MEDICAL_RECORD_NUMBER": "<MRN>",
+    "PATIENT_NAME_HEADER": "<PATIENT_NAME>"
+}
+OPERATORS = None
+
+def get_anonymizer():
+    """(AnonymizerEngine, operator configs), built on first use."""
+    global anonymizer, OPERATORS
+    if anonymizer is None:
+        from presidio_anonymizer import AnonymizerEngine
+        from presidio_anonymizer.entities import OperatorConfig
+
+        OPERATORS = {entity: OperatorConfig("replace", {"new_value": placeholder})
+                     for entity, placeholder in PLACEHOLDERS.items()}
+        anonymizer = AnonymizerEngine()
+    return anonymizer, OPERATORS
+
+# Documents per spaCy nlp.pipe() call in sanitize_batch
+SANITIZE_BATCH_SIZE = int(os.getenv("SANITIZE_BATCH_SIZE", "16"))
+
+def redact(text, results):
+    """Drop low-confidence / allow-listed findings and replace the rest with placeholders."""
     filtered_results = []
     for r in results:
-        if r.score < 0.35: continue
+        if r.score < MIN_SCORE: continue
         
         entity_text = text[r.start:r.end].lower()
         if entity_text in ALLOW_LIST:
@@ -75,18 +125,8 @@ def sanitize_text(text):
         
     results = filtered_results
 
-    # Anonymize
-    # Replace with <ENTITY_TYPE>
-    operators = {
-        "PERSON": OperatorConfig("replace", {"new_value": "<PERSON>"}),
-        "PHONE_NUMBER": OperatorConfig("replace", {"new_value": "<PHONE>"}),
-        "EMAIL_ADDRESS": OperatorConfig("replace", {"new_value": "<EMAIL>"}),
-        "DATE_TIME": OperatorConfig("replace", {"new_value": "<DATE>"}),
-        "LOCATION": OperatorConfig("replace", {"new_value": "<LOC>"}),
-        "MEDICAL_RECORD_NUMBER": OperatorConfig("replace", {"new_value": "<MRN>"}),
-        "PATIENT_NAME_HEADER": OperatorConfig("replace", {"new_value": "<PATIENT_NAME>"})
-    }
-    anonymized_result = anonymizer.anonymize(
+    anonymizer_instance, operators = get_anonymizer()
+    anonymized_result = anonymizer_instance.anonymize(
         text=text,
         analyzer_results=results,
         operators=operators
@@ -94,6 +134,316 @@ def sanitize_text(text):
     
     return anonymized_result.text, results
 
+# --- Tiered analysis ---
+# "full" runs the whole AnalyzerEngine (spaCy NER) over every document.
+# "tiered" runs every pattern recognizer (MRN, SSN, phone, email, passport,
+# licenses, dates...) over the whole text on a tokenizer-only doc, then
+# sends only the sentences that could hold a name, place or date (plus their
+# neighbours, for context words) through the spaCy NER recognizer.
+SANITIZE_MODE = os.getenv("SANITIZE_MODE", "full").lower()
+
+# Entities the spaCy NER recognizer can add on top of the pattern recognizers
+NER_ENTITIES = ["PERSON", "LOCATION", "DATE_TIME"]
+
+# Sentence/line boundaries, and cues that a sentence may name a person, place or date
+SEGMENT_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+NER_CUE = re.compile(
+    r"\b(?:Dr|Mr|Mrs|Ms|Miss|Prof)\b\.?"                         # honorifics
+    r"|(?i:\b(?:surgeon|physician|provider|assistant|attending|referring|dictated|signed"
+    r"|resides|address|transferred|wife|husband|son|daughter|mother|father)\b)"
+    r"|[a-z,;:]\s+[A-Z][a-z]"                                       # proper noun mid-sentence
+    r"|\b[A-Z][a-z]+\s+[A-Z][a-z]+"                                  # two capitalized words
+    r"|\b[A-Z]{2,}\s+[A-Z]{2,}\b"                                  # ALL CAPS NAME
+    r"|\b\d{1,2}/\d{2,4}\b|\b(?:19|20)\d{2}\b"                   # short numeric dates, years
+    r"|(?i:\b(?:january|february|march|april|may|june|july|august|september|october|november|december"
+    r"|jan|feb|mar|apr|jun|jul|aug|sept?|oct|nov|dec|(?:mon|tues|wednes|thurs|fri|satur|sun)day"
+    r"|today|tonight|yesterday|tomorrow|ago|last|next|aged?|old)\b)"  # month/day names, relative dates, ages
+)
+
+tier_metrics = {"documents": 0, "chars": 0, "ner_chars": 0}
+_tier_lock = threading.Lock()
+
+def pattern_tier(text):
+    """
+    Every recognizer except spaCy NER over the whole text. The doc is only
+    tokenized (for context words), so no model component runs.
+    """
+    from presidio_analyzer.nlp_engine import NlpArtifacts
+    analyzer_instance = get_analyzer()
+    nlp_engine = analyzer_instance.nlp_engine
+    doc = nlp_engine.nlp["en"].make_doc(text)
+    artifacts = NlpArtifacts(entities=[], tokens=doc, tokens_indices=[token.idx for token in doc],
+                             lemmas=[token.lower_ for token in doc], nlp_engine=nlp_engine, language="en")
+    return analyzer_instance.analyze(text=text, language="en", entities=ENTITIES, nlp_artifacts=artifacts)
+
+def ner_windows(text):
+    """
+    (start, end) ranges that need the NER pass: every sentence with a
+    name/place cue plus the sentences on either side, merged.
+    """
+    segments = []
+    start = 0
+    for boundary in SEGMENT_BOUNDARY.finditer(text):
+        segments.append((start, boundary.start()))
+        start = boundary.end()
+    segments.append((start, len(text)))
+
+    windows = []
+    for i, (seg_start, seg_end) in enumerate(segments):
+        if not NER_CUE.search(text, seg_start, seg_end):
+            continue
+        win_start = segments[max(0, i - 1)][0]
+        win_end = segments[min(len(segments) - 1, i + 1)][1]
+        if windows and win_start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], win_end))
+        else:
+            windows.append((win_start, win_end))
+    return windows
+
+def analyze_tiered(texts, batch_size=SANITIZE_BATCH_SIZE):
+    """Tiered analysis of many documents; NER windows from all of them share one nlp.pipe stream."""
+    texts = list(texts)
+    results = [pattern_tier(text) for text in texts]
+    windows = [(i, start, end) for i, text in enumerate(texts) for start, end in ner_windows(text)]
+
+    if windows:
+        from presidio_analyzer import BatchAnalyzerEngine, EntityRecognizer
+        batch_analyzer = BatchAnalyzerEngine(analyzer_engine=get_analyzer())
+        analyzed = batch_analyzer.analyze_iterator([texts[i][start:end] for i, start, end in windows],
+                                                   language='en', batch_size=batch_size, entities=NER_ENTITIES)
+        touched = set()
+        for (i, start, _), window_results in zip(windows, analyzed):
+            for r in window_results:
+                r.start += start
+                r.end += start
+            results[i].extend(window_results)
+            touched.add(i)
+        # Date patterns also match inside windows; drop the repeats as the full analyzer does
+        for i in touched:
+            results[i] = EntityRecognizer.remove_duplicates(results[i])
+
+    with _tier_lock:
+        tier_metrics["documents"] += len(texts)
+        tier_metrics["chars"] += sum(len(text) for text in texts)
+        tier_metrics["ner_chars"] += sum(end - start for _, start, end in windows)
+    return results
+
+def sanitize_text(text):
+    """
+    Analyze and anonymize PHI in the given text.
+    Returns:
+        sanitized_text (str): The text with PHI replaced by placeholders.
+        results (list): List of redacted entities (for debug/verification).
+    """
+    if not text:
+        return "", []
+
+    if SANITIZE_MODE == "tiered":
+        return redact(text, analyze_tiered([text])[0])
+
+    # Lazy Init
+    analyzer_instance = get_analyzer()
+
+    # Analyze
+    results = analyzer_instance.analyze(text=text, language='en', entities=ENTITIES)
+    return redact(text, results)
+
+def sanitize_batch(texts, batch_size=SANITIZE_BATCH_SIZE):
+    """
+    `sanitize_text` over many documents: spaCy parses them in batches of
+    `batch_size` (nlp.pipe) through Presidio's BatchAnalyzerEngine.
+    Returns [(sanitized_text, results), ...] in input order.
+    """
+    texts = list(texts)
+    outputs = [("", [])] * len(texts)
+    todo = [i for i, text in enumerate(texts) if text]
+    if todo:
+        if SANITIZE_MODE == "tiered":
+            analyzed = analyze_tiered([texts[i] for i in todo], batch_size)
+        else:
+            from presidio_analyzer import BatchAnalyzerEngine
+            batch_analyzer = BatchAnalyzerEngine(analyzer_engine=get_analyzer())
+            analyzed = batch_analyzer.analyze_iterator([texts[i] for i in todo], language='en',
+                                                       batch_size=batch_size, entities=ENTITIES)
+        for i, results in zip(todo, analyzed):
+            outputs[i] = redact(texts[i], results)
+    return outputs
+
+# --- Sanitization Service (worker processes) ---
+# spaCy holds the GIL, so one process sanitizes one document at a time.
+# The service fans documents out to worker processes, each with its own
+# warm analyzer. SANITIZE_WORKERS=0 (default) keeps everything in-process.
+SANITIZE_WORKERS = int(os.getenv("SANITIZE_WORKERS", "0"))
+
+WARM_UP_TEXT = "Patient: John Doe  MRN: 12345. Seen by Dr. Smith in Springfield on 01/02/2023, call 555-123-4567."
+
+def _init_worker(warm_up):
+    # Load the spaCy model and compile recognizers once per process, not per task
+    if warm_up:
+        sanitize_text(WARM_UP_TEXT)
+
+def _sanitize_chunk(batch_fn, texts, batch_size):
+    return batch_fn(texts, batch_size)
+
+class SanitizationService:
+    """
+    Pool of `workers` processes, each holding a warm AnalyzerEngine.
+    Documents are sent in chunks of `batch_size` and parsed with nlp.pipe;
+    results come back as (sanitized_text, results) in input order.
+
+    `batch_fn(texts, batch_size)` does the work in the worker (default
+    `sanitize_batch`); it must be a module-level function so it can be
+    pickled to the workers.
+    """
+
+    def __init__(self, workers=SANITIZE_WORKERS or os.cpu_count(), batch_size=SANITIZE_BATCH_SIZE,
+                 batch_fn=None, warm_up=True):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_fn = batch_fn or sanitize_batch
+        self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(warm_up,))
+        self.metrics = {"documents": 0, "chunks": 0}
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Start every worker now (each loads its model) instead of on the first request."""
+        futures = [self._pool.submit(_sanitize_chunk, self.batch_fn, [""], 1) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def submit(self, texts):
+        """Future for one chunk of documents (wrap with asyncio.wrap_future in async code)."""
+        with self._lock:
+            self.metrics["documents"] += len(texts)
+            self.metrics["chunks"] += 1
+        return self._pool.submit(_sanitize_chunk, self.batch_fn, list(texts), self.batch_size)
+
+    def sanitize(self, text):
+        return self.submit([text]).result()[0]
+
+    def sanitize_many(self, texts):
+        """Split `texts` into chunks spread over the workers; results in input order."""
+        texts = list(texts)
+        if not texts:
+            return []
+        # Small requests still use every worker: cap chunks at batch_size, but
+        # make at least one chunk per worker when there are enough documents
+        chunk = max(1, min(self.batch_size, -(-len(texts) // self.workers)))
+        futures = [self.submit(texts[i:i + chunk]) for i in range(0, len(texts), chunk)]
+        return [output for future in futures for output in future.result()]
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics, workers=self.workers, batch_size=self.batch_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_sanitization_service():
+    """The process-wide SanitizationService, or None when SANITIZE_WORKERS is 0."""
+    global _service
+    if _service is None and SANITIZE_WORKERS > 0:
+        with _service_lock:
+            if _service is None:
+                _service = SanitizationService(SANITIZE_WORKERS)
+    return _service
+
+def sanitize_many(texts):
+    """
+    Sanitize a list of documents, in order: through the service's worker
+    processes when SANITIZE_WORKERS > 0, else batched in this process.
+    """
+    service = get_sanitization_service()
+    if service is not None:
+        return service.sanitize_many(texts)
+    return sanitize_batch(texts)
+
+def _sanitize(text):
+    service = get_sanitization_service()
+    if service is not None:
+        return service.sanitize(text)
+    return sanitize_text(text)
+
+# --- Sanitization Sessions ---
+# /sanitize stores its result here so /audit can reuse it instead of running
+# the spaCy/Presidio pass a second time. Keys are content hashes of the raw
+# text, so no PHI is used as a lookup key.
+# Each gunicorn worker has its own memory tier; /sanitize and /audit can land
+# on different workers, so with more than one worker set SANITIZE_SESSION_DB
+# (gunicorn.conf.py does) to share sessions through a SQLite file. It holds
+# only redacted text and entity offsets.
+SANITIZE_CACHE_SIZE = int(os.getenv("SANITIZE_CACHE_SIZE", "256"))
+SANITIZE_CACHE_TTL = int(os.getenv("SANITIZE_CACHE_TTL", "900"))
+SANITIZE_SESSION_DB = os.getenv("SANITIZE_SESSION_DB")  # unset = memory only (single process)
+session_cache = TieredCache(
+    TTLCache(max_entries=SANITIZE_CACHE_SIZE, ttl_seconds=SANITIZE_CACHE_TTL),
+    SQLiteCache(SANITIZE_SESSION_DB, max_entries=10 * SANITIZE_CACHE_SIZE, ttl_seconds=SANITIZE_CACHE_TTL)
+    if SANITIZE_SESSION_DB else None)
+
+# Entities read back from a session; the same fields as Presidio's RecognizerResult
+SessionEntity = namedtuple("SessionEntity", "entity_type start end score")
+
+def _store_session(token, sanitized_text, results):
+    entities = [[r.entity_type, r.start, r.end, r.score] for r in results]
+    session_cache.put(token, [sanitized_text, entities])
+
+def _load_session(token):
+    cached = session_cache.get(token)
+    if cached is None:
+        return None
+    sanitized_text, entities = cached
+    return sanitized_text, [SessionEntity(*entity) for entity in entities]
+
+def sanitize_session(text):
+    """
+    Sanitize text and remember the result for later reuse.
+    Returns:
+        token (str): Content hash identifying this sanitization session.
+        sanitized_text (str): The redacted text.
+        results (list): Redacted entities.
+    """
+    token = content_hash(text or "")
+    cached = _load_session(token)
+    if cached is not None:
+        return (token,) + cached
+
+    sanitized_text, results = _sanitize(text)
+    _store_session(token, sanitized_text, results)
+    return token, sanitized_text, results
+
+def resolve_sanitized_text(text, token=None):
+    """
+    Return sanitized text for an audit without a second NLP pass when possible.
+
+    If `token` refers to a live session and `text` is either the original raw
+    text or the unmodified sanitized output of that session, the cached result
+    is reused. Anything else (unknown/expired token, text edited after review)
+    is sanitized again so manual edits can never bypass redaction.
+    """
+    if token:
+        cached = _load_session(token)
+        if cached is not None:
+            sanitized_text, results = cached
+            if text is None or _same_text(text, sanitized_text) or content_hash(text) == token:
+                return sanitized_text, results
+
+    _, sanitized_text, results = sanitize_session(text)
+    return sanitized_text, results
+
+def _same_text(a, b):
+    # The UI posts back `innerText`, which may differ from the server copy in
+    # line endings and trailing whitespace only.
+    return " ".join(a.split()) == " ".join(b.split())
+
 if __name__ == "__main__":
     # Test run
     test_text = "Patient John Doe (DOB 05/12/1980) visited Dr. Smith at 123 Main St, Springfield on 2023-01-01."
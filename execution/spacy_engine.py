@@ -0,0 +1,45 @@
+"""
+Presidio NLP engine over a trimmed spaCy pipeline.
+
+Imported by sanitize_phi only when the analyzer is built, so spaCy and the
+Presidio analyzer stay out of process start-up.
+"""
+import spacy
+from presidio_analyzer.nlp_engine import NerModelConfiguration, NlpEngineProvider, SpacyNlpEngine
+
+
+class TrimmedSpacyNlpEngine(SpacyNlpEngine):
+    """
+    SpacyNlpEngine that loads the model without the `exclude`d components.
+    Without a lemmatizer, lowercased tokens stand in for lemmas, so
+    Presidio's context words ("ssn", "phone", "mrn") still boost scores.
+
+    Only public SpacyNlpEngine methods are overridden; the Presidio range
+    in requirements.txt is the one this was tested against.
+    """
+
+    def __init__(self, model_name, exclude=()):
+        # Same entity mapping / ignored labels as Presidio's default engine
+        ner_config = NlpEngineProvider().nlp_configuration["ner_model_configuration"]
+        super().__init__(models=[{"lang_code": "en", "model_name": model_name}],
+                         ner_model_configuration=NerModelConfiguration.from_dict(ner_config))
+        self.exclude = tuple(exclude)
+
+    def load(self):
+        # The model must already be installed (Dockerfile SPACY_MODEL); no download at start-up
+        self.nlp = {model["lang_code"]: spacy.load(model["model_name"], exclude=list(self.exclude))
+                    for model in self.models}
+
+    def process_text(self, text, language):
+        return self._with_lemmas(super().process_text(text, language), language)
+
+    def process_batch(self, texts, language, batch_size=1, n_process=1, as_tuples=False):
+        for output in super().process_batch(texts, language, batch_size=batch_size,
+                                            n_process=n_process, as_tuples=as_tuples):
+            yield (output[0], self._with_lemmas(output[1], language)) + output[2:]
+
+    def _with_lemmas(self, artifacts, language):
+        if "lemmatizer" not in self.nlp[language].pipe_names:
+            artifacts.lemmas = [token.lower_ for token in artifacts.tokens]
+            artifacts.keywords = artifacts.set_keywords(self, artifacts.lemmas, language)
+        return artifacts
@@ -0,0 +1,64 @@
+"""
+Production serving: `gunicorn app:app` (this file is picked up from the
+working directory).
+
+Each worker is a gthread worker: an audit spends most of its time waiting
+on the LLM, so a handful of processes with many threads each keeps the
+CPU busy without a process (and a spaCy model) per concurrent request.
+
+The app is imported once in the master (preload_app). With PREWARM=true the
+Presidio analyzer, rules engine and LLM SDK are loaded there too, before
+forking, so workers share those pages copy-on-write. After the fork each
+worker drops the sockets and SQLite connections it inherited.
+
+Workers share no memory, and a client's calls can land on different
+workers. With more than one worker, sanitization sessions
+(SANITIZE_SESSION_DB) and audit job records (AUDIT_JOB_STORE=sqlite,
+AUDIT_JOB_DB) default to SQLite files in the temp directory, so a /sanitize
+token or a job ID from one worker is honoured by the others. An explicit
+AUDIT_JOB_STORE=memory is logged as a warning: job polls would 404 on every
+worker but the one that queued the job. AUDIT_JOB_QUEUE_LIMIT applies per
+worker, so up to workers x limit jobs can be queued in total.
+"""
+import multiprocessing
+import os
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_WORKERS", "0")) or multiprocessing.cpu_count()
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "32"))
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+accesslog = "-"
+
+# One pooled LLM connection per request thread, so threads never queue for one
+os.environ.setdefault("LLM_POOL_SIZE", str(threads))
+
+# State that must outlive the worker a request landed on
+if workers > 1:
+    os.environ.setdefault("SANITIZE_SESSION_DB", os.path.join(tempfile.gettempdir(), "sanitize_sessions.db"))
+    os.environ.setdefault("AUDIT_JOB_STORE", "sqlite")
+    os.environ.setdefault("AUDIT_JOB_DB", os.path.join(tempfile.gettempdir(), "audit_jobs.db"))
+
+# app.py prewarms at import when PREWARM=true; under gunicorn on_starting
+# does it instead, in the fork-safe form
+PREWARM = os.getenv("PREWARM", "False").lower() == "true"
+os.environ["PREWARM"] = "false"
+
+
+def on_starting(server):
+    if workers > 1 and os.environ.get("AUDIT_JOB_STORE", "").lower() == "memory":
+        server.log.warning(f"AUDIT_JOB_STORE=memory with {workers} workers: a job is only visible to the "
+                           "worker that queued it, so status polls on other workers return 404. "
+                           "Use AUDIT_JOB_STORE=sqlite or WEB_WORKERS=1.")
+    if PREWARM:
+        import app
+        app.prewarm(before_fork=True)
+
+
+def post_fork(server, worker):
+    import app
+    app.reset_after_fork()
@@ -6,6 +6,10 @@ from unittest.mock import MagicMock
 # Add execution directory to path so tests can import modules
 sys.path.append(os.path.join(os.path.dirname(__file__), '../execution'))
 
+# medical_audit loads the SDK lazily; load the real one now, before the
+# fixture below replaces sys.modules['anthropic'] (fake-server tests use it)
+import anthropic
+
 # MOCK External Dependencies to prevent CI failures
 # This ensures we don't need the actual DB file or API keys in CI
 @pytest.fixture(autouse=True)
@@ -14,13 +18,14 @@ def mock_dependencies(monkeypatch):
     mock_conn = MagicMock()
     mock_cursor = MagicMock()
     mock_conn.cursor.return_value = mock_cursor
+    mock_conn.execute.return_value = mock_cursor
     
     # Mock DB Query Results
     mock_cursor.fetchone.return_value = None # Default empty
     mock_cursor.fetchall.return_value = []
     
     # Mock sqlite3.connect to return our mock connection
-    monkeypatch.setattr("sqlite3.connect", lambda path: mock_conn)
+    monkeypatch.setattr("sqlite3.connect", lambda *args, **kwargs: mock_conn)
     
     # Mock Anthropic Client to avoid API key errors
     mock_anthropic = MagicMock()
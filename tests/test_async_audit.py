@@ -0,0 +1,91 @@
+import asyncio
+import json
+import pytest
+from benchmarks.fake_llm_server import FakeLLMServer
+from cache_utils import TieredCache, TTLCache
+from execution import async_audit, medical_audit
+from execution.async_audit import AsyncAuditRuntime, RateLimiter
+from execution.rules_engine import CompactRulesIndex
+
+LLM_RESPONSE = json.dumps({"audit_results": [
+    {"code": "12001", "documentation_status": "PASS", "calculated_units": "1", "billing_risk_alert": "NONE",
+     "risk_rationale": "", "clinical_evidence": "2.0 cm laceration"}]})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_rate_limiter_waits_for_both_quotas():
+    clock = FakeClock()
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=600, clock=clock, sleep=clock.sleep)
+
+    async def scenario():
+        await limiter.acquire(300)
+        await limiter.acquire(300)
+        assert clock.now == 0
+        await limiter.acquire(100)       # RPM binds: a request refills in 30 s (tokens would need 10 s)
+        assert clock.now == pytest.approx(30)
+        await limiter.acquire(600)       # TPM binds: 200 tokens left, 400 more take 40 s
+        assert clock.now == pytest.approx(70)
+        limiter.settle(600, 100)         # the call used far fewer tokens than reserved
+        await limiter.acquire(400)       # tokens are back; only the request bucket holds it
+        assert clock.now == pytest.approx(90)
+
+    asyncio.run(scenario())
+    assert limiter.stats()["waits"] == 3
+
+@pytest.mark.parametrize("provider", ["anthropic", "bedrock"])
+def test_async_audits_share_bounded_clients(monkeypatch, provider):
+    monkeypatch.setattr(medical_audit, "LLM_PROVIDER", provider)
+    monkeypatch.setattr(medical_audit, "ANTHROPIC_API_KEY", "fake")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "fake")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "fake")
+    monkeypatch.setattr(medical_audit, "get_rules_db", lambda: CompactRulesIndex.from_rows([]))
+    monkeypatch.setattr(medical_audit, "audit_cache", TieredCache(TTLCache()))
+    monkeypatch.setattr(medical_audit, "resolve_sanitized_text", lambda text, token=None: (text, []))
+
+    async def run_audits(url):
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", url)
+        monkeypatch.setattr(medical_audit, "BEDROCK_ENDPOINT_URL", url)
+        runtime = async_audit._runtimes[asyncio.get_running_loop()] = AsyncAuditRuntime(max_in_flight=4)
+        try:
+            return await asyncio.gather(*(
+                async_audit.audit_medical_record_async(f"Scalp laceration repair #{i}", ["12001"], ["S01.01XA"],
+                                                       date_of_service="2024-06-01")
+                for i in range(24))), runtime.stats()
+        finally:
+            await runtime.aclose()
+
+    with FakeLLMServer(latency_ms=20, response=LLM_RESPONSE) as server:
+        results, stats = asyncio.run(run_audits(server.url))
+        server_stats = server.stats()
+
+    assert all(r["audit_results"][0]["decision_path"] == "llm" for r in results)
+    assert server_stats["requests"] == 24
+    assert server_stats["connections"] <= 4  # the semaphore, not the pool size, bounds sockets
+    assert stats["clients"]["calls"] == 24
+    assert stats["rate_limiter"]["acquired"] == 24 and stats["in_flight"] == 0
+
+def test_async_pool_is_split_into_shards(monkeypatch):
+    monkeypatch.setattr(medical_audit, "LLM_PROVIDER", "anthropic")
+    monkeypatch.setattr(medical_audit, "ANTHROPIC_API_KEY", "fake")
+
+    async def scenario():
+        manager = async_audit.AsyncLLMClientManager(pool_size=40, shard_size=16)
+        try:
+            picked = [manager.client()[0] for _ in range(6)]
+            return manager, picked
+        finally:
+            await manager.aclose()
+
+    manager, picked = asyncio.run(scenario())
+    assert manager.shards == 3
+    assert len({id(c) for c in picked}) == 3 and picked[:3] == picked[3:]
@@ -0,0 +1,87 @@
+import json
+import sqlite3
+import pytest
+from cache_utils import SQLiteCache, TieredCache, TTLCache
+from execution import medical_audit
+from execution.rules_engine import CompactRulesIndex
+
+REAL_CONNECT = sqlite3.connect
+
+LLM_RESPONSE = json.dumps({"audit_results": [
+    {"code": "12001", "documentation_status": "PASS", "calculated_units": "1", "billing_risk_alert": "NONE",
+     "risk_rationale": "", "clinical_evidence": "2.0 cm laceration"},
+]})
+
+
+@pytest.fixture
+def audit_env(monkeypatch):
+    calls = []
+    rules = CompactRulesIndex.from_rows([("12001", "11042", "0")])
+
+    def fake_llm(prompt, system_prompt, tool=None):
+        calls.append(prompt)
+        return LLM_RESPONSE
+
+    monkeypatch.setattr(medical_audit, "query_anthropic", fake_llm)
+    monkeypatch.setattr(medical_audit, "get_rules_db", lambda: rules)
+    monkeypatch.setattr(medical_audit, "audit_cache", TieredCache(TTLCache(max_entries=16, ttl_seconds=60)))
+    return calls, rules
+
+def audit(text="Simple repair of a 2.0 cm scalp laceration.", codes=("12001",), units=None):
+    return medical_audit.audit_medical_record(text, list(codes), ["S01.01XA"], units_map=units or {},
+                                              pre_sanitized=True, date_of_service="2024-06-01")
+
+def test_repeat_audit_served_from_cache(audit_env):
+    calls, _ = audit_env
+    first = audit()
+    first["audit_results"][0]["code"] = "mutated by caller"
+
+    # Whitespace edits and explicit default units hit the same entry
+    second = audit(text="Simple repair of a 2.0 cm   scalp laceration.\n", units={"12001": 1})
+    assert len(calls) == 1
+    assert second["audit_results"][0]["code"] == "12001"
+    assert medical_audit.audit_cache.stats()["memory"]["hits"] == 1
+
+def test_cache_invalidated_by_inputs_prompt_and_rules(audit_env, monkeypatch):
+    calls, rules = audit_env
+    audit()
+    audit(units={"12001": 3})
+    assert len(calls) == 2
+
+    monkeypatch.setattr(medical_audit, "PROMPT_VERSION", "edited-prompt")
+    audit()
+    assert len(calls) == 3
+
+    rules.rules_version = 2
+    audit()
+    assert len(calls) == 4
+
+    medical_audit.audit_medical_record("Simple repair of a 2.0 cm scalp laceration.", ["12001"], ["S01.01XA"],
+                                       pre_sanitized=True, date_of_service="2024-06-01", use_cache=False)
+    assert len(calls) == 5
+
+def test_sqlite_tier_evicts_by_ttl_and_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite3, "connect", REAL_CONNECT)
+    now = [1000.0]
+    path = str(tmp_path / "cache.db")
+    disk = SQLiteCache(path, max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+
+    disk.put("a", {"v": 1})
+    now[0] += 1
+    disk.put("b", {"v": 2})
+    now[0] += 1
+    assert disk.get("a") == {"v": 1}  # a is now most recently used
+    now[0] += 1
+    disk.put("c", {"v": 3})
+    assert disk.get("b") is None and len(disk) == 2
+
+    now[0] += 11
+    assert disk.get("a") is None
+    disk.close()
+
+    # Persistent tier survives a restart and is promoted into memory
+    disk = SQLiteCache(path, ttl_seconds=60)
+    disk.put("d", [1, 2])
+    tiered = TieredCache(TTLCache(), SQLiteCache(path))
+    assert tiered.get("d") == [1, 2]
+    assert tiered.memory.get("d") == [1, 2]
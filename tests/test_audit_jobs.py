@@ -0,0 +1,94 @@
+import sqlite3
+import threading
+import pytest
+import app
+from execution import audit_jobs
+from execution.audit_jobs import AuditJobManager, MemoryJobStore, QueueFull, SQLiteJobStore
+
+REAL_CONNECT = sqlite3.connect
+
+AUDIT_BODY = {"text": "Simple repair of a 2.5 cm scalp laceration.", "cpt_codes": ["12001"],
+              "dx_codes": ["S01.01XA"], "date_of_service": "2024-06-01"}
+
+
+def wait_for(manager, job_id, status):
+    for _ in range(200):
+        job = manager.get(job_id)
+        if job["status"] == status and job["callback_status"] != "pending":
+            return job
+        threading.Event().wait(0.01)
+    raise AssertionError(manager.get(job_id))
+
+
+def test_jobs_run_in_background_and_queue_depth_is_limited():
+    release = threading.Event()
+    delivered = []
+
+    def audit(raw_text, **kwargs):
+        release.wait(5)
+        if raw_text == "boom":
+            raise RuntimeError("LLM unavailable")
+        return {"audit_results": [{"code": "12001"}], "text": raw_text}
+
+    manager = AuditJobManager(audit, store=MemoryJobStore(), workers=1, max_queue=2,
+                              deliver=lambda url, job: delivered.append((url, job["status"])) or "delivered")
+    first = manager.submit({"raw_text": "one"}, callback_url="https://hooks.example/audit")
+    threading.Event().wait(0.05)  # first job is now running, so it no longer counts as queued
+    second = manager.submit({"raw_text": "boom"})
+    manager.submit({"raw_text": "three"})
+    with pytest.raises(QueueFull):
+        manager.submit({"raw_text": "four"})
+    assert manager.get(first["job_id"])["status"] == "running"
+
+    release.set()
+    done = wait_for(manager, first["job_id"], "succeeded")
+    failed = wait_for(manager, second["job_id"], "failed")
+    manager.close()
+
+    assert done["result"]["text"] == "one" and done["callback_status"] == "delivered"
+    assert delivered == [("https://hooks.example/audit", "succeeded")]
+    assert failed["error"] == "LLM unavailable" and failed["result"] is None
+    stats = manager.stats()
+    assert stats["rejected"] == 1 and stats["succeeded"] == 2 and stats["failed"] == 1
+    assert stats["store"]["by_status"] == {"succeeded": 2, "failed": 1}
+
+
+def test_sqlite_store_is_shared_between_processes_and_expires_finished_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite3, "connect", REAL_CONNECT)
+    now = [1000.0]
+    path = str(tmp_path / "jobs.db")
+    writer = SQLiteJobStore(path, ttl_seconds=60, clock=lambda: now[0])
+    reader = SQLiteJobStore(path, ttl_seconds=60, clock=lambda: now[0])  # e.g. another gunicorn worker
+
+    writer.create({"job_id": "a", "status": "queued", "updated_at": now[0]})
+    writer.update("a", status="succeeded", result={"audit_results": []}, updated_at=now[0])
+    assert reader.get("a") == {"job_id": "a", "status": "succeeded", "updated_at": 1000.0,
+                               "result": {"audit_results": []}}
+
+    now[0] += 61
+    writer.create({"job_id": "b", "status": "queued", "updated_at": now[0]})
+    assert reader.get("a") is None and reader.get("b")["status"] == "queued"
+
+
+def test_job_endpoints(monkeypatch):
+    manager = AuditJobManager(lambda **kwargs: {"audit_results": [], "codes": kwargs["cpt_list"]},
+                              store=MemoryJobStore(), workers=1)
+    monkeypatch.setattr(app, "get_job_manager", lambda audit_fn: manager)
+    monkeypatch.setattr(audit_jobs, "AUDIT_JOB_CALLBACK_HOSTS", {"hooks.example"})
+    client = app.app.test_client()
+
+    response = client.post("/audit/jobs", json=dict(AUDIT_BODY, callback_url="http://169.254.169.254/latest"))
+    assert response.status_code == 400 and "AUDIT_JOB_CALLBACK_HOSTS" in response.json["error"]
+
+    response = client.post("/audit/jobs", json=AUDIT_BODY)
+    assert response.status_code == 202
+    assert response.headers["Location"] == response.json["status_url"]
+    job = wait_for(manager, response.json["job_id"], "succeeded")
+    assert client.get(response.json["status_url"]).json["result"] == {"audit_results": [], "codes": ["12001"]}
+    assert job["callback_url"] is None
+
+    assert client.get("/audit/jobs/unknown").status_code == 404
+    manager.max_queue = 0
+    response = client.post("/audit/jobs", json=AUDIT_BODY)
+    assert response.status_code == 429 and response.headers["Retry-After"] == "5"
+    manager.close()
@@ -0,0 +1,73 @@
+import json
+import pytest
+from execution import medical_audit
+from execution.rules_engine import CompactRulesIndex
+from cache_utils import TieredCache, TTLCache
+from json_stream import AuditResultsStreamParser
+
+RESPONSE = """Here is the audit:
+```json
+{
+  "audit_results": [
+    {"code": "12001", "documentation_status": "PASS", "clinical_evidence": "closure {simple} \\"2.0 cm\\" [scalp]",
+     "calculated_units": "1", "billing_risk_alert": "NONE", "risk_rationale": ""},
+    {"code": "11042", "documentation_status": "PASS", "clinical_evidence": "debridement",
+     "calculated_units": "2", "billing_risk_alert": "NONE", "risk_rationale": "Supported by the note."}
+  ],
+  "diagnosis_analysis": "- Specific.",
+  "documentation_improvement": "- None."
+}
+```"""
+
+
+def test_parser_emits_each_entry_once_for_any_chunking():
+    expected = json.loads(RESPONSE.split("```json")[1].split("```")[0])["audit_results"]
+    for size in (1, 2, 3, 7, 50, len(RESPONSE)):
+        parser = AuditResultsStreamParser()
+        items = []
+        for i in range(0, len(RESPONSE), size):
+            items.extend(parser.feed(RESPONSE[i:i + size]))
+        assert items == expected
+        assert parser.done and parser.text == RESPONSE
+
+def test_entry_emitted_before_response_finishes():
+    parser = AuditResultsStreamParser()
+    cut = RESPONSE.index('{"code": "11042"')
+    assert [item["code"] for item in parser.feed(RESPONSE[:cut])] == ["12001"]
+    assert [item["code"] for item in parser.feed(RESPONSE[cut:])] == ["11042"]
+
+
+@pytest.fixture
+def streaming_llm(monkeypatch):
+    rules = CompactRulesIndex.from_rows([("12001", "11042", "1")])
+    monkeypatch.setattr(medical_audit, "get_rules_db", lambda: rules)
+    monkeypatch.setattr(medical_audit, "audit_cache", TieredCache(TTLCache()))
+    monkeypatch.setattr(medical_audit, "query_anthropic", lambda prompt, system, tool=None: RESPONSE)
+    monkeypatch.setattr(medical_audit, "resolve_sanitized_text", lambda text, token=None: (text, []))
+    monkeypatch.setattr(medical_audit, "stream_anthropic",
+                        lambda prompt, system: (RESPONSE[i:i + 5] for i in range(0, len(RESPONSE), 5)))
+
+def test_stream_matches_blocking_audit(streaming_llm):
+    args = ("Scalp laceration repair with debridement.", ["12001", "11042"], ["S01.01XA"])
+    kwargs = dict(pre_sanitized=True, date_of_service="2024-06-01", use_cache=False)
+    events = list(medical_audit.stream_audit_medical_record(*args, **kwargs))
+
+    assert [name for name, _ in events] == ["start", "result", "result", "complete"]
+    # Deterministic NCCI merge is applied per streamed entry
+    assert events[2][1]["billing_risk_alert"] == "HIGH - NCCI BUNDLING"
+    assert events[2][1]["billed_units"] == 1
+    assert events[-1][1] == medical_audit.audit_medical_record(*args, **kwargs)
+
+def test_audit_stream_endpoint_sends_sse(streaming_llm):
+    import app as flask_app
+    client = flask_app.app.test_client()
+    response = client.post("/audit/stream", json={
+        "text": "Scalp laceration repair with debridement.",
+        "cpt_codes": [{"code": "12001", "user_units": 1}, {"code": "11042", "user_units": 1}],
+        "dx_codes": ["S01.01XA"], "date_of_service": "2024-06-01",
+    })
+    assert response.mimetype == "text/event-stream"
+    frames = [f for f in response.get_data(as_text=True).split("\n\n") if f]
+    assert [f.split("\n")[0] for f in frames] == ["event: start", "event: result", "event: result", "event: complete"]
+
+    assert client.post("/audit/stream", json={"text": "", "cpt_codes": []}).status_code == 400
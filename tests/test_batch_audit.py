@@ -0,0 +1,88 @@
+import io
+import json
+import pytest
+import sanitize_phi
+from cache_utils import TieredCache, TTLCache
+from execution import batch_audit, medical_audit
+from execution.rules_engine import CompactRulesIndex
+
+
+LLM_RESPONSE = json.dumps({"audit_results": [
+    {"code": "12001", "documentation_status": "PASS", "calculated_units": "1", "billing_risk_alert": "NONE",
+     "risk_rationale": "", "clinical_evidence": "found"}]})
+
+
+@pytest.fixture
+def batch_env(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_llm(prompt, system_prompt, tool=None):
+        calls.append(prompt)
+        if "OUTAGE" in prompt:
+            raise RuntimeError("model unavailable")
+        return LLM_RESPONSE
+
+    monkeypatch.setattr(medical_audit, "get_rules_db", lambda: CompactRulesIndex.from_rows([]))
+    monkeypatch.setattr(medical_audit, "audit_cache", TieredCache(TTLCache()))
+    monkeypatch.setattr(medical_audit, "query_anthropic", fake_llm)
+    monkeypatch.setattr(sanitize_phi, "sanitize_many", lambda texts: [(text.upper(), []) for text in texts])
+    return calls, tmp_path
+
+def write_manifest(path, records):
+    path.write_text("".join(json.dumps(r) + "\n" for r in records))
+    return str(path)
+
+def run(manifest, output):
+    return batch_audit.run_batch(manifest, output, llm_workers=3, queue_size=2, stream=io.StringIO())
+
+def claim(claim_id, text="Simple repair of scalp laceration.", code="12001"):
+    return {"claim_id": claim_id, "text": text, "cpt_codes": [{"code": code, "user_units": 1}],
+            "dx_codes": ["S01.01XA"], "date_of_service": "2024-06-01"}
+
+def test_batch_writes_every_claim_and_resumes(batch_env):
+    calls, tmp_path = batch_env
+    records = [claim(f"C{i}") for i in range(10)] + [claim("BAD", text="outage"), {"claim_id": "EMPTY"}]
+    manifest = write_manifest(tmp_path / "claims.jsonl", records)
+    output = str(tmp_path / "out.jsonl")
+
+    summary = run(manifest, output)
+    assert (summary["read"], summary["written"], summary["errors"]) == (12, 12, 2)
+    assert summary["stages"]["sanitize"]["done"] == 11  # EMPTY failed while reading
+    assert summary["stages"]["llm"]["errors"] == 1
+
+    lines = [json.loads(line) for line in open(output)]
+    by_id = {line["claim_id"]: line for line in lines}
+    assert by_id["C3"]["result"]["audit_results"][0]["code"] == "12001"
+    assert by_id["BAD"]["stage"] == "llm" and "model unavailable" in by_id["BAD"]["error"]
+    assert by_id["EMPTY"]["stage"] == "read"
+    # The LLM saw sanitized text only
+    assert all("SIMPLE REPAIR" in p or "OUTAGE" in p for p in calls)
+
+    # A second run skips finished claims and retries only the failed ones
+    calls.clear()
+    summary = run(manifest, output)
+    assert (summary["skipped"], summary["written"]) == (10, 2)
+    assert len(calls) == 3  # BAD, with its retries
+
+def test_resume_after_torn_line(batch_env):
+    _, tmp_path = batch_env
+    manifest = write_manifest(tmp_path / "claims.jsonl", [claim("C1"), claim("C2")])
+    output = tmp_path / "out.jsonl"
+    output.write_text(json.dumps({"claim_id": "C1", "result": {}}) + "\n" + '{"claim_id": "C2", "res')
+
+    summary = run(manifest, str(output))
+    assert (summary["skipped"], summary["written"]) == (1, 1)
+    last = json.loads(output.read_text().splitlines()[-1])
+    assert last["claim_id"] == "C2" and "result" in last
+
+def test_csv_manifest(tmp_path):
+    (tmp_path / "note.txt").write_text("Debridement and repair.")
+    (tmp_path / "claims.csv").write_text(
+        "claim_id,text_file,cpt_codes,dx_codes,date_of_service\n"
+        "A1,note.txt,12001:1;11042:2,S01.01XA L97.412,2024-06-01\n")
+    [parsed] = batch_audit.read_manifest(str(tmp_path / "claims.csv"))
+    assert parsed.error is None
+    assert parsed.kwargs["raw_text"] == "Debridement and repair."
+    assert parsed.kwargs["units_map"] == {"12001": 1, "11042": 2}
+    assert parsed.kwargs["diagnosis_codes"] == ["S01.01XA", "L97.412"]
+    assert parsed.kwargs["date_of_service"] == "20240601"
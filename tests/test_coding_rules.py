@@ -0,0 +1,250 @@
+import sqlite3
+import threading
+import pytest
+from execution.medical_audit import CodingRulesDB
+from execution.ingest_coding_rules import create_schema
+
+# conftest mocks sqlite3.connect for every test; these tests need the real driver
+REAL_CONNECT = sqlite3.connect
+
+NCCI_ROWS = [
+    ("14301", "11642", "20200101", "*", "0"),
+    ("14301", "12001", "20200101", "*", "1"),
+    ("13121", "12001", "20200101", "*", "1"),
+    ("99291", "36000", "20200101", "*", "0"),
+]
+MUE_ROWS = [
+    ("14301", 1, "2", "Anatomic Consideration"),
+    ("14302", 8, "3", "Clinical Data"),
+]
+CPT_ROWS = [
+    ("11642", "Exc f/e/e/n/l mal+marg 1.1-2"),
+    ("14301", "Tis trnfr any 30.1-60 sq cm"),
+]
+
+
+@pytest.fixture
+def rules_db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite3, "connect", REAL_CONNECT)
+    path = tmp_path / "coding_rules.db"
+    conn = sqlite3.connect(path)
+    create_schema(conn)
+    conn.executemany("INSERT INTO ncci_edits (column1_code, column2_code, effective_date, deletion_date, modifier_indicator) VALUES (?, ?, ?, ?, ?)", NCCI_ROWS)
+    conn.executemany("INSERT INTO mue_limits VALUES (?, ?, ?, ?)", MUE_ROWS)
+    conn.executemany("INSERT INTO cpt_codes VALUES (?, ?)", CPT_ROWS)
+    conn.commit()
+    conn.close()
+    return str(path)
+
+def test_queries_reuse_pooled_connection(rules_db_path):
+    db = CodingRulesDB(rules_db_path, pool_size=2)
+
+    assert db.get_cpt_description("14301") == "Tis trnfr any 30.1-60 sq cm"
+    assert db.check_mue("14301", 2)["limit"] == 1
+    assert db.check_mue("14302", 2) is None
+    alerts = db.check_ncci(["14301", "11642", "12001"])
+    assert {(a["code"], a["conflict_with"]) for a in alerts} == {("11642", "14301"), ("12001", "14301")}
+
+    stats = db.stats()
+    assert stats["connections_opened"] == 1
+    assert stats["queries"] == 4
+    db.close()
+
+def test_pool_is_bounded_across_threads(rules_db_path):
+    db = CodingRulesDB(rules_db_path, pool_size=2)
+    errors = []
+
+    def worker():
+        for _ in range(50):
+            if db.check_mue("14301", 5) is None:
+                errors.append("missing MUE")
+
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    assert not errors
+    assert db.stats()["connections_opened"] <= 2
+    db.close()
+
+def test_missing_database_returns_no_findings(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite3, "connect", REAL_CONNECT)
+    db = CodingRulesDB(str(tmp_path / "missing.db"))
+    assert db.check_mue("14301", 5) is None
+    assert db.check_ncci(["14301", "11642"]) == []
+    assert db.stats()["connection_errors"] == 2
+
+def test_lookup_claim_matches_per_code_queries(rules_db_path):
+    db = CodingRulesDB(rules_db_path)
+    codes = ["14301", "11642", "12001", "14302"]
+    units = {"14301": 2, "14302": 3}
+
+    claim = db.lookup_claim(codes, units)
+    assert db.stats()["queries"] == 3
+
+    assert claim.ncci_findings() == db.check_ncci(codes)
+    for code in codes:
+        assert claim.mue_finding(code) == db.check_mue(code, units.get(code, 1))
+    assert claim.definition("11642").startswith("Exc f/e/e/n/l")
+    assert claim.definition("14302").startswith("Adjacent tissue transfer")  # augmented rule wins
+
+    alerts = claim.alerts_by_code()
+    assert [a["conflict_with"] for a in alerts["14301"]] == ["MUE LIMIT"]
+    assert [a["conflict_with"] for a in alerts["11642"]] == ["14301"]
+
+def test_compact_index_matches_sqlite(rules_db_path):
+    from execution.rules_engine import CompactRulesIndex
+
+    db = CodingRulesDB(rules_db_path)
+    index = CompactRulesIndex.from_sqlite(rules_db_path)
+    codes = ["14301", "11642", "12001", "13121", "99999"]
+
+    key = lambda a: (a["code"], a["conflict_with"])
+    assert sorted(index.check_ncci(codes), key=key) == sorted(db.check_ncci(codes), key=key)
+    for code in codes:
+        assert index.check_mue(code, 2) == db.check_mue(code, 2)
+        assert index.get_cpt_description(code) == db.get_cpt_description(code)
+
+    claim = index.lookup_claim(codes, {"14301": 2})
+    assert claim.alerts_by_code().keys() == db.lookup_claim(codes, {"14301": 2}).alerts_by_code().keys()
+    assert index.stats()["ncci_edges"] == len(NCCI_ROWS)
+
+def test_snapshot_round_trip(rules_db_path, tmp_path):
+    from execution.rules_engine import CompactRulesIndex
+    from execution.rules_snapshot import RulesSnapshot, SnapshotError, write_snapshot
+
+    index = CompactRulesIndex.from_sqlite(rules_db_path)
+    snapshot_path = tmp_path / "coding_rules.snapshot"
+    write_snapshot(index, snapshot_path)
+    snapshot = RulesSnapshot(snapshot_path)
+
+    codes = ["14301", "11642", "12001", "13121", "99999"]
+    assert snapshot.check_ncci(codes) == index.check_ncci(codes)
+    for code in codes:
+        assert snapshot.check_mue(code, 2) == index.check_mue(code, 2)
+        assert snapshot.get_cpt_description(code) == index.get_cpt_description(code)
+
+    (tmp_path / "bad.snapshot").write_bytes(b"not a snapshot" * 4)
+    with pytest.raises(SnapshotError):
+        RulesSnapshot(tmp_path / "bad.snapshot")
+
+def test_get_rules_db_reloads_replaced_file(rules_db_path, tmp_path, monkeypatch):
+    import os
+    from execution import coding_rules
+
+    monkeypatch.setattr(coding_rules, "RULES_DB_PATH", rules_db_path)
+    monkeypatch.setattr(coding_rules, "RULES_ENGINE", "sqlite")
+    monkeypatch.setattr(coding_rules, "RULES_RELOAD_INTERVAL", 0.001)
+    monkeypatch.setattr(coding_rules, "_rules_db", None)
+
+    first = coding_rules.get_rules_db()
+    assert first.rules_version == 0
+    assert coding_rules.get_rules_db() is first
+
+    # Publish a new rules file the way ingest does: build aside, then rename over
+    next_path = tmp_path / "next.db"
+    conn = sqlite3.connect(next_path)
+    sqlite3.connect(rules_db_path).backup(conn)
+    conn.execute("INSERT INTO rules_version VALUES (7, '2025-04-01', 'delta', '[]', '{}')")
+    conn.execute("DELETE FROM ncci_edits WHERE column2_code = '11642'")
+    conn.commit()
+    conn.close()
+    os.replace(next_path, rules_db_path)
+
+    coding_rules._rules_db_checked_at = 0.0
+    reloaded = coding_rules.get_rules_db()
+    assert reloaded is not first
+    assert reloaded.rules_version == 7
+    assert reloaded.check_ncci(["14301", "11642"]) == []
+    reloaded.close()
+
+def test_ncci_filters_on_date_of_service(rules_db_path, tmp_path):
+    from execution.rules_engine import CompactRulesIndex
+    from execution.rules_snapshot import RulesSnapshot, write_snapshot
+
+    conn = sqlite3.connect(rules_db_path)
+    conn.executemany("INSERT INTO ncci_edits (column1_code, column2_code, effective_date, deletion_date, modifier_indicator) VALUES (?, ?, ?, ?, ?)", [
+        ("13121", "11642", "20200101", "20230101", "1"),  # deleted
+        ("14301", "13100", "20300101", "*", "1"),         # not yet effective
+    ])
+    conn.commit()
+    conn.close()
+
+    db = CodingRulesDB(rules_db_path)
+    index = CompactRulesIndex.from_sqlite(rules_db_path)
+    write_snapshot(index, tmp_path / "dated.snapshot")
+    snapshot = RulesSnapshot(tmp_path / "dated.snapshot")
+
+    codes = ["14301", "11642", "12001", "13121", "13100"]
+    pairs = lambda alerts: sorted((a["conflict_with"], a["code"]) for a in alerts)
+    assert pairs(db.check_ncci(codes)) == [("13121", "11642"), ("13121", "12001"), ("14301", "11642"),
+                                           ("14301", "12001"), ("14301", "13100")]
+
+    active = [("13121", "12001"), ("14301", "11642"), ("14301", "12001")]
+    for engine in (db, index, snapshot):
+        assert pairs(engine.check_ncci(codes, "2024-06-01")) == active
+        assert pairs(engine.lookup_claim(codes, date_of_service="20240601").ncci_findings()) == active
+    # Deletion date is exclusive, effective date inclusive
+    assert ("13121", "11642") not in pairs(index.check_ncci(codes, "2023-01-01"))
+    assert ("13121", "11642") in pairs(db.check_ncci(codes, "2022-12-31"))
+    assert ("14301", "13100") in pairs(snapshot.check_ncci(codes, "2030-01-01"))
+
+    with pytest.raises(ValueError):
+        db.check_ncci(codes, "06/01/2024")
+    db.close()
+
+def test_hot_queries_never_scan(rules_db_path):
+    plans = []
+
+    class PlanRecordingDB(CodingRulesDB):
+        def _query(self, conn, sql, params=()):
+            plans.append((sql, [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]))
+            return super()._query(conn, sql, params)
+
+    db = PlanRecordingDB(rules_db_path)
+    codes = ["14301", "11642", "12001"]
+    db.check_mue("14301", 2)
+    db.get_cpt_description("14301")
+    db.check_ncci(codes)
+    db.check_ncci(codes, "2024-06-01")
+    db.lookup_claim(codes, {"14301": 2})
+    db.lookup_claim(codes, date_of_service="2024-06-01")
+    db.close()
+
+    assert len(plans) == 10
+    for sql, details in plans:
+        assert details and all(d.startswith("SEARCH") for d in details), (sql, details)
+
+def test_snapshot_close_waits_for_in_flight_lookups(rules_db_path, tmp_path, monkeypatch):
+    from execution import coding_rules
+    from execution.rules_engine import CompactRulesIndex
+    from execution.rules_snapshot import SnapshotError, write_snapshot
+
+    snapshot_path = tmp_path / "coding_rules.snapshot"
+    write_snapshot(CompactRulesIndex.from_sqlite(rules_db_path), snapshot_path)
+    monkeypatch.setattr(coding_rules, "RULES_SNAPSHOT_PATH", str(snapshot_path))
+    monkeypatch.setattr(coding_rules, "RULES_ENGINE", "snapshot")
+    monkeypatch.setattr(coding_rules, "RULES_RELOAD_INTERVAL", 0.001)
+    monkeypatch.setattr(coding_rules, "_rules_db", None)
+    monkeypatch.setattr(coding_rules, "_retired_rules_db", None)
+
+    first = coding_rules.get_rules_db()
+    with first._reading():
+        first.close()
+        assert not first.closed  # a lookup is still running
+        assert first.code_id("14301") >= 0  # its views are still mapped
+    assert first.closed
+    with pytest.raises(SnapshotError):
+        first.lookup_claim(["14301"])
+
+    # A replaced snapshot stays open until the next reload check, then is unmapped
+    monkeypatch.setattr(coding_rules, "_rules_db", None)
+    old = coding_rules.get_rules_db()
+    write_snapshot(CompactRulesIndex.from_sqlite(rules_db_path), snapshot_path)
+    coding_rules._rules_db_stamp = None
+    coding_rules._rules_db_checked_at = 0.0
+    new = coding_rules.get_rules_db()
+    assert new is not old and not old.closed
+    coding_rules._rules_db_checked_at = 0.0
+    assert coding_rules.get_rules_db() is new and old.closed
+    new.close()
@@ -0,0 +1,93 @@
+import json
+import re
+import pytest
+from cache_utils import TieredCache, TTLCache
+from execution import medical_audit
+from execution.rules_engine import CompactRulesIndex
+
+TEXT = "Simple repair of a 2.0 cm scalp laceration. Excisional debridement. Therapeutic exercise."
+
+LLM_RESPONSE = json.dumps({
+    "audit_results": [
+        {"code": "11042", "documentation_status": "PASS", "calculated_units": "1", "billing_risk_alert": "NONE",
+         "risk_rationale": "", "clinical_evidence": "debridement"},
+        {"code": "12001", "documentation_status": "PASS", "calculated_units": "1", "billing_risk_alert": "NONE",
+         "risk_rationale": "", "clinical_evidence": "2.0 cm laceration"},
+    ],
+    "diagnosis_analysis": "- Specific.",
+    "documentation_improvement": "- None.",
+})
+
+
+@pytest.fixture
+def audit_env(monkeypatch):
+    prompts = []
+    rules = CompactRulesIndex.from_rows(
+        [("12001", "11042", "0"), ("12001", "11043", "1")],
+        mue_rows=[("97110", 4, "2 Date of Service Edit: Policy", "Clinical"),
+                  ("97140", 4, "3 Date of Service Edit: Clinical", "Clinical")])
+
+    def fake_llm(prompt, system_prompt, tool=None):
+        prompts.append(prompt)
+        # The canned entries, plus one for any other code in the claim
+        answer = json.loads(LLM_RESPONSE)
+        listed = {item["code"] for item in answer["audit_results"]}
+        codes = json.loads(re.search(r"CPT codes: (\[.*\])", prompt).group(1))
+        answer["audit_results"] += [dict(answer["audit_results"][1], code=code) for code in codes if code not in listed]
+        return json.dumps(answer)
+
+    monkeypatch.setattr(medical_audit, "query_anthropic", fake_llm)
+    monkeypatch.setattr(medical_audit, "stream_anthropic", lambda prompt, system: iter([fake_llm(prompt, system)]))
+    monkeypatch.setattr(medical_audit, "get_rules_db", lambda: rules)
+    monkeypatch.setattr(medical_audit, "audit_cache", TieredCache(TTLCache()))
+    monkeypatch.setattr(medical_audit, "AUDIT_FAST_PATH", True)
+    return prompts
+
+def audit(codes, units=None, stream=False):
+    fn = medical_audit.stream_audit_medical_record if stream else medical_audit.audit_medical_record
+    return fn(TEXT, list(codes), ["S01.01XA"], units_map=units or {}, pre_sanitized=True,
+              date_of_service="2024-06-01", use_cache=False)
+
+def test_llm_skipped_when_rules_decide_every_line(audit_env):
+    result = audit(["97110"], units={"97110": 6})
+    assert audit_env == []
+    [line] = result["audit_results"]
+    assert line["decision_path"] == "rules"
+    assert line["billing_risk_alert"] == "HIGH - MUE EXCEEDED"
+    assert line["billed_units"] == 6
+    assert "diagnosis_analysis" in result
+
+def test_only_undecided_lines_reach_the_model(audit_env):
+    result = audit(["11042", "12001"])
+    [prompt] = audit_env
+    assert 'CPT codes: ["12001"]' in prompt and "11042" not in prompt
+
+    # Claim order is kept and the model's opinion of a decided line is dropped
+    assert [(r["code"], r["decision_path"]) for r in result["audit_results"]] == [("11042", "rules"), ("12001", "llm")]
+    assert result["audit_results"][0]["documentation_status"] == "NOT REVIEWED"
+    assert result["audit_results"][0]["billing_risk_alert"] == "HIGH - NCCI BUNDLING"
+
+def test_overridable_edits_still_go_to_the_model(audit_env):
+    # NCCI indicator 1 (modifier may apply) and MUE MAI 3 (appealable) need the documentation
+    result = audit(["12001", "11043", "97140"], units={"97140": 6})
+    assert len(audit_env) == 1
+    assert all(r["decision_path"] == "llm" for r in result["audit_results"])
+
+def test_fast_path_can_be_disabled(audit_env, monkeypatch):
+    monkeypatch.setattr(medical_audit, "AUDIT_FAST_PATH", False)
+    result = audit(["97110"], units={"97110": 6})
+    assert len(audit_env) == 1
+    assert "97110" in audit_env[0]
+    assert all(r["decision_path"] == "llm" for r in result["audit_results"])
+
+def test_stream_sends_decided_lines_before_the_model_runs(audit_env):
+    events = audit(["11042", "12001"], stream=True)
+    assert next(events)[0] == "start"
+    name, line = next(events)
+    assert (name, line["code"], line["decision_path"]) == ("result", "11042", "rules")
+    assert audit_env == []
+
+    rest = list(events)
+    assert [name for name, _ in rest] == ["result", "complete"]
+    assert rest[0][1]["code"] == "12001"
+    assert rest[-1][1]["audit_results"] == audit(["11042", "12001"])["audit_results"]
@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+from app import highlight_phi, highlight_sanitized_replacements, render_spans
+
+
+def entity(start, end, entity_type):
+    return SimpleNamespace(start=start, end=end, entity_type=entity_type)
+
+
+def test_highlight_phi_escapes_text_and_handles_overlap_and_adjacency():
+    text = "<b>Pt</b> John Smith 01/02/2023 & Boston"
+    john, smith = text.index("John"), text.index("Smith")
+    date = text.index("01/02")
+    boston = text.index("Boston")
+    entities = [entity(boston, boston + 6, "LOCATION"),
+                entity(john, smith + 5, "PERSON"), entity(smith, smith + 5, "LOCATION"),   # overlapping
+                entity(date, date + 10, "DATE_TIME"), entity(date + 10, date + 11, "DATE_TIME")]  # adjacent
+
+    assert highlight_phi(text, entities) == (
+        '&lt;b&gt;Pt&lt;/b&gt; <mark class="phi-match" title="PERSON, LOCATION">John Smith</mark> '
+        '<mark class="phi-match" title="DATE_TIME">01/02/2023</mark><mark class="phi-match" title="DATE_TIME"> </mark>'
+        '&amp; <mark class="phi-match" title="LOCATION">Boston</mark>')
+    assert highlight_phi("a < b", []) == "a &lt; b"
+
+
+def test_sanitized_placeholders_are_marked_and_escaped():
+    assert highlight_sanitized_replacements("Seen by <PERSON> on <DATE>.") == (
+        'Seen by <mark class="phi-replacement">&lt;PERSON&gt;</mark> on '
+        '<mark class="phi-replacement">&lt;DATE&gt;</mark>.')
+
+
+def test_render_spans_clamps_and_skips_empty_spans():
+    assert render_spans("abc", [(-1, 1, "x", None), (2, 2, "x", None), (2, 9, "y", '"q"')]) == (
+        '<mark class="x">a</mark>b<mark class="y" title="&quot;q&quot;">c</mark>')
@@ -0,0 +1,158 @@
+import sqlite3
+import pytest
+import ingest_coding_rules as ingest
+
+REAL_CONNECT = sqlite3.connect
+
+NCCI_TEXT = """Column 1/Column 2 Edits
+14301\t11642\t20200101\t*\t0\tStandards of medical / surgical practice
+14301\t12001\t20200101\t*\t1\tMisuse of column two code
+14301\t11642\t20210101\t*\t1\tDuplicate pair: first occurrence wins
+"""
+MUE_TEXT = """HCPCS,MUE,MAI,Rationale
+14301,1,2 Date of Service Edit: Policy,Anatomic Consideration
+14301,2,3 Date of Service Edit: Clinical,Later row wins
+BADROW,x,1,
+"""
+
+
+@pytest.fixture
+def source_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite3, "connect", REAL_CONNECT)
+    (tmp_path / "ccipra-test.TXT").write_text(NCCI_TEXT)
+    (tmp_path / "MCR_MUE_test.csv").write_text(MUE_TEXT)
+    return tmp_path
+
+def dump(db_path):
+    conn = sqlite3.connect(db_path)
+    tables = {
+        "ncci": conn.execute("SELECT column1_code, column2_code, effective_date, modifier_indicator FROM ncci_edits ORDER BY 1, 2").fetchall(),
+        "mue": conn.execute("SELECT hcpcs_code, max_units, mai FROM mue_limits").fetchall(),
+    }
+    conn.close()
+    return tables
+
+def test_bulk_rebuild_matches_incremental_load(source_files):
+    ncci = [str(source_files / "ccipra-*.TXT")]
+    mue = str(source_files / "MCR_MUE_test.csv")
+
+    bulk_db = source_files / "bulk.db"
+    ingest.bulk_rebuild(str(bulk_db), [mue], ncci, None)
+
+    incremental_db = source_files / "incremental.db"
+    conn = ingest.init_db(str(incremental_db))
+    ingest.ingest_mue(conn, mue)
+    ingest.ingest_ncci(conn, ncci)
+    conn.close()
+
+    assert dump(bulk_db) == dump(incremental_db)
+    assert dump(bulk_db)["ncci"] == [("14301", "11642", "20200101", "0"), ("14301", "12001", "20200101", "1")]
+    assert dump(bulk_db)["mue"] == [("14301", 2, "3 Date of Service Edit: Clinical")]
+    assert not (source_files / "bulk.db.building").exists()
+
+def test_chunked_parse_keeps_every_line_once(source_files):
+    path = str(source_files / "ccipra-test.TXT")
+    expected = list(ingest.iter_ncci_rows(path))
+
+    # Chunk sizes that split lines mid-way and land exactly on newlines
+    for chunk_bytes in (1, 7, 64, 10 ** 6):
+        rows = []
+        for task in ingest.plan_chunks(path, chunk_bytes):
+            rows.extend(ingest.parse_ncci_chunk(task))
+        assert rows == expected
+
+def test_parallel_ingest_resolves_duplicates_like_serial(source_files, monkeypatch):
+    # Small chunks, so the pool parses several byte ranges and returns them out of order
+    monkeypatch.setattr(ingest, "CHUNK_BYTES", 48)
+    path = str(source_files / "ccipra-test.TXT")
+    assert sum(1 for task in ingest.plan_chunks(path) if ingest.parse_ncci_chunk(task)) >= 3
+
+    pool = ingest.parser_pool(2)
+    try:
+        rows = [row for batch in ingest.iter_ncci_batches(path, pool, max_in_flight=2) for row in batch]
+    finally:
+        pool.shutdown()
+    assert rows == list(ingest.iter_ncci_rows(path))
+
+    ncci = [str(source_files / "ccipra-*.TXT")]
+    serial_db = source_files / "serial.db"
+    parallel_db = source_files / "parallel.db"
+    ingest.bulk_rebuild(str(serial_db), [], ncci, None)
+    ingest.bulk_rebuild(str(parallel_db), [], ncci, None, workers=2)
+    assert dump(parallel_db) == dump(serial_db)
+
+NEXT_QUARTER_NCCI = """Column 1/Column 2 Edits
+14301\t11642\t20200101\t20250401\t0\tDeleted this quarter
+14301\t13100\t20250401\t*\t1\tNew edit
+"""
+
+def test_delta_ingest_applies_only_changes(source_files):
+    db_path = str(source_files / "rules.db")
+    ingest.bulk_rebuild(db_path, [str(source_files / "MCR_MUE_test.csv")],
+                        [str(source_files / "ccipra-*.TXT")], None)
+
+    (source_files / "next").mkdir()
+    (source_files / "next" / "ccipra-next.TXT").write_text(NEXT_QUARTER_NCCI)
+    version, changes = ingest.delta_ingest(db_path, [], [str(source_files / "next" / "ccipra-*.TXT")], force=True)
+
+    # 11642 changed (deletion date), 13100 is new, 12001 is gone; MUE untouched
+    assert changes == {"ncci_edits": {"inserted": 1, "updated": 1, "deleted": 1}}
+    rebuilt = source_files / "rebuilt.db"
+    ingest.bulk_rebuild(str(rebuilt), [str(source_files / "MCR_MUE_test.csv")],
+                        [str(source_files / "next" / "ccipra-*.TXT")], None)
+    assert dump(db_path) == dump(rebuilt)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT version, mode FROM rules_version ORDER BY version").fetchall() == [(1, "full"), (version, "delta")]
+    conn.close()
+    assert not (source_files / "rules.db.next").exists()
+
+def test_upsert_ingest_swaps_in_a_new_file(source_files):
+    db_path = source_files / "rules.db"
+    ingest.bulk_rebuild(str(db_path), [], [str(source_files / "ccipra-*.TXT")], None)
+    live_inode = db_path.stat().st_ino
+
+    version = ingest.upsert_ingest(str(db_path), [str(source_files / "MCR_MUE_test.csv")], [])
+
+    # Readers open the live file with immutable=1: it must be replaced, never written
+    assert db_path.stat().st_ino != live_inode
+    assert dump(db_path)["ncci"] == [("14301", "11642", "20200101", "0"), ("14301", "12001", "20200101", "1")]
+    assert dump(db_path)["mue"] == [("14301", 2, "3 Date of Service Edit: Clinical")]
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT version, mode FROM rules_version ORDER BY version").fetchall() == [(1, "full"), (version, "upsert")]
+    conn.close()
+    assert not (source_files / "rules.db.building").exists()
+
+def test_upsert_ingest_upgrades_a_baseline_database(source_files):
+    # Schema written by the original ingest script: no rules_version table
+    db_path = source_files / "rules.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE ncci_edits (column1_code TEXT, column2_code TEXT, effective_date TEXT, deletion_date TEXT,
+                                 modifier_indicator TEXT, rationale TEXT, PRIMARY KEY (column1_code, column2_code));
+        CREATE TABLE mue_limits (hcpcs_code TEXT PRIMARY KEY, max_units INTEGER, mai TEXT, rationale TEXT);
+        CREATE TABLE cpt_codes (code TEXT PRIMARY KEY, short_desc TEXT);
+        INSERT INTO ncci_edits VALUES ('99213', '36415', '20200101', '*', '0', 'Existing edit');
+    """)
+    conn.close()
+
+    version = ingest.upsert_ingest(str(db_path), [str(source_files / "MCR_MUE_test.csv")],
+                                   [str(source_files / "ccipra-*.TXT")])
+
+    assert version == 1
+    assert ("99213", "36415", "20200101", "0") in dump(db_path)["ncci"]
+    assert dump(db_path)["mue"] == [("14301", 2, "3 Date of Service Edit: Clinical")]
+    assert not (source_files / "rules.db.building").exists()
+
+def test_delta_ingest_refuses_mass_delete(source_files):
+    db_path = str(source_files / "rules.db")
+    ingest.bulk_rebuild(db_path, [], [str(source_files / "ccipra-*.TXT")], None)
+    before = dump(db_path)
+
+    # Only one of the quarter's files supplied: almost every existing edit looks deleted
+    (source_files / "partial").mkdir()
+    (source_files / "partial" / "ccipra-p1.TXT").write_text("99213\t36415\t20250401\t*\t0\tOther file\n")
+    with pytest.raises(ValueError):
+        ingest.delta_ingest(db_path, [], [str(source_files / "partial" / "ccipra-*.TXT")])
+    assert dump(db_path) == before
+    assert not (source_files / "rules.db.next").exists()
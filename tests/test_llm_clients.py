@@ -0,0 +1,39 @@
+import threading
+from benchmarks.fake_llm_server import FakeLLMServer
+from execution.medical_audit import LLMClientManager
+
+
+def test_http_pool_reuses_connection_and_records_latency():
+    manager = LLMClientManager(pool_size=2)
+    with FakeLLMServer(latency_ms=5) as server:
+        client = manager.http_client()
+        for _ in range(3):
+            response = client.post(f"{server.url}/v1/messages", json={"model": "fake", "messages": []})
+            assert response.json()["content"][0]["type"] == "text"
+        assert manager.http_client() is client
+        assert server.stats() == {"connections": 1, "requests": 3, "cache_reads": 0, "cache_writes": 0}
+    manager.reset()
+
+    stats = manager.stats()
+    assert stats["calls"] == 3
+    assert stats["new_connections"] == 1
+    assert stats["latency"]["connect"]["count"] == 1
+    assert stats["latency"]["ttfb"]["count"] == 3
+    assert stats["latency"]["ttfb"]["p50_ms"] >= 5
+
+def test_bedrock_client_created_once_across_threads(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "fake")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "fake")
+    manager = LLMClientManager()
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(manager.bedrock())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len({id(c) for c in clients}) == 1
+    assert manager.stats()["clients_created"] == 1
+    assert clients[0].meta.config.max_pool_connections == manager.pool_size
+    manager.reset()
+    assert manager.bedrock() is not clients[0]
@@ -0,0 +1,31 @@
+import spacy
+from presidio_analyzer import AnalyzerEngine
+import sanitize_phi
+from spacy_engine import TrimmedSpacyNlpEngine
+
+
+def save_pipeline(path):
+    # Untrained stand-in for an en_core_web_* package: a tagger Presidio does not need, plus NER
+    nlp = spacy.blank("en")
+    nlp.add_pipe("tagger").add_label("NN")
+    nlp.add_pipe("ner").add_label("PERSON")
+    nlp.initialize()
+    nlp.to_disk(path)
+    return str(path)
+
+
+def test_trimmed_engine_skips_excluded_components(tmp_path):
+    engine = TrimmedSpacyNlpEngine(model_name=save_pipeline(tmp_path), exclude=("tagger",))
+    engine.load()
+    assert engine.nlp["en"].pipe_names == ["ner"]
+
+    # No lemmatizer: lowercased tokens keep Presidio's context words matching
+    artifacts = engine.process_text("Patient SSN on File", "en")
+    assert artifacts.lemmas == ["patient", "ssn", "on", "file"] and "ssn" in artifacts.keywords
+    [(_, batched, context)] = engine.process_batch([("Patient SSN on File", 7)], "en", as_tuples=True)
+    assert batched.lemmas == artifacts.lemmas and context == 7
+    assert "ORGANIZATION" in engine.ner_model_configuration.labels_to_ignore
+
+    analyzer = AnalyzerEngine(nlp_engine=engine, supported_languages=["en"])
+    results = analyzer.analyze("Call 212-555-0199 after the visit.", language="en", entities=sanitize_phi.ENTITIES)
+    assert [(r.entity_type, r.start, r.end) for r in results] == [("PHONE_NUMBER", 5, 17)]
@@ -0,0 +1,71 @@
+import json
+import logging
+import pytest
+from benchmarks.fake_llm_server import FakeLLMServer
+from cache_utils import TieredCache, TTLCache
+from execution import medical_audit
+from execution.cpt_data import CPT_DEFINITIONS
+from execution.rules_engine import CompactRulesIndex
+
+LLM_RESPONSE = json.dumps({"audit_results": [
+    {"code": "12001", "documentation_status": "PASS", "calculated_units": "1", "billing_risk_alert": "NONE",
+     "risk_rationale": "", "clinical_evidence": "2.0 cm laceration"}]})
+
+
+@pytest.fixture
+def audit_env(monkeypatch):
+    monkeypatch.setattr(medical_audit, "get_rules_db", lambda: CompactRulesIndex.from_rows([]))
+    monkeypatch.setattr(medical_audit, "audit_cache", TieredCache(TTLCache()))
+
+def audit(text="Simple repair of a 2.0 cm scalp laceration.", codes=("12001",)):
+    return medical_audit.audit_medical_record(text, list(codes), ["S01.01XA"], pre_sanitized=True,
+                                              date_of_service="2024-06-01")
+
+def test_static_prefix_is_cached_and_claim_is_compact(audit_env, monkeypatch):
+    calls = []
+    monkeypatch.setattr(medical_audit, "query_anthropic",
+                        lambda prompt, system, tool=None: calls.append((prompt, system)) or LLM_RESPONSE)
+    audit(codes=("12001", "99999"))
+
+    prompt, system = calls[0]
+    [block] = system
+    assert block["cache_control"] == {"type": "ephemeral"}
+    assert CPT_DEFINITIONS["12001"] in block["text"]
+    assert len(block["text"]) // 4 >= 1024  # below the model minimum the API silently skips caching
+
+    # The claim carries only per-claim data: no instructions, no indentation
+    assert CPT_DEFINITIONS["12001"] not in prompt and "OUTPUT FORMAT" not in prompt
+    assert '["12001", "99999"]' in prompt and "CPT 99999" in prompt
+    assert not any(line.startswith(" ") for line in prompt.splitlines())
+
+def test_prompt_cache_off_sends_only_the_claims_definitions(audit_env, monkeypatch):
+    calls = []
+    monkeypatch.setattr(medical_audit, "PROMPT_CACHE", False)
+    monkeypatch.setattr(medical_audit, "query_anthropic",
+                        lambda prompt, system, tool=None: calls.append((prompt, system)) or LLM_RESPONSE)
+    audit()
+
+    # No cache to amortize it, so no full CPT reference: just the billed code's definition
+    prompt, system = calls[0]
+    assert isinstance(system, str) and medical_audit.CPT_REFERENCE not in system
+    assert CPT_DEFINITIONS["12001"] not in system and CPT_DEFINITIONS["12001"] in prompt
+    assert CPT_DEFINITIONS["13121"] not in prompt
+
+def test_audits_read_the_cached_prefix_and_report_usage(audit_env, monkeypatch, caplog):
+    monkeypatch.setattr(medical_audit, "LLM_PROVIDER", "anthropic")
+    monkeypatch.setattr(medical_audit, "ANTHROPIC_API_KEY", "fake")
+    monkeypatch.setattr(medical_audit, "llm_clients", medical_audit.LLMClientManager())
+
+    with FakeLLMServer(response=LLM_RESPONSE) as server, caplog.at_level(logging.INFO):
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", server.url)
+        audit("Repair of a 2.0 cm scalp laceration.")
+        audit("Repair of a 2.5 cm scalp laceration.")
+        server_stats = server.stats()
+    medical_audit.llm_clients.reset()
+
+    assert (server_stats["cache_writes"], server_stats["cache_reads"]) == (1, 1)
+    usage = medical_audit.llm_clients.stats()["usage"]
+    prefix_tokens = usage["cache_creation_input_tokens"]
+    assert prefix_tokens >= 1024 and usage["cache_read_input_tokens"] == prefix_tokens
+    assert 0 < usage["input_tokens"] < prefix_tokens  # the uncached claims are the small part
+    assert sum("Audit tokens for 1 codes" in r.message for r in caplog.records) == 2
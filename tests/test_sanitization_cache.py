@@ -0,0 +1,89 @@
+import multiprocessing
+import sqlite3
+import pytest
+import sanitize_phi
+from cache_utils import SQLiteCache, TieredCache, TTLCache
+
+REAL_CONNECT = sqlite3.connect
+
+
+def fake_sanitize_text(calls):
+    def fake_sanitize(text):
+        calls.append(text)
+        found = [sanitize_phi.SessionEntity("PERSON", text.index("John Doe"), text.index("John Doe") + 8, 0.85)]
+        return text.replace("John Doe", "<PERSON>"), found if "John Doe" in text else []
+    return fake_sanitize
+
+@pytest.fixture
+def fake_presidio(monkeypatch):
+    """Replace the spaCy pass with a counting stub and start from an empty session cache."""
+    calls = []
+    fake_sanitize = fake_sanitize_text(calls)
+
+    monkeypatch.setattr(sanitize_phi, "sanitize_text", fake_sanitize)
+    monkeypatch.setattr(sanitize_phi, "session_cache", TTLCache(max_entries=8, ttl_seconds=60))
+    return calls
+
+def test_session_reused_for_audit(fake_presidio):
+    token, sanitized, _ = sanitize_phi.sanitize_session("Patient John Doe had a repair.")
+    assert sanitized == "Patient <PERSON> had a repair."
+
+    # The UI posts back the sanitized text with the token: no second NLP pass
+    reused, _ = sanitize_phi.resolve_sanitized_text(sanitized + "\n", token)
+    assert reused == sanitized
+    assert len(fake_presidio) == 1
+    assert sanitize_phi.session_cache.stats()["hits"] == 1
+
+def test_edited_text_is_sanitized_again(fake_presidio):
+    token, sanitized, _ = sanitize_phi.sanitize_session("Patient John Doe had a repair.")
+
+    edited = sanitized + " Seen by John Doe."
+    result, _ = sanitize_phi.resolve_sanitized_text(edited, token)
+    assert "John Doe" not in result
+    assert len(fake_presidio) == 2
+
+def _worker(step, text, outbox):
+    # A forked gunicorn worker: reopen the inherited SQLite connection, then serve one request
+    calls = []
+    sanitize_phi.sanitize_text = fake_sanitize_text(calls)
+    sanitize_phi.session_cache.reopen()
+    if step == "sanitize":
+        token, sanitized, entities = sanitize_phi.sanitize_session(text)
+        outbox.put((token, sanitized, len(calls)))
+    else:
+        sanitized, entities = sanitize_phi.resolve_sanitized_text(*text)
+        outbox.put((sanitized, [tuple(e) for e in entities], len(calls)))
+
+def test_session_token_is_honoured_by_another_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite3, "connect", REAL_CONNECT)
+    monkeypatch.setattr(sanitize_phi, "session_cache", TieredCache(
+        TTLCache(), SQLiteCache(str(tmp_path / "sessions.db"), ttl_seconds=60)))
+    fork = multiprocessing.get_context("fork")
+    outbox = fork.Queue()
+
+    def run(step, text):
+        worker = fork.Process(target=_worker, args=(step, text, outbox))
+        worker.start()
+        result = outbox.get(timeout=10)
+        worker.join(timeout=10)
+        return result
+
+    token, sanitized, calls = run("sanitize", "Patient John Doe had a repair.")
+    assert calls == 1
+
+    # /audit lands on a different worker: no second NLP pass, same entities
+    reused, entities, calls = run("audit", (sanitized, token))
+    assert (reused, calls) == (sanitized, 0)
+    assert entities == [("PERSON", 8, 16, 0.85)]
+
+def test_ttl_and_size_eviction():
+    now = [0.0]
+    cache = TTLCache(max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("c", 3)
+    assert cache.get("a") is None
+
+    now[0] = 11.0
+    assert cache.get("b") is None
+    assert cache.stats()["misses"] == 2
@@ -0,0 +1,24 @@
+import os
+import time
+from sanitize_phi import SanitizationService
+
+
+def fake_batch(texts, batch_size):
+    # Stands in for sanitize_batch (needs the spaCy model); slow enough that chunks spread out
+    time.sleep(0.05)
+    return [(text.upper(), [os.getpid(), batch_size]) for text in texts]
+
+
+def test_service_returns_results_in_order_across_workers():
+    texts = [f"note {i}" for i in range(25)] + [""]
+    with SanitizationService(workers=2, batch_size=4, batch_fn=fake_batch, warm_up=False) as service:
+        service.warm_up()
+        outputs = service.sanitize_many(texts)
+        single = service.sanitize("one more")
+        stats = service.stats()
+
+    assert [text for text, _ in outputs] == [t.upper() for t in texts]
+    assert len({entities[0] for _, entities in outputs}) == 2   # both workers took chunks
+    assert all(entities[1] == 4 for _, entities in outputs)
+    assert single[0] == "ONE MORE"
+    assert stats["documents"] == 27 and stats["workers"] == 2
@@ -0,0 +1,59 @@
+import json
+import os
+import pytest
+import spacy
+import sanitize_phi
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "phi_corpus.jsonl")
+with open(CORPUS_PATH, encoding="utf-8") as f:
+    CORPUS = [json.loads(line) for line in f]
+
+
+def covered(spans, start, end):
+    return any(s <= start and end <= e for s, e in spans)
+
+@pytest.fixture
+def no_ner_model(tmp_path, monkeypatch):
+    """A tokenizer-only English pipeline as the analyzer model: only the pattern recognizers find anything."""
+    spacy.blank("en").to_disk(tmp_path / "blank_en")
+    monkeypatch.setattr(sanitize_phi, "SPACY_MODEL", str(tmp_path / "blank_en"))
+    monkeypatch.setattr(sanitize_phi, "SPACY_EXCLUDE", ())
+    monkeypatch.setattr(sanitize_phi, "analyzer", None)
+
+def leaked(monkeypatch, mode):
+    monkeypatch.setattr(sanitize_phi, "SANITIZE_MODE", mode)
+    outputs = sanitize_phi.sanitize_batch([doc["text"] for doc in CORPUS])
+    return {(doc["id"], phi) for doc, (sanitized, _) in zip(CORPUS, outputs)
+            for phi in doc["phi"] if phi in sanitized}
+
+def test_pattern_tier_and_ner_windows_cover_every_labeled_phi(no_ner_model):
+    # Each labeled identifier is either found by the pattern recognizers or
+    # inside a window the NER pass will see; nothing falls between the two tiers.
+    for doc in CORPUS:
+        text = doc["text"]
+        pattern_spans = [(r.start, r.end) for r in sanitize_phi.pattern_tier(text) if r.score >= sanitize_phi.MIN_SCORE]
+        windows = sanitize_phi.ner_windows(text)
+        for phi in doc["phi"]:
+            start = text.index(phi)
+            end = start + len(phi)
+            assert covered(pattern_spans, start, end) or covered(windows, start, end), (doc["id"], phi)
+
+def test_tiered_runs_every_pattern_recognizer_over_the_whole_text(no_ner_model, monkeypatch):
+    # Without NER both modes are down to the pattern recognizers: tiered must redact exactly what full does
+    assert leaked(monkeypatch, "tiered") == leaked(monkeypatch, "full")
+
+    # The corpus exercises every pattern entity Presidio is asked for
+    found = {r.entity_type for doc in CORPUS for r in sanitize_phi.pattern_tier(doc["text"])
+             if r.score >= sanitize_phi.MIN_SCORE}
+    assert set(sanitize_phi.ENTITIES) - set(sanitize_phi.NER_ENTITIES) <= found
+
+def test_boilerplate_skips_ner():
+    [no_phi] = [doc for doc in CORPUS if doc["id"] == "no-phi"]
+    assert sanitize_phi.ner_windows(no_phi["text"]) == []
+    total = sum(len(doc["text"]) for doc in CORPUS)
+    ner = sum(end - start for doc in CORPUS for start, end in sanitize_phi.ner_windows(doc["text"]))
+    assert ner < total / 3
+
+@pytest.mark.skipif(not spacy.util.is_package("en_core_web_lg"), reason="needs the en_core_web_lg spaCy model")
+def test_tiered_recall_matches_full(monkeypatch):
+    assert leaked(monkeypatch, "tiered") <= leaked(monkeypatch, "full")
@@ -0,0 +1,94 @@
+import os
+import runpy
+import sqlite3
+import subprocess
+import sys
+from unittest.mock import MagicMock
+import app
+from cache_utils import SQLiteCache, TieredCache, TTLCache
+
+REAL_CONNECT = sqlite3.connect
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+CHECK = """
+import sys
+from unittest.mock import MagicMock
+import app
+from lazy_import import is_loaded
+print(sorted(name for name in ("spacy", "presidio_analyzer", "presidio_anonymizer", "boto3") if name in sys.modules),
+      sorted(name for name in ("anthropic", "httpx") if name in sys.modules and is_loaded(sys.modules[name])))
+"""
+
+
+def test_importing_app_defers_heavy_dependencies():
+    child = subprocess.run([sys.executable, "-c", CHECK], cwd=ROOT, capture_output=True, text=True, check=True,
+                           env=dict(os.environ, PREWARM="false"))
+    assert child.stdout.strip() == "[] []"
+
+
+def test_prewarm_times_each_step_and_survives_failures(monkeypatch):
+    warmed = []
+
+    def missing_model(text):
+        raise OSError("en_core_web_lg is not installed")
+
+    monkeypatch.setattr(app, "get_sanitization_service", lambda: None)
+    monkeypatch.setattr(app, "sanitize_text", missing_model)
+    monkeypatch.setattr(app, "get_rules_db", lambda: warmed.append("rules"))
+    monkeypatch.setattr(app.llm_clients, "warm", lambda: warmed.append("llm_client"))
+
+    timings = app.prewarm()
+
+    assert timings["sanitizer"] is None
+    assert timings["rules"] >= 0 and timings["llm_client"] >= 0
+    assert warmed == ["rules", "llm_client"]
+
+
+def test_reset_after_fork_drops_inherited_connections(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite3, "connect", REAL_CONNECT)
+    cache = TieredCache(TTLCache(), SQLiteCache(str(tmp_path / "cache.db")))
+    cache.put("key", {"v": 1})
+    inherited = cache.disk._conn
+    closed = []
+    monkeypatch.setattr(app, "audit_cache", cache)
+    monkeypatch.setattr(app.llm_clients, "reset", lambda: closed.append("llm_clients"))
+    monkeypatch.setattr(app, "get_rules_db", lambda: type("Rules", (app.CodingRulesDB,), {
+        "__init__": lambda self: None, "close": lambda self: closed.append("rules")})())
+
+    app.reset_after_fork()
+
+    assert closed == ["llm_clients", "rules"]
+    assert cache.disk._conn is not inherited
+    assert TieredCache(TTLCache(), cache.disk).get("key") == {"v": 1}
+
+
+GUNICORN_ENV = """
+import os, runpy
+runpy.run_path("gunicorn.conf.py")
+print(os.environ.get("SANITIZE_SESSION_DB", ""), os.environ.get("AUDIT_JOB_STORE", "-"))
+"""
+
+def test_gunicorn_shares_state_only_between_several_workers():
+    env = {k: v for k, v in os.environ.items() if k not in ("SANITIZE_SESSION_DB", "AUDIT_JOB_STORE")}
+
+    def shared(workers, **extra):
+        return subprocess.run([sys.executable, "-c", GUNICORN_ENV], cwd=ROOT, capture_output=True, text=True,
+                              check=True, env=dict(env, WEB_WORKERS=workers, **extra)).stdout.split()
+
+    session_db, job_store = shared("2")
+    assert session_db.endswith("sanitize_sessions.db") and job_store == "sqlite"
+    assert shared("1") == ["-"]
+    assert shared("2", AUDIT_JOB_STORE="memory")[1] == "memory"  # explicit choice kept (and warned about)
+
+def test_gunicorn_warns_about_per_worker_job_store(monkeypatch):
+    for name, value in {"WEB_WORKERS": "2", "AUDIT_JOB_STORE": "memory", "PREWARM": "false", "LLM_POOL_SIZE": "4",
+                        "SANITIZE_SESSION_DB": "", "AUDIT_JOB_DB": "audit_jobs.db"}.items():
+        monkeypatch.setenv(name, value)  # restored afterwards; the config file sets some of them
+    conf = runpy.run_path(os.path.join(ROOT, "gunicorn.conf.py"))
+    server = MagicMock()
+
+    conf["on_starting"](server)
+
+    [warning] = server.log.warning.call_args_list
+    assert "AUDIT_JOB_STORE=memory with 2 workers" in warning.args[0]
@@ -0,0 +1,140 @@
+import json
+import pytest
+from benchmarks.fake_llm_server import FakeLLMServer
+from cache_utils import TieredCache, TTLCache
+from execution import medical_audit
+from execution.rules_engine import CompactRulesIndex
+
+CODES = ["12001", "13121", "13122"]
+
+
+def entry(code, **fields):
+    return dict({"code": code, "documentation_status": "PASS", "clinical_evidence": "closure",
+                 "calculated_units": 1, "billing_risk_alert": "NONE", "risk_rationale": ""}, **fields)
+
+def answer(*entries):
+    return {"audit_results": list(entries), "diagnosis_analysis": "- Specific.", "documentation_improvement": "- None."}
+
+
+@pytest.fixture
+def audit_env(monkeypatch):
+    monkeypatch.setattr(medical_audit, "get_rules_db", lambda: CompactRulesIndex.from_rows([]))
+    monkeypatch.setattr(medical_audit, "audit_cache", TieredCache(TTLCache()))
+    monkeypatch.setattr(medical_audit, "audit_output_stats", medical_audit.AuditOutputStats())
+
+def scripted_llm(monkeypatch, *replies):
+    """Patch query_anthropic to return `replies` in turn; returns the prompts it was sent."""
+    prompts, replies = [], list(replies)
+
+    def fake_llm(prompt, system_prompt, tool=None):
+        prompts.append(prompt)
+        return replies.pop(0)
+
+    monkeypatch.setattr(medical_audit, "query_anthropic", fake_llm)
+    return prompts
+
+def audit(stream=False, use_cache=False):
+    fn = medical_audit.stream_audit_medical_record if stream else medical_audit.audit_medical_record
+    return fn("Layered closure of scalp and forearm lacerations.", CODES, ["S01.01XA"], pre_sanitized=True,
+              date_of_service="2024-06-01", use_cache=use_cache)
+
+def test_tool_mode_sends_schema_and_reads_tool_input(audit_env, monkeypatch):
+    monkeypatch.setattr(medical_audit, "LLM_PROVIDER", "anthropic")
+    monkeypatch.setattr(medical_audit, "ANTHROPIC_API_KEY", "fake")
+    monkeypatch.setattr(medical_audit, "llm_clients", medical_audit.LLMClientManager())
+    requests = []
+
+    def reply(request):
+        requests.append(request)
+        return json.dumps(answer(*(entry(code) for code in CODES)))
+
+    with FakeLLMServer(response=reply) as server:
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", server.url)
+        result = audit()
+    medical_audit.llm_clients.reset()
+
+    assert requests[0]["tool_choice"] == {"type": "tool", "name": "record_audit"}
+    assert requests[0]["tools"][0]["input_schema"]["required"] == ["audit_results"]
+    assert [item["code"] for item in result["audit_results"]] == CODES
+    assert medical_audit.audit_output_stats.stats()["valid_first_answer"] == 1
+
+def test_only_bad_entries_are_requested_again(audit_env, monkeypatch):
+    prompts = scripted_llm(monkeypatch,
+                           answer(entry("12001"), entry("13121", documentation_status="MAYBE")),
+                           answer(entry("13121", documentation_status="FAIL"), entry("13122", calculated_units="2")))
+    result = audit()
+
+    assert len(prompts) == 2
+    assert "- 13121: invalid documentation_status\n- 13122: missing\n" in prompts[1]
+    assert "12001:" not in prompts[1].split("REPAIR:")[1]
+    assert [(item["code"], item["documentation_status"]) for item in result["audit_results"]] == [
+        ("12001", "PASS"), ("13121", "FAIL"), ("13122", "PASS")]
+    assert result["diagnosis_analysis"] == "- Specific."
+
+    stats = medical_audit.audit_output_stats.stats()
+    assert (stats["llm_calls"], stats["repair_requests"], stats["repaired_codes"]) == (2, 1, 2)
+    assert stats["entry_problems"] == {"invalid documentation_status": 1, "missing": 1}
+
+def test_unusable_answer_is_retried_in_full(audit_env, monkeypatch):
+    prompts = scripted_llm(monkeypatch, "Sorry, {not json", answer(*(entry(code) for code in CODES)))
+    result = audit()
+
+    assert prompts[0] == prompts[1]
+    assert len(result["audit_results"]) == 3
+    assert medical_audit.audit_output_stats.stats()["failed_calls"] == {"unparseable": 1}
+
+def test_unrepaired_entries_are_kept_and_counted(audit_env, monkeypatch):
+    bad = answer(entry("12001"), entry("13121"), entry("13122", calculated_units="about two"))
+    scripted_llm(monkeypatch, bad, answer(), answer())
+    result = audit()
+
+    assert result["audit_results"][2]["calculated_units"] == "about two"
+    stats = medical_audit.audit_output_stats.stats()
+    assert (stats["llm_calls"], stats["unrepaired_codes"], stats["failed_audits"]) == (3, 1, 0)
+
+def test_incomplete_answers_are_not_cached(audit_env, monkeypatch):
+    incomplete = answer(entry("12001"), entry("13121"))  # 13122 never comes back
+    prompts = scripted_llm(monkeypatch, *[incomplete] * 6)
+    streamed = json.dumps(incomplete)
+    monkeypatch.setattr(medical_audit, "stream_anthropic", lambda prompt, system: iter([streamed]))
+
+    assert [item["code"] for item in audit(use_cache=True)["audit_results"]] == ["12001", "13121"]
+    assert len(prompts) == 3 and len(medical_audit.audit_cache.memory) == 0
+
+    # The next run of the same claim asks the model again instead of serving the gap
+    events = list(audit(stream=True, use_cache=True))
+    assert events[0] == ("start", {"codes": CODES, "cached": False})
+    assert len(prompts) == 5 and len(medical_audit.audit_cache.memory) == 0
+
+    scripted_llm(monkeypatch, answer(*(entry(code) for code in CODES)))
+    audit(use_cache=True)
+    assert len(medical_audit.audit_cache.memory) == 1
+
+def test_failed_audit_reports_the_last_error(audit_env, monkeypatch):
+    scripted_llm(monkeypatch, "", "", {"results": []})
+    assert audit() == {"error": "LLM failed after 3 attempts. Last error: Response has no audit_results list"}
+    stats = medical_audit.audit_output_stats.stats()
+    assert stats["failed_calls"] == {"empty": 2, "schema": 1} and stats["failed_audits"] == 1
+
+def test_stream_replaces_repaired_rows_instead_of_resending_them(audit_env, monkeypatch):
+    streamed = json.dumps(answer(entry("12001"), entry("13121", documentation_status="MAYBE"), entry("13122")))
+    monkeypatch.setattr(medical_audit, "stream_anthropic", lambda prompt, system: iter([streamed]))
+    scripted_llm(monkeypatch, answer(entry("13121", documentation_status="FAIL")))
+    events = list(audit(stream=True))
+
+    results = [data["code"] for name, data in events if name == "result"]
+    assert sorted(results) == sorted(set(results)) == sorted(CODES)  # no code is sent twice as a result
+    assert [(name, data["code"], data["documentation_status"]) for name, data in events if name == "replace"] == [
+        ("replace", "13121", "FAIL")]
+    assert events[-1][1]["audit_results"][1]["documentation_status"] == "FAIL"
+
+def test_stream_requests_missing_entries_after_the_stream(audit_env, monkeypatch):
+    streamed = json.dumps(answer(entry("12001"), entry("13121")))
+    monkeypatch.setattr(medical_audit, "stream_anthropic", lambda prompt, system: iter([streamed]))
+    prompts = scripted_llm(monkeypatch, answer(entry("13122")))
+    events = list(audit(stream=True))
+
+    assert len(prompts) == 1 and "- 13122: missing" in prompts[0]
+    assert [(name, data.get("code")) for name, data in events[1:-1]] == [
+        ("result", "12001"), ("result", "13121"), ("result", "13122")]
+    assert [item["code"] for item in events[-1][1]["audit_results"]] == CODES